@@ -1,27 +1,157 @@
 -- Create Athena database
 CREATE DATABASE IF NOT EXISTS iot_db;
 
--- Define external table for IoT data
+-- Define external table for IoT data (CLEAN JSON exactly as Firehose writes it)
+-- Columns match SensorOut in models_and_processor.py: `ts` is epoch seconds.
+-- Firehose writes objects under <prefix>/YYYY/MM/DD/HH/; partition projection maps
+-- those folders to year/month/day/hour, so a query that filters on them only
+-- opens the matching folders instead of every object ever written.
 CREATE EXTERNAL TABLE IF NOT EXISTS iot_db.sensors_v (
-  device_id       string,
-  ts_utc          timestamp,
-  temperature_c   double,
-  humidity_pct    double,
-  year            string,
-  month           string,
-  day             string,
-  hour            string
+  device_id           string,
+  ts                  bigint,
+  temperature_c       double,
+  temperature_avg5_c  double,
+  humidity_pct        double,
+  quality             string,
+  schema_version      string
 )
+PARTITIONED BY (year string, month string, day string, hour string)
 -- Tell Athena/Presto how to read JSON files (SerDe = serializer/deserializer)
 ROW FORMAT SERDE 'org.openx.data.jsonserde.JsonSerDe'
 
 -- Where the data files live in S3 (folder/prefix that contains your JSON/Parquet files)
 -- Replace <YOUR_BUCKET> and the prefix to match your layout.
 LOCATION 's3://<YOUR_BUCKET>/<YOUR_PREFIX>/'
+TBLPROPERTIES (
+  'projection.enabled'        = 'true',
+  'projection.year.type'      = 'integer', 'projection.year.range'  = '2024,2040', 'projection.year.digits'  = '4',
+  'projection.month.type'     = 'integer', 'projection.month.range' = '1,12',      'projection.month.digits' = '2',
+  'projection.day.type'       = 'integer', 'projection.day.range'   = '1,31',      'projection.day.digits'   = '2',
+  'projection.hour.type'      = 'integer', 'projection.hour.range'  = '0,23',      'projection.hour.digits'  = '2',
+  'storage.location.template' = 's3://<YOUR_BUCKET>/<YOUR_PREFIX>/${year}/${month}/${day}/${hour}/'
+);
 
--
--- Sample query: Get last 100 readings
-SELECT ts_utc, temperature_c, humidity_pct
+-- Sample query: Get last 100 readings (of one day - the partition filter is what keeps the scan small)
+SELECT from_unixtime(ts) AS ts_utc, temperature_c, humidity_pct
 FROM iot_db.sensors_v
+WHERE year = '2025' AND month = '11' AND day = '10'
+ORDER BY ts DESC
+LIMIT 100;
+
+-- Compacted Parquet (compact_parquet.py): <prefix>/year=YYYY/month=MM/day=DD/part-NNNNN.parquet
+-- Files are sorted by (device_id, ts) with row-group min/max statistics, so
+-- Athena reads only the queried days, the queried columns and the row groups
+-- that can match a device_id / ts filter. See bench_athena_layout.py for numbers.
+CREATE EXTERNAL TABLE IF NOT EXISTS iot_db.sensors_parquet (
+  device_id           string,
+  ts                  bigint,
+  temperature_c       double,
+  temperature_avg5_c  double,
+  humidity_pct        double,
+  quality             string,
+  schema_version      string
+)
+PARTITIONED BY (year string, month string, day string)
+STORED AS PARQUET
+LOCATION 's3://<YOUR_BUCKET>/<YOUR_PARQUET_PREFIX>/'
+TBLPROPERTIES (
+  'projection.enabled'        = 'true',
+  'projection.year.type'      = 'integer', 'projection.year.range'  = '2024,2040', 'projection.year.digits'  = '4',
+  'projection.month.type'     = 'integer', 'projection.month.range' = '1,12',      'projection.month.digits' = '2',
+  'projection.day.type'       = 'integer', 'projection.day.range'   = '1,31',      'projection.day.digits'   = '2',
+  'storage.location.template' = 's3://<YOUR_BUCKET>/<YOUR_PARQUET_PREFIX>/year=${year}/month=${month}/day=${day}/'
+);
+
+-- Sample query on Parquet: hourly average for one device on one day
+SELECT ts / 3600 * 3600 AS hour_start, avg(temperature_c) AS avg_temperature_c, count(*) AS n
+FROM iot_db.sensors_parquet
+WHERE year = '2025' AND month = '11' AND day = '10' AND device_id = 'rpi-sensor-001'
+GROUP BY ts / 3600 * 3600
+ORDER BY hour_start;
+
+-- Batched CLEAN payloads (batch_publisher.py, CLEAN_BATCH_MAX_COUNT > 0)
+-- Each Firehose record is one JSON object holding an array of readings:
+--   {"readings": [{...}, {...}], "count": 2, "schema_version": "1.0"}
+-- Point the batched topic's IoT rule / Firehose at its own prefix; it uses the
+-- same YYYY/MM/DD/HH/ folders, projected like sensors_v.
+CREATE EXTERNAL TABLE IF NOT EXISTS iot_db.sensors_clean_batched (
+  readings        array<struct<device_id:string,
+                               ts:bigint,
+                               temperature_c:double,
+                               temperature_avg5_c:double,
+                               humidity_pct:double,
+                               quality:string,
+                               schema_version:string>>,
+  `count`         int,
+  schema_version  string
+)
+PARTITIONED BY (year string, month string, day string, hour string)
+ROW FORMAT SERDE 'org.openx.data.jsonserde.JsonSerDe'
+LOCATION 's3://<YOUR_BUCKET>/<YOUR_BATCHED_PREFIX>/'
+TBLPROPERTIES (
+  'projection.enabled'        = 'true',
+  'projection.year.type'      = 'integer', 'projection.year.range'  = '2024,2040', 'projection.year.digits'  = '4',
+  'projection.month.type'     = 'integer', 'projection.month.range' = '1,12',      'projection.month.digits' = '2',
+  'projection.day.type'       = 'integer', 'projection.day.range'   = '1,31',      'projection.day.digits'   = '2',
+  'projection.hour.type'      = 'integer', 'projection.hour.range'  = '0,23',      'projection.hour.digits'  = '2',
+  'storage.location.template' = 's3://<YOUR_BUCKET>/<YOUR_BATCHED_PREFIX>/${year}/${month}/${day}/${hour}/'
+);
+
+-- Flatten the batches back to one row per reading (same columns as a single CLEAN message);
+-- the partition columns are kept so filters on them still prune folders through the view
+CREATE OR REPLACE VIEW iot_db.sensors_clean_readings AS
+SELECT r.device_id,
+       from_unixtime(r.ts) AS ts_utc,
+       r.temperature_c,
+       r.temperature_avg5_c,
+       r.humidity_pct,
+       r.quality,
+       r.schema_version,
+       year, month, day, hour
+FROM iot_db.sensors_clean_batched
+CROSS JOIN UNNEST(readings) AS t(r);
+
+-- Sample query on batched data: last 100 readings (of one day)
+SELECT ts_utc, temperature_c, humidity_pct
+FROM iot_db.sensors_clean_readings
+WHERE year = '2025' AND month = '11' AND day = '10'
 ORDER BY ts_utc DESC
 LIMIT 100;
+
+-- Edge rollups (rollup.py, ROLLUP_TOPIC in edge_processor_clean.py): one row per
+-- device per closed window. Point the rollup topic's IoT rule / Firehose at its own prefix.
+CREATE EXTERNAL TABLE IF NOT EXISTS iot_db.sensors_rollup (
+  device_id           string,
+  window_start        bigint,
+  window_sec          int,
+  `count`             int,
+  temperature_c_min   double,
+  temperature_c_max   double,
+  temperature_c_mean  double,
+  humidity_pct_min    double,
+  humidity_pct_max    double,
+  humidity_pct_mean   double,
+  schema_version      string
+)
+PARTITIONED BY (year string, month string, day string, hour string)
+ROW FORMAT SERDE 'org.openx.data.jsonserde.JsonSerDe'
+LOCATION 's3://<YOUR_BUCKET>/<YOUR_ROLLUP_PREFIX>/'
+TBLPROPERTIES (
+  'projection.enabled'        = 'true',
+  'projection.year.type'      = 'integer', 'projection.year.range'  = '2024,2040', 'projection.year.digits'  = '4',
+  'projection.month.type'     = 'integer', 'projection.month.range' = '1,12',      'projection.month.digits' = '2',
+  'projection.day.type'       = 'integer', 'projection.day.range'   = '1,31',      'projection.day.digits'   = '2',
+  'projection.hour.type'      = 'integer', 'projection.hour.range'  = '0,23',      'projection.hour.digits'  = '2',
+  'storage.location.template' = 's3://<YOUR_BUCKET>/<YOUR_ROLLUP_PREFIX>/${year}/${month}/${day}/${hour}/'
+);
+
+-- Sample query on rollups: daily temperature range per device for November, from hourly summaries
+SELECT device_id,
+       date(from_unixtime(window_start)) AS day_utc,
+       min(temperature_c_min) AS temperature_c_min,
+       max(temperature_c_max) AS temperature_c_max,
+       sum(temperature_c_mean * `count`) / sum(`count`) AS temperature_c_mean
+FROM iot_db.sensors_rollup
+WHERE year = '2025' AND month = '11' AND window_sec = 3600
+GROUP BY device_id, date(from_unixtime(window_start))
+ORDER BY device_id, day_utc;
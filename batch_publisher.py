@@ -0,0 +1,187 @@
+"""
+batch_publisher.py
+------------------
+Optional batching layer for MQTT publishes.
+
+Every `conn.publish` is one billed AWS IoT Core message and, after the IoT
+rule, one Firehose record. `BatchingPublisher` collects individual JSON
+readings and sends them as ONE payload:
+
+    {"readings": [{...}, {...}, ...], "count": 2, "schema_version": "1.0"}
+
+A batch is flushed when any limit is reached:
+    max_count   number of readings
+    max_bytes   payload size (kept under the 128 KB IoT Core message limit)
+    linger_sec  age of the oldest reading in the batch
+
+Consumers call `unpack_readings(doc)` (or `split_batch(payload)` for raw
+bytes) and get a list of plain readings for both batched and single-reading
+payloads, so old and new publishers can share a topic.
+
+With `pack=pack_wire_batch`, readings in the compact binary format (wire.py)
+are sent as one binary batch instead; `split_batch` handles both.
+"""
+
+import json
+import threading
+import time
+from typing import Any, Callable, Dict, List, Optional
+
+import wire
+
+IOT_CORE_MAX_BYTES = 128 * 1024          # AWS IoT Core hard limit per MQTT message
+BATCH_SCHEMA_VERSION = "1.0"
+
+_HEAD = b'{"readings": ['
+_TAIL = b'], "count": %d, "schema_version": "' + BATCH_SCHEMA_VERSION.encode() + b'"}'
+_OVERHEAD = len(_HEAD) + len(_TAIL) + 20  # envelope + room for the count digits
+
+
+def is_batch(payload: bytes) -> bool:
+    """Cheap check (no JSON parsing) for a payload written by BatchingPublisher."""
+    return payload[:len(_HEAD)] == _HEAD
+
+
+def unpack_readings(doc: Any) -> List[Dict[str, Any]]:
+    """Readings inside a parsed payload: the "readings" list of a batch, or [doc] for a single reading."""
+    if isinstance(doc, dict):
+        readings = doc.get("readings")
+        if isinstance(readings, list):
+            return [r for r in readings if isinstance(r, dict)]
+        return [doc]
+    return []
+
+
+def split_batch(payload: bytes) -> List[bytes]:
+    """Raw bytes of every reading in `payload` (a batch is re-encoded per reading; anything else is returned as-is)."""
+    if not is_batch(payload):
+        if wire.is_binary(payload):
+            try:
+                return wire.split(payload)          # binary batch -> single binary readings
+            except wire.DECODE_ERRORS:
+                pass                                # let the processor reject it
+        return [payload]
+    return [json.dumps(r).encode("utf-8") for r in unpack_readings(json.loads(payload))]
+
+
+def pack_json_batch(items: List[bytes]) -> bytes:
+    """The JSON envelope around already-encoded JSON readings."""
+    return _HEAD + b", ".join(items) + _TAIL % len(items)
+
+
+def pack_wire_batch(items: List[bytes]) -> bytes:
+    """
+    A binary batch when every item is a binary reading of one kind, otherwise the
+    JSON envelope (binary items converted to JSON), so JSON fallbacks still go out.
+    """
+    packed = wire.pack_batch(items)
+    if packed is not None:
+        return packed
+    return pack_json_batch([wire.to_json(it) if wire.is_binary(it) else it for it in items])
+
+
+class BatchingPublisher:
+    """
+    Coalesce readings into batch payloads.
+
+    Args:
+        publish:    called with each batch payload (bytes), e.g.
+                    lambda p: conn.publish(topic=CLEAN_TOPIC, payload=p, qos=QOS_LEVEL)
+        max_count:  flush after this many readings.
+        max_bytes:  flush before the payload would exceed this size (<= 128 KB).
+        linger_sec: flush when the oldest reading has waited this long (needs start()).
+        pack:       builds a batch payload from the queued readings (default: JSON
+                    envelope; pack_wire_batch for binary readings).
+
+    `add()` is thread-safe. A single reading larger than `max_bytes` is sent
+    on its own, unwrapped. A packed batch that still comes out larger than
+    `max_bytes` (binary readings that fell back to JSON) is split in halves.
+    """
+
+    def __init__(self, publish: Callable[[bytes], Any], max_count: int = 100,
+                 max_bytes: int = 120_000, linger_sec: float = 1.0,
+                 pack: Callable[[List[bytes]], bytes] = pack_json_batch):
+        if max_bytes > IOT_CORE_MAX_BYTES:
+            raise ValueError(f"max_bytes must be <= {IOT_CORE_MAX_BYTES} (AWS IoT Core message limit)")
+        self.publish = publish
+        self.max_count = max_count
+        self.max_bytes = max_bytes
+        self.linger_sec = linger_sec
+        self.pack = pack
+        self._items: List[bytes] = []
+        self._size = _OVERHEAD
+        self._oldest = 0.0
+        self._cond = threading.Condition()
+        self._thread: Optional[threading.Thread] = None
+        self._running = False
+        self.batches_sent = 0
+        self.readings_sent = 0
+
+    def add(self, reading: bytes) -> None:
+        """Queue one encoded reading; may publish a full batch right away."""
+        if len(reading) + _OVERHEAD > self.max_bytes:
+            self._send([reading], wrap=False)
+            return
+        with self._cond:
+            if self._items and self._size + len(reading) + 2 > self.max_bytes:
+                self._flush_locked()
+            if not self._items:
+                self._oldest = time.monotonic()
+                self._cond.notify()                 # wake the linger thread for the new batch
+            self._items.append(reading)
+            self._size += len(reading) + 2          # + ", " separator
+            if len(self._items) >= self.max_count:
+                self._flush_locked()
+
+    def flush(self) -> None:
+        """Publish whatever is queued now."""
+        with self._cond:
+            self._flush_locked()
+
+    def _flush_locked(self) -> None:
+        if not self._items:
+            return
+        items, self._items, self._size = self._items, [], _OVERHEAD
+        self._send(items, wrap=True)
+
+    def _send(self, items: List[bytes], wrap: bool) -> None:
+        payload = self.pack(items) if wrap else items[0]
+        if wrap and len(payload) > self.max_bytes:
+            if len(items) > 1:
+                half = len(items) // 2
+                self._send(items[:half], wrap=True)
+                self._send(items[half:], wrap=True)
+                return
+            payload = items[0]                      # a lone reading goes out unwrapped, as in add()
+        self.publish(payload)
+        self.batches_sent += 1
+        self.readings_sent += len(items)
+
+    # ---- linger timer ------------------------------------------------------------
+    def start(self) -> "BatchingPublisher":
+        self._running = True
+        self._thread = threading.Thread(target=self._linger_loop, name="batch-linger", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        """Flush the last partial batch and stop the linger thread."""
+        with self._cond:
+            self._running = False
+            self._cond.notify()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.flush()
+
+    def _linger_loop(self) -> None:
+        with self._cond:
+            while self._running:
+                if not self._items:
+                    self._cond.wait()
+                    continue
+                wait = self._oldest + self.linger_sec - time.monotonic()
+                if wait > 0:
+                    self._cond.wait(wait)
+                else:
+                    self._flush_locked()
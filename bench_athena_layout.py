@@ -0,0 +1,182 @@
+"""
+bench_athena_layout.py
+----------------------
+Bytes scanned and query time: Firehose JSON vs compacted Parquet,
+with DuckDB standing in for Athena.
+
+Three layouts are compared on the same data:
+
+  json        the original iot_db.sensors_v table: no partitions, every
+              query reads every JSON object
+  json+proj   the same JSON with partition projection on the Firehose
+              YYYY/MM/DD/HH prefix (only the queried days are read)
+  parquet     compact_parquet.py output: day partitions, sorted by
+              (device_id, ts), columnar
+
+"Bytes scanned" is what Athena would bill: for JSON the full size of every
+object it has to open; for Parquet the compressed column chunks of the
+queried columns, in the row groups whose min/max statistics cannot rule
+out the filter. Query time is DuckDB on the local files (best of --repeat).
+
+Run:
+    python bench_athena_layout.py [--devices 10] [--days 3] [--period 10] [--workdir ./bench_athena]
+"""
+
+import argparse
+import json
+import os
+import random
+import shutil
+import time
+from typing import Callable, Dict, List, Optional, Sequence, Tuple
+
+import duckdb
+import pyarrow.parquet as pq
+
+from compact_parquet import SCHEMA, compact, iter_files
+from models_and_processor import WindowStore, process_bytes
+
+
+# =============================================================================
+# 1) Synthetic Firehose data (real CLEAN payloads from process_bytes)
+# =============================================================================
+def write_firehose(root: str, devices: int, days: int, period: int, t0: int = 1762732800) -> int:
+    """One NDJSON object per hour under root/YYYY/MM/DD/HH/, like Firehose. Returns the row count."""
+    store = WindowStore()
+    rnd = random.Random(7)
+    rows = 0
+    for hour in range(days * 24):
+        start = t0 + hour * 3600
+        t = time.gmtime(start)
+        d = os.path.join(root, f"{t.tm_year:04d}", f"{t.tm_mon:02d}", f"{t.tm_mday:02d}", f"{t.tm_hour:02d}")
+        os.makedirs(d, exist_ok=True)
+        with open(os.path.join(d, f"sensors-clean-{start}.json"), "wb") as f:
+            for ts in range(start, start + 3600, period):
+                for dev in range(devices):
+                    raw = json.dumps({"device_id": f"rpi-sensor-{dev:03d}", "ts": ts,
+                                      "temperature": round(22 + dev * 0.3 + rnd.gauss(0, 1.5), 1),
+                                      "humidity": round(35 + rnd.gauss(0, 5), 1)}).encode("utf-8")
+                    ok, clean = process_bytes(raw, store)
+                    f.write(clean + b"\n")
+                    rows += 1
+    return rows
+
+
+# =============================================================================
+# 2) Athena-style bytes-scanned estimates
+# =============================================================================
+def json_bytes(root: str, day: Optional[Tuple[str, str, str]] = None) -> int:
+    """Size of every JSON object Athena has to open (only `day`'s prefix when projection prunes)."""
+    if day is not None:
+        root = os.path.join(root, *day)
+    return sum(os.path.getsize(p) for p in iter_files(root))
+
+
+def parquet_bytes(root: str, columns: Sequence[str], day: Optional[Tuple[str, str, str]] = None,
+                  ranges: Optional[Dict[str, Tuple]] = None) -> int:
+    """Compressed bytes of `columns` in the row groups that survive partition + min/max pruning."""
+    if day is not None:
+        root = os.path.join(root, f"year={day[0]}", f"month={day[1]}", f"day={day[2]}")
+    total = 0
+    for path in iter_files(root):
+        if not path.endswith(".parquet"):
+            continue
+        md = pq.ParquetFile(path).metadata
+        names = [md.schema.column(i).name for i in range(md.num_columns)]
+        for g in range(md.num_row_groups):
+            rg = md.row_group(g)
+            skip = False
+            for col, (lo, hi) in (ranges or {}).items():
+                st = rg.column(names.index(col)).statistics
+                if st is not None and st.has_min_max and (st.max < lo or st.min > hi):
+                    skip = True
+                    break
+            if not skip:
+                total += sum(rg.column(names.index(c)).total_compressed_size for c in columns)
+    return total
+
+
+# =============================================================================
+# 3) Queries
+# =============================================================================
+def best_of(fn: Callable[[], object], repeat: int) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--devices", type=int, default=10)
+    ap.add_argument("--days", type=int, default=3)
+    ap.add_argument("--period", type=int, default=10, help="seconds between readings per device")
+    ap.add_argument("--workdir", default="./bench_athena")
+    ap.add_argument("--repeat", type=int, default=3)
+    args = ap.parse_args()
+
+    src = os.path.join(args.workdir, "firehose")
+    out = os.path.join(args.workdir, "parquet")
+    shutil.rmtree(args.workdir, ignore_errors=True)
+    rows = write_firehose(src, args.devices, args.days, args.period)
+    c = compact(src, out)
+    total_pq = parquet_bytes(out, SCHEMA.names)
+    print(f"rows={rows}  json={json_bytes(src) / 1e6:.1f} MB  parquet={total_pq / 1e6:.1f} MB  files={len(c.files)}")
+
+    y = sorted(os.listdir(src))[-1]                              # query the last day of data
+    m = sorted(os.listdir(os.path.join(src, y)))[-1]
+    d = sorted(os.listdir(os.path.join(src, y, m)))[-1]
+    day = (y, m, d)
+    device = "rpi-sensor-003"
+
+    con = duckdb.connect()
+    json_cols = ("{'device_id':'VARCHAR','ts':'BIGINT','temperature_c':'DOUBLE','temperature_avg5_c':'DOUBLE',"
+                 "'humidity_pct':'DOUBLE','quality':'VARCHAR','schema_version':'VARCHAR'}")
+
+    def json_src(glob: str) -> str:
+        return f"read_json('{glob}', format='newline_delimited', columns={json_cols})"
+
+    all_json = json_src(os.path.join(src, "*", "*", "*", "*", "*.json"))
+    day_json = json_src(os.path.join(src, *day, "*", "*.json"))
+    pq_src = f"read_parquet('{os.path.join(out, '**', '*.parquet')}', hive_partitioning=true, hive_types_autocast=false)"
+    day_where = f"year='{day[0]}' AND month='{day[1]}' AND day='{day[2]}'"
+
+    queries = [
+        # (name, {layout: sql}, parquet columns, day-pruned?, parquet min/max ranges)
+        ("latest 100 readings of one day",
+         {"json": f"SELECT ts, temperature_c, humidity_pct FROM {all_json} WHERE strftime(to_timestamp(ts), '%Y/%m/%d') = '{'/'.join(day)}' ORDER BY ts DESC LIMIT 100",
+          "json+proj": f"SELECT ts, temperature_c, humidity_pct FROM {day_json} ORDER BY ts DESC LIMIT 100",
+          "parquet": f"SELECT ts, temperature_c, humidity_pct FROM {pq_src} WHERE {day_where} ORDER BY ts DESC LIMIT 100"},
+         ["ts", "temperature_c", "humidity_pct"], True, None),
+        ("hourly avg, one device, one day",
+         {"json": f"SELECT ts // 3600 h, avg(temperature_c) FROM {all_json} WHERE device_id = '{device}' AND strftime(to_timestamp(ts), '%Y/%m/%d') = '{'/'.join(day)}' GROUP BY h",
+          "json+proj": f"SELECT ts // 3600 h, avg(temperature_c) FROM {day_json} WHERE device_id = '{device}' GROUP BY h",
+          "parquet": f"SELECT ts // 3600 h, avg(temperature_c) FROM {pq_src} WHERE {day_where} AND device_id = '{device}' GROUP BY h"},
+         ["device_id", "ts", "temperature_c"], True, {"device_id": (device, device)}),
+        ("per-device count + avg humidity, all history",
+         {"json": f"SELECT device_id, count(*), avg(humidity_pct) FROM {all_json} GROUP BY device_id",
+          "json+proj": f"SELECT device_id, count(*), avg(humidity_pct) FROM {all_json} GROUP BY device_id",
+          "parquet": f"SELECT device_id, count(*), avg(humidity_pct) FROM {pq_src} GROUP BY device_id"},
+         ["device_id", "humidity_pct"], False, None),
+    ]
+
+    for name, sqls, columns, by_day, ranges in queries:
+        print(f"\n{name}")
+        results: List[object] = []
+        for layout, sql in sqls.items():
+            if layout == "json":
+                scanned = json_bytes(src)
+            elif layout == "json+proj":
+                scanned = json_bytes(src, day if by_day else None)
+            else:
+                scanned = parquet_bytes(out, columns, day if by_day else None, ranges)
+            secs = best_of(lambda: con.execute(sql).fetchall(), args.repeat)
+            results.append(sorted(con.execute(sql).fetchall()))
+            print(f"  {layout:<10} scanned={scanned / 1e6:8.2f} MB  time={secs * 1e3:8.1f} ms")
+        assert all(r == results[0] for r in results), f"{name}: layouts disagree"
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,82 @@
+"""
+bench_serialize.py
+------------------
+Per-message cost of the RAW -> CLEAN hot path in `edge_processor_clean.on_msg`.
+
+Compares:
+  before: process(payload.decode()) -> model_dump() -> json.dumps() -> .encode()
+          (the .encode() is what the MQTT SDK does to a str payload)
+  after:  process_bytes(payload) -> bytes, ready for conn.publish
+
+Both paths are checked to produce byte-identical CLEAN payloads first.
+
+Run:
+    python bench_serialize.py [--messages 200000] [--devices 50]
+"""
+
+import argparse
+import json
+import random
+import time
+
+from models_and_processor import WindowStore, process, process_bytes
+
+
+def make_payloads(n: int, devices: int, seed: int = 7) -> list:
+    """Valid RAW payloads as the publisher sends them (json.dumps -> UTF-8 bytes)."""
+    rnd = random.Random(seed)
+    t0 = 1762817460
+    return [
+        json.dumps({
+            "device_id": f"rpi-sensor-{i % devices:03d}",
+            "ts": t0 + i // devices,
+            "temperature": round(rnd.uniform(18, 32), 1),
+            "humidity": round(rnd.uniform(5, 60), 1),
+        }).encode("utf-8")
+        for i in range(n)
+    ]
+
+
+def before(payload: bytes, store: WindowStore) -> bytes:
+    ok, res = process(payload.decode("utf-8"), store)
+    return json.dumps(res.model_dump()).encode("utf-8")
+
+
+def after(payload: bytes, store: WindowStore) -> bytes:
+    ok, res = process_bytes(payload, store)
+    return res
+
+
+def run(fn, payloads: list) -> float:
+    """Seconds per message for `fn` over all payloads (fresh window store)."""
+    store = WindowStore()
+    start = time.perf_counter()
+    for p in payloads:
+        fn(p, store)
+    return (time.perf_counter() - start) / len(payloads)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--messages", type=int, default=200_000)
+    ap.add_argument("--devices", type=int, default=50)
+    ap.add_argument("--repeat", type=int, default=3, help="best of N runs")
+    args = ap.parse_args()
+
+    payloads = make_payloads(args.messages, args.devices)
+
+    # Correctness first: both paths must publish the exact same bytes.
+    s1, s2 = WindowStore(), WindowStore()
+    for p in payloads[:20_000]:
+        assert before(p, s1) == after(p, s2), p
+
+    t_before = min(run(before, payloads) for _ in range(args.repeat))
+    t_after = min(run(after, payloads) for _ in range(args.repeat))
+    print(f"messages: {args.messages}  devices: {args.devices}")
+    print(f"before (model_dump + json.dumps + encode): {t_before * 1e6:7.2f} µs/msg")
+    print(f"after  (process_bytes):                    {t_after * 1e6:7.2f} µs/msg")
+    print(f"speed-up: {t_before / t_after:.1f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+"""
+bench_suite.py
+--------------
+Benchmark suite for the edge hot path, with stored baselines and a
+regression check.
+
+Benchmarks (all on the same synthetic load from loadgen.py - valid,
+out-of-range, malformed, QoS1 duplicates and out-of-order readings):
+
+    process         models_and_processor.process(payload_str)        (the Pydantic path)
+    process_bytes   models_and_processor.process_bytes(payload)      (the fast path)
+    on_msg          edge_processor_clean.on_msg(...) end to end: dedup, process_bytes and
+                    the flow-controlled publish (mqtt_client.MqttClient) on an in-memory
+                    connection (transport.InMemoryConnection),
+                    with the configured METRICS_MODE and sampled logging (to a NullHandler)
+    publish_staged  one sensor reading end to end the staged way: the Pi's ReadingPipeline
+                    publishes RAW, the broker (in memory) hands it to on_msg, which cleans
+                    and publishes CLEAN
+    publish_fused   the same reading with ReadingPipeline(fused=True): cleaned on the Pi
+                    and published straight to the CLEAN topic
+                    (both take the reading as a dict, parsed up front; malformed payloads,
+                    which a sensor never produces, are skipped)
+
+For each: throughput (messages/s, from an untimed loop) and p50/p99 latency
+per message (from a second loop timing each call; includes ~0.1 µs of timer
+overhead). Each run starts from a fresh WindowStore / DedupIndex.
+
+Run:
+    python bench_suite.py                                   # print results
+    python bench_suite.py --save bench_baseline.json        # store a baseline
+    python bench_suite.py --check bench_baseline.json       # exit 1 if throughput dropped > --threshold
+"""
+
+import argparse
+import contextlib
+import json
+import logging
+import os
+import platform
+import sys
+import time
+from typing import Callable, Dict, List
+
+import numpy as np
+import pydantic
+
+import edge_processor_clean
+import models_and_processor
+import publisher_dht11_to_aws_iot
+from dedup import DedupIndex
+from loadgen import generate
+from metrics import Metrics
+from models_and_processor import WindowStore, process, process_bytes
+from mqtt_client import MqttClient
+from transport import InMemoryBus, InMemoryConnection
+
+BASELINE_VERSION = 1
+
+_readings: Dict[bytes, dict] = {}     # payload -> reading dict as the sensor loop builds it (filled by run())
+
+
+def _measure(make_fn: Callable[[], Callable[[bytes], object]], payloads: List[bytes]) -> Dict[str, float]:
+    """Throughput and per-call latency percentiles of fn(payload) over `payloads`."""
+    fn = make_fn()
+    for p in payloads[:2000]:                    # warm up caches / first-call costs
+        fn(p)
+
+    fn = make_fn()
+    start = time.perf_counter()
+    for p in payloads:
+        fn(p)
+    elapsed = time.perf_counter() - start
+
+    fn = make_fn()
+    lat = np.empty(len(payloads), dtype=np.int64)
+    clock = time.perf_counter_ns
+    for i, p in enumerate(payloads):
+        t = clock()
+        fn(p)
+        lat[i] = clock() - t
+    p50, p99 = np.percentile(lat, (50, 99)) / 1e3
+    return {"messages": len(payloads), "ops_per_sec": len(payloads) / elapsed,
+            "p50_us": float(p50), "p99_us": float(p99)}
+
+
+# =============================================================================
+# Benchmarks: each returns a factory of a fresh fn(payload)
+# =============================================================================
+def bench_process():
+    store = WindowStore()
+    return lambda p: process(p.decode("utf-8", "replace"), store)
+
+
+def bench_process_bytes():
+    store = WindowStore()
+    return lambda p: process_bytes(p, store)
+
+
+def bench_on_msg():
+    E = edge_processor_clean
+    conn = InMemoryConnection()
+    conn.bus.record = False
+    E.client = MqttClient(conn, max_in_flight=E.PUBLISH_MAX_IN_FLIGHT, max_queued=E.PUBLISH_MAX_QUEUED,
+                          target_ack_sec=E.PUBLISH_TARGET_ACK_SEC)
+    E.client.connect()
+    E.pipeline = None
+    E.batcher = None
+    E.rollup = None
+    E.dedup = DedupIndex(window_sec=E.DEDUP_WINDOW_SEC, per_device=E.DEDUP_PER_DEVICE, ttl_sec=E.DEDUP_TTL_SEC)
+    if E.metrics is not None:
+        E.metrics = Metrics(mode=E.metrics.mode, sample_every=E.metrics.sample_every)
+    log = logging.getLogger("edge")               # sampled event lines are formatted, then discarded
+    if not log.handlers:
+        log.addHandler(logging.NullHandler())
+        log.propagate = False
+    models_and_processor._store.restore({})       # handle() uses the module-wide store: start it empty
+    topic = E.RAW_TOPIC
+    return lambda p: E.on_msg(topic, p, False, 1, False)
+
+
+def _sensor_publish(pipe: "publisher_dht11_to_aws_iot.ReadingPipeline") -> Callable[[bytes], object]:
+    def fn(p):
+        msg = _readings.get(p)
+        if msg is not None:
+            pipe.handle(dict(msg))
+    return fn
+
+
+def _pi_transport(bus: InMemoryBus) -> MqttClient:
+    client = MqttClient(InMemoryConnection(bus), max_in_flight=publisher_dht11_to_aws_iot.PUBLISH_MAX_IN_FLIGHT,
+                        target_ack_sec=publisher_dht11_to_aws_iot.PUBLISH_TARGET_ACK_SEC)
+    client.connect()
+    return client
+
+
+def bench_publish_staged():
+    E = edge_processor_clean
+    on_msg = bench_on_msg()
+    bus = InMemoryBus(record=False)
+    bus.subscribe(E.RAW_TOPIC, lambda topic, payload, *_: on_msg(payload))
+    pipe = publisher_dht11_to_aws_iot.ReadingPipeline(_pi_transport(bus), E.RAW_TOPIC)
+    return _sensor_publish(pipe)
+
+
+def bench_publish_fused():
+    E = edge_processor_clean
+    pipe = publisher_dht11_to_aws_iot.ReadingPipeline(_pi_transport(InMemoryBus(record=False)), E.RAW_TOPIC,
+                                                      clean_topic=E.CLEAN_TOPIC, fused=True, publish_raw=False)
+    return _sensor_publish(pipe)
+
+
+BENCHMARKS = {
+    "process": bench_process,
+    "process_bytes": bench_process_bytes,
+    "on_msg": bench_on_msg,
+    "publish_staged": bench_publish_staged,
+    "publish_fused": bench_publish_fused,
+}
+
+
+def _as_reading(payload: bytes):
+    """The reading dict behind a generated payload, or None if the sensor loop could not have built it."""
+    try:
+        msg = json.loads(payload)
+    except ValueError:
+        return None
+    return msg if isinstance(msg, dict) and "device_id" in msg and "ts" in msg else None
+
+
+def run(messages: int, devices: int, seed: int) -> Dict[str, object]:
+    payloads = [p for _kind, p in generate(messages, devices, seed=seed)]
+    _readings.clear()
+    _readings.update((p, r) for p in payloads if (r := _as_reading(p)) is not None)
+    results = {}
+    with open(os.devnull, "w") as null, contextlib.redirect_stdout(null):
+        for name, make in BENCHMARKS.items():
+            results[name] = _measure(make, payloads)
+    return {
+        "version": BASELINE_VERSION,
+        "meta": {"python": platform.python_version(), "pydantic": pydantic.VERSION,
+                 "numpy": np.__version__, "machine": platform.machine(), "platform": platform.platform(),
+                 "cpus": os.cpu_count(), "messages": messages, "devices": devices, "seed": seed},
+        "results": results,
+    }
+
+
+def check(current: Dict[str, object], baseline: Dict[str, object], threshold: float) -> List[str]:
+    """Names of benchmarks whose throughput fell more than `threshold` (fraction) below the baseline."""
+    failed = []
+    for name, base in baseline["results"].items():
+        cur = current["results"].get(name)
+        if cur is None:
+            continue
+        change = cur["ops_per_sec"] / base["ops_per_sec"] - 1
+        status = "REGRESSION" if change < -threshold else "ok"
+        print(f"  {name:<14} baseline={base['ops_per_sec']:>10,.0f}/s  now={cur['ops_per_sec']:>10,.0f}/s  "
+              f"{change:+6.1%}  {status}")
+        if status != "ok":
+            failed.append(name)
+    return failed
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--messages", type=int, default=50_000)
+    ap.add_argument("--devices", type=int, default=50)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--save", metavar="PATH", help="write the results as a baseline JSON file")
+    ap.add_argument("--check", metavar="PATH", help="compare against a baseline JSON file")
+    ap.add_argument("--threshold", type=float, default=0.20, help="allowed throughput drop (fraction), default 0.20")
+    args = ap.parse_args()
+
+    current = run(args.messages, args.devices, args.seed)
+    for name, r in current["results"].items():
+        print(f"{name:<14} {r['ops_per_sec']:>10,.0f} msg/s   p50={r['p50_us']:7.2f} µs   p99={r['p99_us']:7.2f} µs")
+
+    if args.save:
+        tmp = args.save + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(current, f, indent=2)
+        os.replace(tmp, args.save)
+        print("baseline written to", args.save)
+
+    if args.check:
+        with open(args.check, encoding="utf-8") as f:
+            baseline = json.load(f)
+        print(f"\nregression check vs {args.check} (threshold {args.threshold:.0%}):")
+        failed = check(current, baseline, args.threshold)
+        if failed:
+            print("FAILED:", ", ".join(failed))
+            sys.exit(1)
+        print("OK")
+
+
+if __name__ == "__main__":
+    main()
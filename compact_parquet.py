@@ -0,0 +1,235 @@
+"""
+compact_parquet.py
+------------------
+Compact Firehose CLEAN JSON into hive-partitioned Parquet for Athena.
+
+Firehose delivers many small newline-delimited JSON objects under
+<prefix>/YYYY/MM/DD/HH/. Queried as JSON, every query reads every byte of
+every object. This tool streams those files (plain or .gz, single readings
+or batch envelopes from batch_publisher.py) and writes:
+
+    <out>/year=YYYY/month=MM/day=DD/part-00000.parquet
+
+- partitioned by the UTC day of `ts` (matches the partition projection in
+  AmazonAthena.sql, so Athena only opens the days a query asks for),
+- each file sorted by (device_id, ts), in row groups with min/max
+  statistics, so a device or time-range filter skips whole row groups,
+- columnar, so a query only reads the columns it uses.
+
+Memory is bounded: rows are buffered per partition and the biggest buffer is
+written out whenever `max_buffered_rows` is reached (one more part file).
+
+Run:
+    python compact_parquet.py <firehose_dir> <out_dir> [--rows-per-file 1000000] [--row-group-size 131072]
+Then upload <out_dir> to s3://<YOUR_BUCKET>/<YOUR_PARQUET_PREFIX>/.
+"""
+
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+import zlib
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple
+
+import pyarrow as pa
+import pyarrow.parquet as pq
+
+from batch_publisher import unpack_readings
+
+# Column order and types = SensorOut (models_and_processor.py)
+SCHEMA = pa.schema([
+    ("device_id", pa.string()),
+    ("ts", pa.int64()),
+    ("temperature_c", pa.float64()),
+    ("temperature_avg5_c", pa.float64()),
+    ("humidity_pct", pa.float64()),
+    ("quality", pa.string()),
+    ("schema_version", pa.string()),
+])
+_NAMES = SCHEMA.names
+MAX_TS = 253402300800                   # 10000-01-01T00:00:00Z: beyond this gmtime() fails / no 4-digit year partition
+_SORT = [("device_id", "ascending"), ("ts", "ascending")]
+
+
+# =============================================================================
+# 1) Reading Firehose objects
+# =============================================================================
+def iter_files(root: str) -> Iterator[str]:
+    """Every regular file under `root`, in a stable (sorted) order."""
+    for dirpath, dirnames, filenames in os.walk(root):
+        dirnames.sort()
+        for name in sorted(filenames):
+            if not name.startswith("."):
+                yield os.path.join(dirpath, name)
+
+
+def iter_documents(path: str, on_error: Optional[Callable[[str, int, Exception], None]] = None) -> Iterator[Any]:
+    """
+    JSON documents in one Firehose object.
+
+    Newline-delimited is the normal case; a line holding several objects
+    back to back (Firehose without a newline delimiter) is split as well.
+
+    A line that is not valid UTF-8 / JSON (a truncated or damaged record) is
+    skipped from the first bad document on, and a truncated .gz object stops
+    at the damage; everything before it is still yielded. Each is reported
+    to `on_error(path, line_no, exc)` (line_no 0 = the object as a whole).
+    """
+    opener = gzip.open if path.endswith(".gz") else open
+    decoder = json.JSONDecoder()
+    line_no = 0
+    try:
+        with opener(path, "rb") as f:
+            for line_no, raw in enumerate(f, 1):
+                try:
+                    line = raw.decode("utf-8").strip()
+                    pos = 0
+                    while pos < len(line):
+                        doc, end = decoder.raw_decode(line, pos)
+                        yield doc
+                        pos = end
+                        while pos < len(line) and line[pos] in " \t,":
+                            pos += 1
+                except ValueError as e:             # JSONDecodeError, UnicodeDecodeError
+                    if on_error is not None:
+                        on_error(path, line_no, e)
+    except (EOFError, OSError, zlib.error) as e:    # truncated / corrupt gzip stream
+        if on_error is not None:
+            on_error(path, 0, e)
+
+
+def _row(d: Dict[str, Any]) -> Optional[Tuple]:
+    """A CLEAN reading as a tuple in SCHEMA order, or None if it does not fit the schema."""
+    try:
+        ts = d["ts"]
+        if not isinstance(ts, int) or isinstance(ts, bool) or not isinstance(d["device_id"], str):
+            return None
+        if not 0 <= ts < MAX_TS:                    # SensorIn accepts any int; partition_of() cannot place these
+            return None
+        return (d["device_id"], ts, float(d["temperature_c"]), float(d["temperature_avg5_c"]),
+                float(d["humidity_pct"]), str(d["quality"]), str(d.get("schema_version", "1.0")))
+    except (KeyError, TypeError, ValueError):
+        return None
+
+
+def partition_of(ts: int) -> Tuple[str, str, str]:
+    """(year, month, day) of an epoch-seconds `ts`, UTC, zero-padded like Firehose prefixes."""
+    t = time.gmtime(ts)
+    return f"{t.tm_year:04d}", f"{t.tm_mon:02d}", f"{t.tm_mday:02d}"
+
+
+# =============================================================================
+# 2) Writing Parquet
+# =============================================================================
+class ParquetCompactor:
+    """
+    Buffer rows per (year, month, day) and write sorted Parquet part files.
+
+    Args:
+        out_dir:           root of the hive-partitioned output.
+        rows_per_file:     a partition buffer is written once it holds this many rows.
+        max_buffered_rows: cap on rows buffered across ALL partitions (the memory bound).
+        row_group_size:    rows per Parquet row group (unit of statistics-based skipping).
+        compression:       Parquet codec (snappy, zstd, gzip - all readable by Athena).
+    """
+
+    def __init__(self, out_dir: str, rows_per_file: int = 1_000_000, max_buffered_rows: int = 2_000_000,
+                 row_group_size: int = 131_072, compression: str = "snappy"):
+        self.out_dir = out_dir
+        self.rows_per_file = rows_per_file
+        self.max_buffered_rows = max_buffered_rows
+        self.row_group_size = row_group_size
+        self.compression = compression
+        self._buffers: Dict[Tuple[str, str, str], List[Tuple]] = {}
+        self._buffered = 0
+        self.rows_in = 0
+        self.rows_out = 0
+        self.skipped = 0                            # readings that do not fit SCHEMA
+        self.bad_lines = 0                          # undecodable lines / damaged objects (see iter_documents)
+        self.files: List[str] = []
+
+    def add(self, reading: Dict[str, Any]) -> None:
+        self.rows_in += 1
+        row = _row(reading)
+        if row is None:
+            self.skipped += 1
+            return
+        key = partition_of(row[1])
+        buf = self._buffers.get(key)
+        if buf is None:
+            buf = self._buffers[key] = []
+        buf.append(row)
+        self._buffered += 1
+        if len(buf) >= self.rows_per_file:
+            self._write(key)
+        elif self._buffered >= self.max_buffered_rows:
+            self._write(max(self._buffers, key=lambda k: len(self._buffers[k])))
+
+    def _write(self, key: Tuple[str, str, str]) -> None:
+        rows = self._buffers.pop(key)
+        self._buffered -= len(rows)
+        columns = list(zip(*rows))
+        table = pa.Table.from_arrays([pa.array(c, type=f.type) for c, f in zip(columns, SCHEMA)], schema=SCHEMA)
+        table = table.sort_by(_SORT)
+
+        year, month, day = key
+        part_dir = os.path.join(self.out_dir, f"year={year}", f"month={month}", f"day={day}")
+        os.makedirs(part_dir, exist_ok=True)
+        n = 0
+        while os.path.exists(os.path.join(part_dir, f"part-{n:05d}.parquet")):
+            n += 1                                  # never overwrite an earlier run's output
+        path = os.path.join(part_dir, f"part-{n:05d}.parquet")
+        tmp = path + ".tmp"
+        pq.write_table(table, tmp, row_group_size=self.row_group_size, compression=self.compression,
+                       write_statistics=True)
+        os.replace(tmp, path)                       # readers never see a half-written file
+        self.rows_out += len(rows)
+        self.files.append(path)
+
+    def close(self) -> None:
+        """Write every remaining buffer."""
+        for key in sorted(self._buffers):
+            self._write(key)
+
+
+def compact(src_dir: str, out_dir: str, **kwargs) -> ParquetCompactor:
+    """Stream every Firehose object under `src_dir` into Parquet under `out_dir`. Returns the compactor (for its counters)."""
+    c = ParquetCompactor(out_dir, **kwargs)
+
+    def bad_line(path: str, line_no: int, exc: Exception) -> None:
+        # One damaged record must not abort the run (and lose every buffered row)
+        c.bad_lines += 1
+        if c.bad_lines <= 10:
+            print(f"skipping {path}:{line_no}: {exc}", file=sys.stderr)
+
+    for path in iter_files(src_dir):
+        for doc in iter_documents(path, on_error=bad_line):
+            for reading in unpack_readings(doc):
+                c.add(reading)
+    c.close()
+    return c
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("src_dir", help="local copy of the Firehose CLEAN prefix (JSON / JSON.gz objects)")
+    ap.add_argument("out_dir", help="where to write year=/month=/day= partitions")
+    ap.add_argument("--rows-per-file", type=int, default=1_000_000)
+    ap.add_argument("--max-buffered-rows", type=int, default=2_000_000)
+    ap.add_argument("--row-group-size", type=int, default=131_072)
+    ap.add_argument("--compression", default="snappy")
+    args = ap.parse_args()
+
+    start = time.perf_counter()
+    c = compact(args.src_dir, args.out_dir, rows_per_file=args.rows_per_file,
+                max_buffered_rows=args.max_buffered_rows, row_group_size=args.row_group_size,
+                compression=args.compression)
+    elapsed = time.perf_counter() - start
+    print(f"rows in={c.rows_in} written={c.rows_out} skipped={c.skipped} bad_lines={c.bad_lines} files={len(c.files)} "
+          f"in {elapsed:.1f}s ({c.rows_in / max(elapsed, 1e-9):,.0f} rows/s)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,198 @@
+"""
+compression.py
+--------------
+Report-by-exception at the edge: deadband and swinging-door compression,
+the same techniques plant historians use.
+
+A DHT11 read every 2 s mostly repeats the last value. `ReadingCompressor`
+decides per reading whether it has to be sent so that the trend can be
+rebuilt within tolerance, for each signal (temperature, humidity):
+
+    deadband         send when |value - last sent value| > deadband
+                     (rebuild with a step / "previous value" hold)
+    swinging door    send the points where a straight line from the last
+                     sent point can no longer stay within ±tolerance of every
+                     skipped value (rebuild with linear interpolation; every
+                     skipped value stays within ±tolerance of the rebuilt line)
+    heartbeat        send at least every `max_interval_sec`, even if flat
+
+Swinging door works one reading behind: the point it sends is the reading
+BEFORE the one that broke the door, so `add()` may return 0, 1 or 2
+readings. Call `flush()` on shutdown so the last reading is not lost.
+
+Consumers rebuild the trend with `interpolate(points, ts, field)`.
+"""
+
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+
+class SignalSpec:
+    """Compression settings for one field. None disables that part."""
+    __slots__ = ("deadband", "swing_tolerance")
+
+    def __init__(self, deadband: Optional[float] = None, swing_tolerance: Optional[float] = None):
+        self.deadband = deadband
+        self.swing_tolerance = swing_tolerance
+
+
+class SwingingDoor:
+    """
+    Swinging-door state for one signal of one device.
+
+    The door hinges on the last archived point (t0, v0). Every new point
+    narrows the allowed slope range [lower, upper]. The classic algorithm
+    waits for lower > upper, but the point it then archives may lie outside
+    the door of the points before it (error up to ~2x tolerance). Here the
+    door closes as soon as a point's own slope leaves the range set by the
+    earlier points, so the line to the archived point covers everything skipped.
+    """
+    __slots__ = ("tolerance", "t0", "v0", "upper", "lower")
+
+    def __init__(self, tolerance: float):
+        self.tolerance = tolerance
+        self.t0 = self.v0 = 0.0
+        self.upper = float("inf")
+        self.lower = float("-inf")
+
+    def restart(self, t: float, v: float) -> None:
+        """Hinge the door on a newly archived point."""
+        self.t0, self.v0 = t, v
+        self.upper = float("inf")
+        self.lower = float("-inf")
+
+    def offer(self, t: float, v: float) -> bool:
+        """Narrow the door with (t, v). Returns True if the door closed (the previous point must be archived)."""
+        dt = t - self.t0
+        if dt <= 0:
+            return False                        # same or older timestamp: nothing to learn about the slope
+        slope = (v - self.v0) / dt
+        inside = self.lower <= slope <= self.upper  # a line to (t, v) still covers every earlier point
+        self.upper = min(self.upper, (v + self.tolerance - self.v0) / dt)
+        self.lower = max(self.lower, (v - self.tolerance - self.v0) / dt)
+        return not inside
+
+
+class _DeviceState:
+    __slots__ = ("last_sent", "held", "doors")
+
+    def __init__(self):
+        self.last_sent: Optional[Dict[str, Any]] = None
+        self.held: Optional[Dict[str, Any]] = None     # newest reading not sent yet (swinging door)
+        self.doors: Dict[str, SwingingDoor] = {}
+
+
+class ReadingCompressor:
+    """
+    Per-device report-by-exception filter for reading dicts.
+
+    Args:
+        signals:          field name -> SignalSpec, e.g.
+                          {"temperature": SignalSpec(deadband=0.5, swing_tolerance=0.3),
+                           "humidity":    SignalSpec(deadband=2.0, swing_tolerance=1.0)}
+        max_interval_sec: heartbeat; a reading is always sent if the last one is this old.
+        ts_field / device_field: keys holding the timestamp and the device id.
+
+    A reading is sent when any signal asks for it. Readings missing a signal
+    field are passed through unchanged.
+    """
+
+    def __init__(self, signals: Dict[str, SignalSpec], max_interval_sec: float = 300.0,
+                 ts_field: str = "ts", device_field: str = "device_id"):
+        self.signals = signals
+        self.max_interval_sec = max_interval_sec
+        self.ts_field = ts_field
+        self.device_field = device_field
+        self._devices: Dict[Any, _DeviceState] = {}
+        self.seen = 0
+        self.sent = 0
+
+    def _send(self, st: _DeviceState, reading: Dict[str, Any], out: List[Dict[str, Any]]) -> None:
+        st.last_sent = reading
+        t = reading[self.ts_field]
+        for field, door in st.doors.items():
+            door.restart(t, reading[field])
+        out.append(reading)
+
+    def add(self, reading: Dict[str, Any]) -> List[Dict[str, Any]]:
+        """Feed one reading; returns the readings (0-2) that must be published now, oldest first."""
+        self.seen += 1
+        out: List[Dict[str, Any]] = []
+        if any(reading.get(f) is None for f in self.signals) or reading.get(self.ts_field) is None:
+            out.append(reading)                         # not something we know how to compress
+            self.sent += 1
+            return out
+
+        key = reading.get(self.device_field)
+        st = self._devices.get(key)
+        if st is None:                                  # first reading of a device is always sent
+            st = self._devices[key] = _DeviceState()
+            st.doors = {f: SwingingDoor(s.swing_tolerance) for f, s in self.signals.items()
+                        if s.swing_tolerance is not None}
+            self._send(st, reading, out)
+            self.sent += 1
+            return out
+
+        t = reading[self.ts_field]
+        # Swinging door: if any door closes, the held reading becomes an archived point
+        closed = False
+        for field, door in st.doors.items():
+            closed |= door.offer(t, reading[field])     # offer every door so all slopes are updated
+        if closed and st.held is not None:
+            self._send(st, st.held, out)
+            st.held = None
+            for field, door in st.doors.items():
+                door.offer(t, reading[field])           # re-open the doors from the new hinge
+
+        # Deadband and heartbeat apply to the current reading
+        last = st.last_sent
+        send_now = t - last[self.ts_field] >= self.max_interval_sec
+        if not send_now:
+            for field, spec in self.signals.items():
+                if spec.deadband is not None and abs(reading[field] - last[field]) > spec.deadband:
+                    send_now = True
+                    break
+        if send_now:
+            self._send(st, reading, out)
+            st.held = None
+        else:
+            st.held = reading
+        self.sent += len(out)
+        return out
+
+    def flush(self) -> List[Dict[str, Any]]:
+        """Readings still held back (one per device at most) - send these on shutdown."""
+        out: List[Dict[str, Any]] = []
+        for st in self._devices.values():
+            if st.held is not None:
+                self._send(st, st.held, out)
+                st.held = None
+        self.sent += len(out)
+        return out
+
+    @property
+    def ratio(self) -> float:
+        """Readings seen per reading sent (the compression factor)."""
+        return self.seen / self.sent if self.sent else 0.0
+
+
+def interpolate(points: Sequence[Dict[str, Any]], ts: Sequence[float], field: str,
+                method: str = "linear", ts_field: str = "ts") -> np.ndarray:
+    """
+    Rebuild `field` at times `ts` from compressed points of ONE device.
+
+    method="linear"   for swinging-door data (straight lines between archived points)
+    method="previous" for deadband-only data (value holds until the next report)
+    Times outside the sent range take the first/last value.
+    """
+    pts = sorted(points, key=lambda p: p[ts_field])
+    xp = np.array([p[ts_field] for p in pts], dtype=np.float64)
+    fp = np.array([p[field] for p in pts], dtype=np.float64)
+    x = np.asarray(ts, dtype=np.float64)
+    if method == "linear":
+        return np.interp(x, xp, fp)
+    if method == "previous":
+        idx = np.clip(np.searchsorted(xp, x, side="right") - 1, 0, len(fp) - 1)
+        return fp[idx]
+    raise ValueError(f"method must be 'linear' or 'previous', got {method!r}")
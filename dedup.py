@@ -0,0 +1,169 @@
+"""
+dedup.py
+--------
+QoS1 duplicate suppression keyed on (device_id, ts).
+
+With AT_LEAST_ONCE delivery the broker may hand us the same RAW message
+twice (redelivery, publisher retry, store-and-forward replay). Without a
+check the duplicate goes through `process()` again, is pushed into the
+rolling window a second time and lands in S3 twice.
+
+`DedupIndex` separates the check from the bookkeeping: `is_duplicate()`
+only looks, and a key is recorded with `remember()` once its reading was
+processed successfully - so a malformed first delivery never hides the
+valid redelivery that follows it.
+
+Per device it keeps the timestamps seen within `window_sec` (event time)
+of the newest one, in a set for O(1) lookups and a FIFO for pruning,
+capped at `per_device` entries. A reading older than that horizon cannot
+be checked and is let through (counted in `too_late`) rather than dropped,
+so a store-and-forward backlog replayed behind live data is never lost.
+Devices that stay quiet for `ttl_sec` are evicted, so memory stays bounded.
+
+`reading_key(payload)` pulls (device_id, ts) out of the raw bytes with two
+small regexes (binary payloads from wire.py: straight from the fixed layout),
+so replays are dropped BEFORE any JSON parsing or validation. It works on
+CLEAN payloads as well (same field names), which is how the process-pool path records
+a key from the processed result.
+"""
+
+import json
+import re
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Deque, Optional, Set, Tuple
+
+import wire
+from edge_pipeline import device_key
+
+_TS_RE = re.compile(rb'"ts"\s*:\s*(-?\d+)\s*[,}]')
+# The layout every publisher and process_bytes write: device_id first, ts second (one anchored match)
+_HEAD_RE = re.compile(rb'\{\s*"device_id"\s*:\s*"([^"\\]*)"\s*,\s*"ts"\s*:\s*(-?\d+)\s*[,}]')
+
+
+def reading_key(payload: bytes) -> Optional[Tuple[bytes, int]]:
+    """
+    (device_id UTF-8 bytes, ts) of a RAW or CLEAN payload without parsing it, or None if
+    either is missing. JSON escapes in the id are resolved, so JSON (escaped or not) and
+    wire payloads of the same reading give the same key.
+    """
+    if payload[:1] == wire.MAGIC_BYTE:             # compact binary payload: fixed layout, no regex needed
+        return wire.reading_key(payload)
+    m = _HEAD_RE.match(payload)
+    if m is not None:
+        return m.group(1), int(m.group(2))
+    m = _TS_RE.search(payload)
+    if m is None:
+        return None
+    dev = device_key(payload)
+    if not dev:
+        return None
+    if b"\\" in dev:                               # JSON escapes ("caf\u00e9"): key on the UTF-8 text, like wire does
+        try:
+            dev = json.loads(b'"' + dev + b'"').encode("utf-8")
+        except ValueError:
+            pass
+    return dev, int(m.group(1))
+
+
+class _DeviceSeen:
+    __slots__ = ("members", "order", "newest", "last_seen")
+
+    def __init__(self):
+        self.members: Set[int] = set()
+        self.order: Deque[int] = deque()            # the same timestamps in arrival order (~ ts order)
+        self.newest: Optional[int] = None
+        self.last_seen = 0.0
+
+
+class DedupIndex:
+    """
+    Bounded "have I processed (device_id, ts) before?" index.
+
+    Args:
+        window_sec:   how far (in ts seconds) behind a device's newest reading
+                      duplicates are still detected.
+        per_device:   hard cap on timestamps remembered per device (oldest forgotten first).
+        ttl_sec:      forget devices idle for this long.
+        max_devices:  hard cap on tracked devices (least recently seen evicted first).
+        clock:        time source for TTL (defaults to time.time).
+
+    Thread-safe: the MQTT callback checks, pipeline workers / the pool's result
+    thread remember.
+    """
+
+    def __init__(self, window_sec: float = 3600.0, per_device: int = 2048, ttl_sec: float = 3600.0,
+                 max_devices: int = 100_000, clock: Callable[[], float] = time.time):
+        if per_device < 1:
+            raise ValueError("per_device must be >= 1")
+        self.window_sec = window_sec
+        self.per_device = per_device
+        self.ttl_sec = ttl_sec
+        self.max_devices = max_devices
+        self._clock = clock
+        self._devices: "OrderedDict[bytes, _DeviceSeen]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.checked = 0
+        self.suppressed = 0
+        self.too_late = 0                            # older than the window: let through unchecked
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    def seen(self, device_id: bytes, ts: int) -> bool:
+        """True if (device_id, ts) was remembered before. Only looks; see remember()."""
+        with self._lock:
+            self.checked += 1
+            d = self._devices.get(device_id)
+            if d is None:
+                return False
+            if ts in d.members:
+                self.suppressed += 1
+                return True
+            if ts < d.newest - self.window_sec:
+                self.too_late += 1
+            return False
+
+    def remember(self, device_id: bytes, ts: int) -> None:
+        """Record (device_id, ts) as processed."""
+        with self._lock:
+            now = self._clock()
+            d = self._devices.get(device_id)
+            if d is None:
+                d = self._devices[device_id] = _DeviceSeen()
+            else:
+                self._devices.move_to_end(device_id)
+            d.last_seen = now
+            if ts not in d.members and (d.newest is None or ts >= d.newest - self.window_sec):
+                d.members.add(ts)
+                d.order.append(ts)
+                if d.newest is None or ts > d.newest:
+                    d.newest = ts
+                # Readings arrive roughly in ts order, so the front is (about) the oldest; a late
+                # one is kept a little longer than needed, never shorter than the window.
+                horizon = d.newest - self.window_sec
+                order = d.order
+                while order[0] < horizon or len(order) > self.per_device:
+                    d.members.discard(order.popleft())
+            self._evict(now)
+
+    def is_duplicate(self, payload: bytes) -> bool:
+        """`seen()` on the key of a RAW payload; payloads without a readable key are never duplicates."""
+        key = reading_key(payload)
+        return key is not None and self.seen(*key)
+
+    def remember_payload(self, payload: bytes) -> None:
+        """`remember()` the key of a payload (e.g. the CLEAN result of a successful process_bytes)."""
+        key = reading_key(payload)
+        if key is not None:
+            self.remember(*key)
+
+    def _evict(self, now: float) -> None:
+        devices = self._devices
+        cutoff = now - self.ttl_sec
+        while devices:
+            first = next(iter(devices.values()))
+            if first.last_seen >= cutoff and len(devices) <= self.max_devices:
+                break
+            devices.popitem(last=False)
@@ -0,0 +1,240 @@
+"""
+edge_multiproc.py
+-----------------
+Multi-core edge processing: N worker PROCESSES, sharded by device_id.
+
+`process_bytes()` is pure Python and holds the GIL, so threads alone cannot use
+more than one core. `ProcessShardPool` routes each RAW payload to a worker
+process picked by a stable hash of its device_id (same `shard_for` as the
+thread pipeline), so every device always lands on the same worker and that
+worker owns the device's rolling window.
+
+    MQTT callback ──submit()──► shard buffer ──(batch)──► worker process k ──► results queue
+                                                                                   │
+                                         on_result(ok, clean_bytes | error) ◄──────┘  (one publisher thread)
+
+Messages cross the process boundary in small batches (one pickle per batch,
+not per message); a batch is sent when it reaches `batch_size` or after
+`linger_sec`. Each worker snapshots its WindowStore to `state_dir/shard-<k>.json`
+every `snapshot_every_sec` and on shutdown, and reloads it on start, so a
+restarted worker (crash or redeploy) carries on where it left off.
+"""
+
+import multiprocessing as mp
+import os
+import queue
+import threading
+import time
+from multiprocessing.connection import wait
+from typing import Callable, Dict, List, Optional
+
+from batch_publisher import split_batch
+from edge_pipeline import device_key, readings_for_sharding, shard_for
+from models_and_processor import new_window_store, process_bytes
+
+
+def _shard_state_path(state_dir: Optional[str], shard: int) -> Optional[str]:
+    return os.path.join(state_dir, f"shard-{shard}.json") if state_dir else None
+
+
+def _worker_main(shard: int, in_q, out_conn, state_path: Optional[str], snapshot_every_sec: float) -> None:
+    """Worker process loop: batches of payloads in, batches of (ok, result) out."""
+    store = new_window_store()
+    if state_path and store.load(state_path):
+        print(f"[shard {shard}] restored {len(store)} device windows")
+    last_save = time.monotonic()
+    try:
+        while True:
+            batch = in_q.get()
+            if batch is None:                       # clean shutdown
+                break
+            out = []
+            for payload in batch:
+                try:
+                    for raw in split_batch(payload):    # a batched RAW payload holds several readings
+                        out.append(process_bytes(raw, store))
+                except Exception as e:              # e.g. undecodable bytes; keep the worker alive
+                    out.append((False, f"process_error:{e!r}"))
+            out_conn.send(out)
+            if state_path and time.monotonic() - last_save >= snapshot_every_sec:
+                store.save(state_path)
+                last_save = time.monotonic()
+    except KeyboardInterrupt:
+        pass                                        # parent handles Ctrl+C and sends the sentinel
+    finally:
+        if state_path:
+            store.save(state_path)
+        out_conn.close()
+
+
+class ProcessShardPool:
+    """
+    Pool of worker processes keyed by device_id.
+
+    Args:
+        on_result:  called as on_result(ok, clean_bytes_or_error) on the single result thread
+                    (the place to call conn.publish).
+        workers:    number of worker processes (default: os.cpu_count()).
+        state_dir:  directory for per-shard window snapshots (None = no persistence).
+        batch_size: messages per inter-process batch.
+        linger_sec: max time a partial batch waits before it is sent anyway.
+        queue_size: max batches queued per worker. submit() never blocks (it runs on the MQTT
+                    thread, which also delivers PUBACKs): a batch for a full queue is
+                    dropped and its messages counted in `dropped`.
+        snapshot_every_sec: how often each worker saves its windows.
+
+    Each worker gets its own input queue and result pipe. If a worker dies, both
+    are replaced when it is restarted (a killed process can leave a shared queue
+    locked); batches still queued for the dead worker are counted in `lost_batches`.
+    """
+
+    def __init__(self, on_result: Callable[[bool, object], None], workers: Optional[int] = None,
+                 state_dir: Optional[str] = None, batch_size: int = 64, linger_sec: float = 0.005,
+                 queue_size: int = 256, snapshot_every_sec: float = 30.0):
+        self.on_result = on_result
+        self.workers = workers or os.cpu_count() or 1
+        self.state_dir = state_dir
+        self.batch_size = batch_size
+        self.linger_sec = linger_sec
+        self.queue_size = queue_size
+        self.snapshot_every_sec = snapshot_every_sec
+        if state_dir:
+            os.makedirs(state_dir, exist_ok=True)
+
+        # "spawn" so children never inherit the parent's MQTT/TLS threads (unsafe with fork).
+        self._ctx = mp.get_context("spawn")
+        self._in_qs: list = [None] * self.workers
+        self._out_conns: Dict[int, object] = {}
+        self._procs: list = [None] * self.workers
+        self._pending: List[list] = [[] for _ in range(self.workers)]
+        self._pending_since = [0.0] * self.workers
+        self._lock = threading.RLock()
+        self._running = False
+        self._threads: List[threading.Thread] = []
+        self.restarts = 0
+        self.lost_batches = 0
+        self.dropped = 0                             # messages discarded because a worker queue was full
+
+    # ---- lifecycle ---------------------------------------------------------------
+    def _spawn(self, shard: int) -> None:
+        """(Re)start the worker for `shard` with a fresh input queue and result pipe."""
+        old_q = self._in_qs[shard]
+        if old_q is not None:
+            try:
+                self.lost_batches += old_q.qsize()
+            except NotImplementedError:              # qsize() is not available on macOS
+                pass
+        in_q = self._ctx.Queue(maxsize=self.queue_size)
+        recv_conn, send_conn = self._ctx.Pipe(duplex=False)
+        p = self._ctx.Process(
+            target=_worker_main, name=f"edge-shard-{shard}", daemon=True,
+            args=(shard, in_q, send_conn, _shard_state_path(self.state_dir, shard), self.snapshot_every_sec),
+        )
+        p.start()
+        send_conn.close()                            # only the child writes; lets us see EOF when it exits
+        self._in_qs[shard] = in_q
+        self._out_conns[shard] = recv_conn
+        self._procs[shard] = p
+
+    def start(self) -> "ProcessShardPool":
+        self._running = True
+        for shard in range(self.workers):
+            self._spawn(shard)
+        for target, name in ((self._results_loop, "edge-results"), (self._housekeeping_loop, "edge-pool-watch")):
+            t = threading.Thread(target=target, name=name, daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def stop(self, timeout: Optional[float] = 10.0) -> None:
+        """Send what is buffered, let every worker save its state, and wait for the last results."""
+        self.flush(block=True)
+        self._running = False
+        for q in self._in_qs:
+            q.put(None)
+        for p in self._procs:
+            p.join(timeout)
+        for t in self._threads:                      # results thread exits once every pipe hits EOF
+            t.join(timeout)
+        self._threads.clear()
+
+    # ---- producer side -----------------------------------------------------------
+    def submit(self, topic: str, payload: bytes) -> None:
+        """Route one RAW payload (a batch: each reading) to its device's worker (topic is accepted for symmetry with ShardedPipeline)."""
+        for raw in readings_for_sharding(payload):
+            shard = shard_for(device_key(raw), self.workers)
+            with self._lock:
+                buf = self._pending[shard]
+                if not buf:
+                    self._pending_since[shard] = time.monotonic()
+                buf.append(raw)
+                if len(buf) >= self.batch_size:
+                    self._pending[shard] = []
+                    self._send(shard, buf)
+
+    def flush(self, older_than: float = 0.0, block: bool = False) -> None:
+        """Send partial batches (only those waiting longer than `older_than` seconds)."""
+        now = time.monotonic()
+        with self._lock:
+            for shard, buf in enumerate(self._pending):
+                if buf and now - self._pending_since[shard] >= older_than:
+                    self._pending[shard] = []
+                    self._send(shard, buf, block)
+
+    def _send(self, shard: int, batch: list, block: bool = False) -> bool:
+        """
+        Queue a batch for `shard` (caller holds the lock, so batches of a shard stay in order).
+        Without `block` a full queue drops the batch: waiting here would stall the MQTT
+        thread, and with it the PUBACKs the result thread may be waiting for.
+        """
+        while True:
+            try:
+                self._in_qs[shard].put(batch, timeout=0.2 if block else None, block=block)
+                return True
+            except queue.Full:
+                if self._check_worker(shard):        # a full queue may mean the worker is gone
+                    continue                         # fresh queue: retry once more
+                if not block:
+                    self.dropped += len(batch)
+                    return False
+
+    # ---- background threads -------------------------------------------------------
+    def _check_worker(self, shard: int) -> bool:
+        """
+        Restart the worker for `shard` if it died. True if it was restarted.
+
+        The caller must hold `self._lock`: _spawn() swaps the shard's queue and adds to
+        `lost_batches`, racing _send() on the MQTT thread otherwise.
+        """
+        p = self._procs[shard]
+        if self._running and not p.is_alive():
+            print(f"[pool] shard {shard} exited with code {p.exitcode}; restarting")
+            self.restarts += 1
+            self._spawn(shard)                       # the new worker reloads shard-<k>.json
+            return True
+        return False
+
+    def _housekeeping_loop(self) -> None:
+        """Flush lingering batches and restart workers that died."""
+        while self._running:
+            time.sleep(self.linger_sec)
+            self.flush(self.linger_sec)
+            with self._lock:
+                for shard in range(self.workers):
+                    self._check_worker(shard)
+
+    def _results_loop(self) -> None:
+        while self._running or self._out_conns:
+            conns = {c: shard for shard, c in list(self._out_conns.items())}
+            for c in wait(list(conns), timeout=0.1):
+                try:
+                    out = c.recv()
+                except (EOFError, OSError):          # worker exited: forget its pipe
+                    if self._out_conns.get(conns[c]) is c:
+                        del self._out_conns[conns[c]]
+                    continue
+                for ok, res in out:
+                    try:
+                        self.on_result(ok, res)
+                    except Exception as e:
+                        print("Result handler error:", repr(e))
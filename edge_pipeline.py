@@ -0,0 +1,169 @@
+"""
+edge_pipeline.py
+----------------
+Bounded worker pipeline that sits behind the MQTT callback.
+
+The awscrt callback runs on the single network event-loop thread. In pipeline
+mode it only calls `ShardedPipeline.submit(topic, payload)`, which drops the
+message into a bounded queue and returns. Worker threads do the validation,
+smoothing, serialization and publish.
+
+Messages are sharded by `device_id`: every reading of one device lands on the
+same queue and the same worker, so per-device order (and therefore each
+device's rolling window) is preserved. A batch payload is split first
+(`readings_for_sharding`), so a batch holding several devices sends each
+reading to its own device's worker. Each worker owns its own WindowStore,
+so the workers never share mutable state.
+
+When a queue is full the overflow policy decides what happens:
+    "block"        wait for room (backpressure onto the network thread)
+    "drop_oldest"  discard the oldest queued message of that shard
+    "drop_newest"  discard the message being submitted
+"""
+
+import queue
+import re
+import threading
+import zlib
+from typing import Callable, List, Optional
+
+import wire
+from batch_publisher import is_batch, split_batch
+from models_and_processor import WindowStore, new_window_store
+
+OVERFLOW_POLICIES = ("block", "drop_oldest", "drop_newest")
+
+# Cheap way to find the device id without parsing the whole JSON document.
+_DEVICE_ID_RE = re.compile(rb'"device_id"\s*:\s*"((?:[^"\\]|\\.)*)"')
+
+_STOP = object()   # sentinel that tells a worker to exit
+
+
+def device_key(payload: bytes) -> bytes:
+    """Raw bytes of the device_id value, or b"" if it cannot be found (the message will be rejected anyway)."""
+    if payload[:1] == wire.MAGIC_BYTE:             # compact binary payload (wire.py)
+        key = wire.reading_key(payload)
+        return key[0] if key is not None else b""
+    m = _DEVICE_ID_RE.search(payload)
+    return m.group(1) if m else b""
+
+
+def readings_for_sharding(payload: bytes) -> List[bytes]:
+    """A batch (JSON envelope or binary) as its single readings; anything else as [payload]."""
+    if is_batch(payload) or wire.is_batch(payload):
+        try:
+            return split_batch(payload)
+        except ValueError:
+            pass                                    # damaged envelope: the handler reports it
+    return [payload]
+
+
+def shard_for(key: bytes, shards: int) -> int:
+    """Stable shard number for a device key (crc32, so it is the same in every process and on every restart)."""
+    return zlib.crc32(key) % shards
+
+
+class ShardedPipeline:
+    """
+    N worker threads, each with its own bounded FIFO queue and WindowStore.
+
+    Args:
+        handler:    called as handler(topic, payload, store) on a worker thread.
+        workers:    number of worker threads / shards.
+        queue_size: max queued messages per shard.
+        overflow:   "block", "drop_oldest" or "drop_newest" (see module docstring).
+        store_factory: builds the per-worker WindowStore (default: new_window_store, TTL + LRU bounded).
+    """
+
+    def __init__(self, handler: Callable[[str, bytes, WindowStore], None], workers: int = 4,
+                 queue_size: int = 1000, overflow: str = "block",
+                 store_factory: Callable[[], WindowStore] = new_window_store):
+        if overflow not in OVERFLOW_POLICIES:
+            raise ValueError(f"overflow must be one of {OVERFLOW_POLICIES}, got {overflow!r}")
+        if workers < 1:
+            raise ValueError("workers must be >= 1")
+        self.handler = handler
+        self.overflow = overflow
+        self.queues: List[queue.Queue] = [queue.Queue(maxsize=queue_size) for _ in range(workers)]
+        self.stores: List[WindowStore] = [store_factory() for _ in range(workers)]
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self.dropped = 0          # messages discarded by the overflow policy
+        self.errors = 0           # handler exceptions (the worker keeps running)
+
+    # ---- producer side (MQTT callback thread) --------------------------------
+    def submit(self, topic: str, payload: bytes) -> bool:
+        """Queue one message (a batch: each reading on its device's shard). Returns False if anything was dropped."""
+        ok = True
+        for raw in readings_for_sharding(payload):
+            ok = self._put(self.queues[shard_for(device_key(raw), len(self.queues))], (topic, raw)) and ok
+        return ok
+
+    def _put(self, q: queue.Queue, item: tuple) -> bool:
+        if self.overflow == "block":
+            q.put(item)
+            return True
+        try:
+            q.put_nowait(item)
+            return True
+        except queue.Full:
+            pass
+        if self.overflow == "drop_newest":
+            self._count_drop()
+            return False
+        # drop_oldest: make room by discarding the head of the queue, then retry
+        while True:
+            try:
+                q.get_nowait()
+                q.task_done()
+                self._count_drop()
+            except queue.Empty:
+                pass
+            try:
+                q.put_nowait(item)
+                return False
+            except queue.Full:
+                continue
+
+    def _count_drop(self) -> None:
+        with self._lock:
+            self.dropped += 1
+
+    def depth(self) -> int:
+        """Total number of queued messages across all shards."""
+        return sum(q.qsize() for q in self.queues)
+
+    # ---- worker side -----------------------------------------------------------
+    def _run(self, q: queue.Queue, store: WindowStore) -> None:
+        while True:
+            item = q.get()
+            try:
+                if item is _STOP:
+                    return
+                self.handler(item[0], item[1], store)
+            except Exception as e:
+                with self._lock:
+                    self.errors += 1
+                print("Worker error:", repr(e))   # never let one bad message kill the worker
+            finally:
+                q.task_done()
+
+    def start(self) -> "ShardedPipeline":
+        for i, (q, store) in enumerate(zip(self.queues, self.stores)):
+            t = threading.Thread(target=self._run, args=(q, store), name=f"edge-worker-{i}", daemon=True)
+            t.start()
+            self._threads.append(t)
+        return self
+
+    def join(self) -> None:
+        """Block until every queued message has been handled."""
+        for q in self.queues:
+            q.join()
+
+    def stop(self, timeout: Optional[float] = None) -> None:
+        """Finish the queued work, then stop the workers."""
+        for q in self.queues:
+            q.put(_STOP)            # queued behind the remaining work, so nothing is lost
+        for t in self._threads:
+            t.join(timeout)
+        self._threads.clear()
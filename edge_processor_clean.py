@@ -7,16 +7,26 @@ Subscribes to RAW sensor data on AWS IoT Core, validates/transforms it with
 REPLACE the ALL-CAPS placeholders below before running.
 """
 
-import json
+import logging
 import time
 
-from awscrt import io, mqtt
-from awsiot import mqtt_connection_builder
+from pydantic_core import from_json
+
+from awscrt import mqtt
 
 # Your own processor function:
-#   def process(raw_str: str) -> tuple[bool, Any]
-# Should return (True, cleaned_model) or (False, error_info)
-from models_and_processor import process
+#   def process_bytes(payload: bytes) -> tuple[bool, bytes | str]
+# Returns (True, clean_json_bytes) or (False, error_info).
+# Same validation as process(), but skips the model -> dict -> str -> bytes round trip.
+from models_and_processor import new_window_store, process_bytes, process_bytes_staged
+from edge_pipeline import ShardedPipeline
+from edge_multiproc import ProcessShardPool
+from batch_publisher import BatchingPublisher, pack_json_batch, pack_wire_batch, split_batch
+from dedup import DedupIndex, reading_key
+from rollup import RollupAggregator
+from metrics import Metrics, MetricsServer, SampledLogger, drop_reason
+from mqtt_client import mtls_client
+import wire
 
 
 # ===========================
@@ -34,6 +44,52 @@ RAW_TOPIC    = "<RAW_TOPIC>"                      # Raw Data Topic coming out fo
 CLEAN_TOPIC  = "<CLEAN_TOPIC>"                    # Proceessed Data Topic. eg sensors/clean
 
 QOS_LEVEL    = mqtt.QoS.AT_LEAST_ONCE             # Ensures ACK Flag is recieved at least once before sending another message(TCP Protocol)
+
+# Pipeline mode: the MQTT callback only enqueues; worker threads (sharded by device_id) do the work.
+PIPELINE_WORKERS    = 0                           # 0 = process inside the callback (original behaviour)
+PIPELINE_QUEUE_SIZE = 1000                        # max queued messages per worker
+PIPELINE_OVERFLOW   = "drop_oldest"               # or "drop_newest" when a queue is full ("block" would stall the MQTT thread, and the PUBACKs with it)
+
+# Multi-core mode: N worker processes (sharded by device_id), results published over this one connection.
+PROCESS_WORKERS     = 0                           # 0 = off; e.g. os.cpu_count() on a gateway box. Takes precedence over PIPELINE_WORKERS
+STATE_DIR           = "./edge_state"              # per-shard rolling-window snapshots, reloaded when a worker restarts
+
+# Publish flow control (mqtt_client.MqttClient): bounded QoS1 in-flight window, PUBACK latency, backpressure
+PUBLISH_MAX_IN_FLIGHT = 100                       # unacknowledged CLEAN publishes at most
+PUBLISH_MAX_QUEUED    = 10_000                    # publishes waiting for a slot; beyond this the oldest is dropped
+PUBLISH_TARGET_ACK_SEC = 0.5                      # shrink the window when PUBACKs take longer (None = fixed window)
+PUBLISH_BACKPRESSURE_WAIT_SEC = 1.0               # pipeline/pool threads wait up to this long for a free slot (while online)
+
+# Clean-message batching: many readings per CLEAN publish (fewer billed IoT messages / Firehose records).
+CLEAN_BATCH_MAX_COUNT  = 0                        # 0 = off (one publish per reading); e.g. 100
+CLEAN_BATCH_MAX_BYTES  = 120_000                  # stay under the 128 KB AWS IoT Core message limit
+CLEAN_BATCH_LINGER_SEC = 1.0                      # never hold a reading longer than this
+
+# CLEAN payload encoding. RAW input may be JSON or the compact binary format (wire.py) either way.
+CLEAN_WIRE_FORMAT   = "json"                      # "binary" only when every CLEAN consumer decodes it (Firehose/Athena need JSON)
+
+# QoS1 duplicate suppression on (device_id, ts), checked before any parsing/validation
+DEDUP               = True
+DEDUP_WINDOW_SEC    = 3600                        # duplicates are caught up to this far behind a device's newest ts
+DEDUP_PER_DEVICE    = 2048                        # memory cap per device (an hour of readings every 2 s)
+DEDUP_TTL_SEC       = 3600                        # forget devices idle for this long
+
+# Rollups: per-device min/max/mean/count per tumbling window, published to their own topic when a window closes
+ROLLUP_TOPIC        = None                        # None = off; e.g. "sensors/rollup"
+ROLLUP_WINDOWS_SEC  = (60, 3600)                  # minute and hour summaries
+ROLLUP_LATENESS_SEC = 30                          # readings up to this far behind a device's newest ts still count
+ROLLUP_IDLE_SEC     = 120                         # a device silent this long (wall clock) gets its open windows closed
+ROLLUP_MAX_FUTURE_SEC = 300                       # readings stamped further ahead of the wall clock are dropped
+
+# Instrumentation: stage timing histograms, counters, in-flight publishes, queue depth
+METRICS_MODE         = "low"                      # "off", "low" (counters + 1-in-N stage timing) or "full" (time every message)
+METRICS_SAMPLE_EVERY = 64                         # low mode: time 1 message in this many
+METRICS_PORT         = None                       # e.g. 9108 → http://127.0.0.1:9108/metrics (Prometheus) and /metrics.json
+METRICS_SNAPSHOT_SEC = 60                         # log a JSON metrics snapshot this often (0 = never)
+
+# Per-message logging ("rx", "clean", "drop" events) is sampled and rate-limited
+LOG_SAMPLE_EVERY    = 100                         # log 1 event in N of each kind (1 = every message, like the old prints)
+LOG_MAX_PER_SEC     = 5                           # and at most this many lines per second per kind
 # ===========================
 
 
@@ -41,28 +97,115 @@ QOS_LEVEL    = mqtt.QoS.AT_LEAST_ONCE             # Ensures ACK Flag is recieved
 # ===========================
 # Build secure MQTT connection (mTLS)
 # ===========================
-elg = io.EventLoopGroup(1)                        # One background thread to handle all MQTT/TLS networking
-hr  = io.DefaultHostResolver(elg)                 # DNS resolver to turn the AWS endpoint hostname into an IP
-cb  = io.ClientBootstrap(elg, hr)                # Bootstrap = uses our event threat + DNS for MQTT/TLS
+client = None     # mqtt_client.MqttClient, set by main(); handle() publishes through it
+pipeline = None   # ShardedPipeline when PIPELINE_WORKERS > 0, ProcessShardPool when PROCESS_WORKERS > 0
+batcher = None    # BatchingPublisher when CLEAN_BATCH_MAX_COUNT > 0
+rollup = None     # RollupAggregator when ROLLUP_TOPIC is set
+metrics = Metrics(mode=METRICS_MODE, sample_every=METRICS_SAMPLE_EVERY) if METRICS_MODE != "off" else None
+slog = SampledLogger(logging.getLogger("edge"), sample_every=LOG_SAMPLE_EVERY, max_per_sec=LOG_MAX_PER_SEC)
+dedup = DedupIndex(window_sec=DEDUP_WINDOW_SEC, per_device=DEDUP_PER_DEVICE, ttl_sec=DEDUP_TTL_SEC) if DEDUP else None
 
-conn_kwargs = dict(
-    endpoint=ENDPOINT,                 # My AWS IoT device data endpoint
-    cert_filepath=PATH_TO_CERT,        # Device certificate (.crt)
-    pri_key_filepath=PATH_TO_KEY,      # Matching private key (.key) — keep secret all the time!
-    ca_filepath=PATH_TO_ROOT,          # AmazonRootCA1.pem
-    client_bootstrap=cb,
-    client_id=CLIENT_ID,               # Unique client ID
-    clean_session=True,                # Fresh MQTT session
-    keep_alive_secs=30,                # Ping interval to keep connection alive
-)
 
-conn = mqtt_connection_builder.mtls_from_path(**conn_kwargs) # Builds a connection with TLS Certificates provided
+def build_connection():
+    """Build (but do not connect) the mTLS MQTT client from the constants above (see mqtt_client.py)."""
+    return mtls_client(ENDPOINT, PATH_TO_CERT, PATH_TO_KEY, PATH_TO_ROOT, CLIENT_ID, qos=QOS_LEVEL,
+                       max_in_flight=PUBLISH_MAX_IN_FLIGHT, max_queued=PUBLISH_MAX_QUEUED,
+                       target_ack_sec=PUBLISH_TARGET_ACK_SEC)
 
 
 # ===========================
 # Message handler (RAW → CLEAN)
-# Keep it lightweight; heavy work should be offloaded to a worker thread/queue.
+# Keep it lightweight; heavy work is offloaded to worker threads when PIPELINE_WORKERS > 0.
 # ===========================
+def handle(topic, payload, store=None):
+    """
+    Validate, smooth, publish: the actual RAW → CLEAN work for one message.
+
+    Runs inside the callback, or on a pipeline worker with that worker's own
+    WindowStore (`store`). None means the module-wide store.
+
+    Duplicates are checked per reading, after the batch is split, and a key is
+    only remembered once its reading was processed. A device's readings are
+    handled one after another (same worker), so a redelivery is always checked
+    after its original has finished.
+    """
+    # Preview first 80 bytes to avoid noisy logs (sampled: a log line costs more than the processing)
+    if slog.sample("rx"):
+        slog.emit("rx", topic=topic, preview=payload[:40].hex() if wire.is_binary(payload)
+                  else payload[:80].decode("utf-8", "replace"))
+
+    for raw in split_batch(payload):          # a batched RAW payload holds several readings
+        key = None
+        if dedup is not None:
+            key = reading_key(raw)
+            if key is not None and dedup.seen(*key):
+                if metrics is not None:
+                    metrics.duplicates += 1
+                continue                      # QoS1 replay: skip validation, smoothing and republish
+        if metrics is not None and metrics.should_time():
+            ok, res = process_bytes_staged(raw, store, metrics.observe_ns)   # same result, plus stage timings
+        else:
+            ok, res = process_bytes(raw, store) # validates the raw bytes, smooths, and returns the CLEAN JSON already encoded
+        if ok and key is not None:
+            dedup.remember(*key)              # only now: a rejected delivery does not hide its redelivery
+        publish_result(ok, res)
+
+
+def publish_result(ok, res):
+    """Publish a CLEAN payload, or log why the message was dropped (also the process pool's result callback)."""
+    if ok:
+        out = res
+        if CLEAN_WIRE_FORMAT == "binary":
+            out = wire.encode_clean(from_json(res)) or res           # JSON if binary cannot carry it exactly
+        if batcher is not None:
+            batcher.add(out)                                         # published later as part of a batch
+        else:
+            future = client.publish(CLEAN_TOPIC, out)                # queued if the in-flight window is full; never blocks
+            if metrics is not None:
+                metrics.track_publish(future)                        # in-flight count + sampled PUBACK latency
+        if rollup is not None:
+            rollup.add_clean(res)                                    # may publish minute/hour summaries
+        if metrics is not None:
+            metrics.clean += 1
+        if slog.sample("clean"):
+            slog.emit("clean", payload=res.decode("utf-8", "replace"))
+    else:
+        # Validation failed; count it by error type and (sampled) log why
+        if metrics is not None:
+            metrics.drop(res)
+        if slog.sample("drop"):
+            slog.emit("drop", logging.WARNING, reason=drop_reason(res), error=res[:300])
+
+
+def _wait_for_window():
+    """
+    Backpressure for pipeline/pool threads: hold off while the publish window is full (never on the SDK thread).
+
+    Only worth it while online - offline the window cannot drain, so publishes go to the
+    client's bounded queue instead. The SDK thread never blocks on the pipeline (submit()
+    drops on overflow), so the PUBACKs this waits for can always arrive.
+    """
+    if not client.online:
+        return
+    if not client.wait_for_capacity(PUBLISH_BACKPRESSURE_WAIT_SEC) and slog.sample("backpressure"):
+        slog.emit("backpressure", logging.WARNING, **client.snapshot())
+
+
+def handle_on_worker(topic, payload, store):
+    """ShardedPipeline handler: `handle()` after waiting for publish capacity (a full window backs up the queues)."""
+    _wait_for_window()
+    handle(topic, payload, store)
+
+
+def publish_result_from_pool(ok, res):
+    """ProcessShardPool result callback: `publish_result()` with backpressure on the result thread."""
+    if ok:
+        if dedup is not None:
+            dedup.remember_payload(res)       # the CLEAN result carries the same (device_id, ts) key
+        _wait_for_window()
+    publish_result(ok, res)
+
+
 def on_msg(topic, payload, dup, qos, retain, **kwargs):
     """
     MQTT message callback: handle RAW messages, clean them, and republish to CLEAN.
@@ -72,7 +215,7 @@ def on_msg(topic, payload, dup, qos, retain, **kwargs):
     topic : str
         Topic the message arrived on (e.g., "sensors/raw").
     payload : bytes
-        Message body in bytes (JSON text encoded as UTF-8).
+        Message body in bytes (JSON text encoded as UTF-8, or the compact binary format from wire.py).
         MQTT Format.
     dup : bool
         Duplicate delivery flag (MQTT QoS1 may deliver twice).
@@ -88,54 +231,129 @@ def on_msg(topic, payload, dup, qos, retain, **kwargs):
 
     Behavior
     --------
-    - Decode the payload, validate/transform via `process()`.
-    - If valid, convert to JSON and publish to CLEAN_TOPIC with QOS_LEVEL.
-    - If invalid, log the reason and skip publishing.
+    - Redeliveries of an already processed (device_id, ts) are dropped per reading (counted in
+      `dedup.suppressed`): in `handle()`, or here before submitting to the process pool. With the
+      pool a key is remembered only when its result comes back, so a redelivery arriving while the
+      original is still in a worker (a few ms) is processed twice.
+    - Pipeline mode: only enqueue (topic, payload); a worker calls `handle()`.
+    - Otherwise call `handle()` right here:
+      validate/transform the raw bytes via `process_bytes()` (fast path, Pydantic fallback),
+      publish the ready-made CLEAN JSON bytes to CLEAN_TOPIC with QOS_LEVEL,
+      or log the reason and skip publishing if invalid.
     - Any unexpected exception is caught so the network thread stays alive.
     """
     try:
-        # Preview first 80 bytes to avoid noisy logs
-        print("RX on", topic, ":", payload[:80], "…") #Small Preview for the raw topic + the first 80 bytes of our payload(MQTT message in bytes)
-
-        ok, res = process(payload.decode("utf-8")) # Decoding the payload back to JSON Format Using JFT-8 
-                                                    # then passing it to the process function for smoothing and validation
-
-       # Goal: turn `res` into a normal Python dict we can json.dumps()
-
-        if ok:
-            body = res.model_dump() #converts pydantic model back to a plain dictonary for MQTT publishing format
-            payload_out = json.dumps(body) #converts the python dictonary into a JSON 
-            conn.publish(topic=CLEAN_TOPIC, payload=payload_out, qos=QOS_LEVEL) # publishes the JSON into the new Topic
-            print("→ CLEAN:", body)
+        if metrics is not None:
+            metrics.rx += 1
+        if isinstance(pipeline, ProcessShardPool):
+            # Split here to check every reading (submit() also splits, for sharding)
+            for raw in split_batch(payload) if dedup is not None else (payload,):
+                if dedup is not None and dedup.is_duplicate(raw):
+                    if metrics is not None:
+                        metrics.duplicates += 1
+                    continue
+                pipeline.submit(topic, raw)
+        elif pipeline is not None:
+            pipeline.submit(topic, payload)   # cheap: shard by device_id and enqueue
         else:
-            # Validation failed; log why and drop the message
-            print("DROP:", res)
+            handle(topic, payload)
 
     except Exception as e:
         # Never let a bad message crash the networking callback thread
-        print("Process error:", repr(e))
+        if metrics is not None:
+            metrics.errors += 1
+        if slog.sample("error"):
+            slog.emit("error", logging.ERROR, error=repr(e))
 
 
 
 # ===========================
 # Connect, subscribe, and idle (callbacks do the work)
 # ===========================
-print("Connecting to AWS IoT…") 
-conn.connect().result() #creates a secure connection to the AWS IoT
-print("Connected. Subscribing to", RAW_TOPIC)
-
-sub_future, _ = conn.subscribe(       #Ignoring the second variable which is packetID not relevant for our project
-    topic=RAW_TOPIC,  #the raw Topic you want to listen to, in our case sensors/raw
-    qos=QOS_LEVEL,    #delievery level for the incoming message (I have set QoS equal to 1 )
-    callback=on_msg   #function to run everytime a message arrives from the sensors/raw (raw topic) to process and publishes it to sensors/clean(clean topic)
-)
-sub_result = sub_future.result()  # blocks until SUBACK arrives, confirms that the you have subscribed on the topic
-print("Subscribed OK to", RAW_TOPIC, "with qos", sub_result.get('qos')) 
-
-try:
-    while True:
-        time.sleep(1)  # keep process alive; all work happens in callbacks
-except KeyboardInterrupt:
-    print("\nDisconnecting…")
-    conn.disconnect().result()
-    print("Disconnected.")
+def publish_clean_batch(payload):
+    """BatchingPublisher callback: one CLEAN batch publish."""
+    future = client.publish(CLEAN_TOPIC, payload)
+    if metrics is not None:
+        metrics.track_publish(future)
+
+
+def main():
+    global client, pipeline, batcher, rollup
+    if not logging.getLogger().handlers:
+        logging.basicConfig(level=logging.INFO, format="%(message)s")   # sampled JSON event lines
+    client = build_connection()
+    if ROLLUP_TOPIC:
+        rollup = RollupAggregator(lambda p: client.publish(ROLLUP_TOPIC, p),
+                                  windows_sec=ROLLUP_WINDOWS_SEC, allowed_lateness_sec=ROLLUP_LATENESS_SEC,
+                                  idle_timeout_sec=ROLLUP_IDLE_SEC, max_future_sec=ROLLUP_MAX_FUTURE_SEC)
+    if CLEAN_BATCH_MAX_COUNT > 0:
+        batcher = BatchingPublisher(publish_clean_batch,
+                                    max_count=CLEAN_BATCH_MAX_COUNT, max_bytes=CLEAN_BATCH_MAX_BYTES,
+                                    linger_sec=CLEAN_BATCH_LINGER_SEC,
+                                    pack=pack_wire_batch if CLEAN_WIRE_FORMAT == "binary" else pack_json_batch).start()
+    if PROCESS_WORKERS > 0:
+        pipeline = ProcessShardPool(publish_result_from_pool, workers=PROCESS_WORKERS, state_dir=STATE_DIR).start()
+        print(f"Multi-core mode: {PROCESS_WORKERS} worker processes, state in {STATE_DIR}")
+    elif PIPELINE_WORKERS > 0:
+        if PIPELINE_OVERFLOW == "block":
+            raise SystemExit('PIPELINE_OVERFLOW = "block" would stall the MQTT thread; use "drop_oldest" or "drop_newest"')
+        pipeline = ShardedPipeline(handle_on_worker, workers=PIPELINE_WORKERS,
+                                   queue_size=PIPELINE_QUEUE_SIZE, overflow=PIPELINE_OVERFLOW,
+                                   store_factory=new_window_store).start()
+        print(f"Pipeline mode: {PIPELINE_WORKERS} workers, queue {PIPELINE_QUEUE_SIZE}, overflow={PIPELINE_OVERFLOW}")
+
+    server = None
+    if metrics is not None:
+        if pipeline is not None and hasattr(pipeline, "depth"):
+            metrics.gauge("queue_depth", pipeline.depth)
+        if pipeline is not None:
+            metrics.gauge("pipeline_dropped", lambda: pipeline.dropped)  # worker queue overflow
+        metrics.gauge("publish_in_flight", lambda: client.in_flight)     # exact, from the flow-control window
+        metrics.gauge("publish_window", lambda: client.window)
+        metrics.gauge("publish_queued", lambda: client.queued)
+        metrics.gauge("publish_dropped", lambda: client.dropped)
+        if METRICS_PORT:
+            server = MetricsServer(metrics, port=METRICS_PORT).start()
+            print(f"Metrics on http://127.0.0.1:{server.port}/metrics")
+
+    print("Connecting to AWS IoT…") 
+    session_present = client.connect() #creates a secure connection to the AWS IoT, retrying with jittered backoff
+    print("Connected (session resumed)." if session_present else "Connected.", "Subscribing to", RAW_TOPIC)
+
+    sub_future = client.subscribe(  # remembered by the client and re-sent if the broker loses the session
+        RAW_TOPIC,  #the raw Topic you want to listen to, in our case sensors/raw
+        on_msg      #function to run everytime a message arrives from the sensors/raw (raw topic) to process and publishes it to sensors/clean(clean topic)
+    )               # QoS = QOS_LEVEL (set on the client)
+    sub_result = sub_future.result()  # blocks until SUBACK arrives, confirms that the you have subscribed on the topic
+    print("Subscribed OK to", RAW_TOPIC, "with qos", sub_result.get('qos')) 
+
+    last_snapshot = time.monotonic()
+    try:
+        while True:
+            time.sleep(1)  # keep process alive; all work happens in callbacks
+            if rollup is not None:
+                rollup.tick()  # close windows of devices that went quiet
+            if metrics is not None and METRICS_SNAPSHOT_SEC and time.monotonic() - last_snapshot >= METRICS_SNAPSHOT_SEC:
+                slog.emit("metrics", **metrics.snapshot())
+                last_snapshot = time.monotonic()
+    except KeyboardInterrupt:
+        print("\nDisconnecting…")
+        if pipeline is not None:
+            pipeline.stop(timeout=10)   # drain queued messages before closing the connection
+        if batcher is not None:
+            batcher.stop()              # publish the last partial batch
+        if rollup is not None:
+            rollup.flush()              # publish the open (partial) windows
+        client.disconnect()             # waits (bounded) for queued / unacknowledged publishes first
+        print("publish:", client.snapshot())
+        if server is not None:
+            server.stop()
+        if metrics is not None:
+            slog.emit("metrics", **metrics.snapshot())
+        if dedup is not None:
+            print(f"Duplicates suppressed: {dedup.suppressed} of {dedup.checked}")
+        print("Disconnected.")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,251 @@
+"""
+live_plot.py
+------------
+High-rate live plot engine for plot_clean_simple_constants.py.
+
+Three pieces keep the cost of a frame constant, no matter how many points
+are in the window:
+
+1) `RingBuffer` - preallocated NumPy arrays per device. The MQTT thread is
+   the only writer; it stores a sample and then bumps `count`. The plot
+   thread reads `count`, copies, reads `count` again and throws away any
+   slot the writer could have overwritten meanwhile. No lock, no deque → list.
+
+2) `minmax_decimate` - at most one (min, max) pair per horizontal pixel, so
+   a 1-million-point window draws ~2 x width vertices, and spikes survive.
+
+3) `LivePlot` - blitting. The static background (axes, ticks, legend) is
+   rendered once and cached; a frame only restores it and redraws the lines.
+   The x axis is fixed to [-window, 0] seconds; the y axis only changes (one
+   full redraw) when data leaves the current limits.
+
+Headless benchmark (Agg backend, writes a PNG of the last frame):
+
+    python live_plot.py --devices 4 --rate 500 --window 180 --frames 50 --png frame.png
+"""
+
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class RingBuffer:
+    """Fixed-size time/temperature/humidity ring for ONE device (single writer, many readers)."""
+
+    def __init__(self, capacity: int):
+        self.capacity = capacity
+        self.t = np.zeros(capacity, dtype=np.float64)
+        self.temp = np.zeros(capacity, dtype=np.float64)
+        self.hum = np.zeros(capacity, dtype=np.float64)
+        self.count = 0                       # samples ever written; published last (the handoff)
+
+    def append(self, t: float, temp: float, hum: float) -> None:
+        """Writer side (MQTT thread only)."""
+        i = self.count % self.capacity
+        self.t[i] = t
+        self.temp[i] = temp
+        self.hum[i] = hum
+        self.count += 1                      # readers only look at slots below this
+
+    def snapshot(self, since: float) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+        """Reader side: chronological copies of the samples with t >= since."""
+        end = self.count
+        cap = self.capacity
+        start = max(end - cap, 0)
+        split = end % cap
+        if end <= cap:                       # not wrapped yet: one contiguous slice
+            t, temp, hum = self.t[:end].copy(), self.temp[:end].copy(), self.hum[:end].copy()
+        else:                                # oldest part is [split:], newest is [:split]
+            t = np.concatenate((self.t[split:], self.t[:split]))
+            temp = np.concatenate((self.temp[split:], self.temp[:split]))
+            hum = np.concatenate((self.hum[split:], self.hum[:split]))
+        # Slots the writer may have overwritten while we were copying are no longer trustworthy:
+        # every sample below count - capacity, plus the one at count - capacity, whose slot the
+        # writer may be filling right now (it bumps count only after the write).
+        overwritten = self.count - self.capacity + 1 - start
+        if overwritten > 0:
+            t, temp, hum = t[overwritten:], temp[overwritten:], hum[overwritten:]
+        keep = np.searchsorted(t, since, side="left")   # t is increasing (receive time)
+        return t[keep:], temp[keep:], hum[keep:]
+
+
+def minmax_decimate(x: np.ndarray, y: np.ndarray, x0: float, x1: float, pixels: int) -> Tuple[np.ndarray, np.ndarray]:
+    """
+    Reduce (x, y) to at most 2 points per pixel column between x0 and x1.
+
+    Each non-empty column becomes a vertical segment from its min to its max,
+    which looks identical to drawing every point at that resolution.
+    """
+    if len(x) <= 2 * pixels:
+        return x, y
+    edges = np.linspace(x0, x1, pixels + 1)
+    starts = np.searchsorted(x, edges[:-1], side="left")
+    ends = np.searchsorted(x, edges[1:], side="left")
+    ends[-1] = len(x)
+    nonempty = starts < ends
+    starts = starts[nonempty]
+    lo = np.minimum.reduceat(y, starts)
+    hi = np.maximum.reduceat(y, starts)
+    # reduceat runs up to the next start; the last column runs to the end - exactly our bins.
+    mid = 0.5 * (edges[:-1] + edges[1:])[nonempty]
+    xs = np.repeat(mid, 2)
+    ys = np.empty(2 * len(lo))
+    ys[0::2] = lo
+    ys[1::2] = hi
+    return xs, ys
+
+
+class LivePlot:
+    """
+    Blitted temperature/humidity plot over per-device ring buffers.
+
+    Args:
+        fig, ax:     matplotlib figure/axes to draw into.
+        window_sec:  visible history (x axis is "seconds ago", -window..0).
+        capacity:    ring size per device.
+        title:       axes title.
+    """
+
+    def __init__(self, fig, ax, window_sec: float = 180, capacity: int = 65536, title: str = ""):
+        self.fig = fig
+        self.ax = ax
+        self.window_sec = window_sec
+        self.capacity = capacity
+        self.rings: Dict[str, RingBuffer] = {}
+        self._lines: Dict[str, tuple] = {}
+        self._background = None
+        self._ylim = (0.0, 1.0)
+        self.frames = 0
+        self.full_redraws = 0
+
+        ax.set_xlim(-window_sec, 0)
+        ax.set_ylim(*self._ylim)
+        ax.set_title(title)
+        ax.set_xlabel(f"Time (last ~{window_sec}s, seconds ago)")
+        fig.canvas.mpl_connect("draw_event", self._on_draw)
+
+    # ---- writer side (MQTT thread) ---------------------------------------------------
+    def add(self, device_id: str, t: float, temp: float, hum: float) -> None:
+        ring = self.rings.get(device_id)
+        if ring is None:
+            ring = RingBuffer(self.capacity)
+            self.rings[device_id] = ring     # a single dict store: atomic for the reader
+        ring.append(t, temp, hum)
+
+    # ---- reader side (GUI / render thread) ---------------------------------------------
+    def _ensure_lines(self) -> bool:
+        """Create line artists for new devices; True if the figure needs a full redraw."""
+        added = False
+        for dev in list(self.rings):
+            if dev not in self._lines:
+                (lt,) = self.ax.plot([], [], animated=True)
+                (lh,) = self.ax.plot([], [], animated=True)
+                self._lines[dev] = (lt, lh)
+                added = True
+        if added:
+            # One device keeps the plain labels; several get the device id appended
+            many = len(self._lines) > 1
+            for dev, (lt, lh) in self._lines.items():
+                suffix = f" {dev}" if many else ""
+                lt.set_label(f"temperature (°C){suffix}")
+                lh.set_label(f"humidity (%){suffix}")
+            self.ax.legend(loc="upper left")
+        return added
+
+    def _on_draw(self, _event) -> None:
+        """After any full draw (resize, first show, y rescale) cache the new background."""
+        canvas = self.fig.canvas
+        self._background = canvas.copy_from_bbox(self.fig.bbox)
+        for lt, lh in self._lines.values():
+            self.ax.draw_artist(lt)
+            self.ax.draw_artist(lh)
+
+    def update(self, now: Optional[float] = None) -> None:
+        """Render one frame."""
+        if now is None:
+            now = time.time()
+        since = now - self.window_sec
+        width = max(int(self.ax.bbox.width), 1)
+        need_full = self._ensure_lines()
+
+        lo, hi = np.inf, -np.inf
+        for dev, ring in list(self.rings.items()):
+            t, temp, hum = ring.snapshot(since)
+            lt, lh = self._lines[dev]
+            if not len(t):
+                lt.set_data([], [])
+                lh.set_data([], [])
+                continue
+            x = t - now
+            xt, yt = minmax_decimate(x, temp, -self.window_sec, 0.0, width)
+            xh, yh = minmax_decimate(x, hum, -self.window_sec, 0.0, width)
+            lt.set_data(xt, yt)
+            lh.set_data(xh, yh)
+            lo = min(lo, yt.min(), yh.min())
+            hi = max(hi, yt.max(), yh.max())
+
+        if lo <= hi and (lo < self._ylim[0] or hi > self._ylim[1]):
+            pad = max(1.0, 0.1 * (hi - lo))
+            self._ylim = (lo - pad, hi + pad)
+            self.ax.set_ylim(*self._ylim)
+            need_full = True
+
+        canvas = self.fig.canvas
+        if need_full or self._background is None:
+            self.full_redraws += 1
+            canvas.draw()                     # triggers _on_draw → new background, lines drawn
+        else:
+            canvas.restore_region(self._background)
+            for lt, lh in self._lines.values():
+                self.ax.draw_artist(lt)
+                self.ax.draw_artist(lh)
+            canvas.blit(self.fig.bbox)
+        self.frames += 1
+
+
+# =============================================================================
+# Headless benchmark (Agg)
+# =============================================================================
+def _bench(devices: int, rate: float, window: float, frames: int, png: Optional[str]) -> None:
+    import matplotlib
+    matplotlib.use("Agg")
+    import matplotlib.pyplot as plt
+
+    fig, ax = plt.subplots(figsize=(8, 4), dpi=100)
+    lp = LivePlot(fig, ax, window_sec=window, capacity=int(rate * window) + 1, title="live_plot benchmark")
+    now = time.time()
+    n = int(rate * window)
+    t = now - window + np.arange(n) / rate
+    rng = np.random.default_rng(0)
+    for d in range(devices):
+        temp = 22 + d + np.cumsum(rng.normal(0, 0.02, n))
+        hum = 40 + 3 * d + np.cumsum(rng.normal(0, 0.05, n))
+        for i in range(n):
+            lp.add(f"dev-{d}", t[i], temp[i], hum[i])
+
+    lp.update(now)                            # first frame: full draw + background cache
+    times: List[float] = []
+    for _ in range(frames):
+        start = time.perf_counter()
+        lp.update(now)
+        times.append(time.perf_counter() - start)
+    arr = np.array(times) * 1e3
+    print(f"devices={devices} points/device={n} frames={frames} full_redraws={lp.full_redraws}")
+    print(f"frame time: p50={np.percentile(arr, 50):.2f} ms  p99={np.percentile(arr, 99):.2f} ms")
+    if png:
+        fig.savefig(png)
+        print("wrote", png)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    ap = argparse.ArgumentParser(description="Headless (Agg) frame-time benchmark for the live plot engine")
+    ap.add_argument("--devices", type=int, default=4)
+    ap.add_argument("--rate", type=float, default=500.0, help="samples per second per device")
+    ap.add_argument("--window", type=float, default=180.0, help="WINDOW_SEC")
+    ap.add_argument("--frames", type=int, default=50)
+    ap.add_argument("--png", default=None, help="save the last frame to this PNG")
+    args = ap.parse_args()
+    _bench(args.devices, args.rate, args.window, args.frames, args.png)
@@ -0,0 +1,114 @@
+"""
+loadgen.py
+----------
+Synthetic RAW load for benchmarks and replay tests.
+
+`generate()` yields (kind, payload) for a fleet of devices, mixing in the
+things a real feed contains:
+
+    valid         a normal DHT11 reading (ts advances by `period` per device)
+    out_of_range  well-formed JSON that fails validation (e.g. 200 °C, 130 %)
+    malformed     broken JSON, missing fields, wrong types
+    duplicate     byte-identical redelivery of one of the device's recent payloads (QoS1)
+    out_of_order  a valid reading whose ts is older than the device's newest one
+
+Payloads are UTF-8 JSON bytes exactly as publisher_dht11_to_aws_iot.py sends them.
+The stream is deterministic for a given seed.
+
+Run (writes JSONL that replay.py can read):
+    python loadgen.py --messages 1000000 --devices 200 --out raw.jsonl.gz
+"""
+
+import argparse
+import gzip
+import json
+import random
+from collections import deque
+from typing import Deque, Dict, Iterator, List, Optional, Tuple
+
+DEFAULT_MIX = {
+    "valid": 0.90,
+    "out_of_range": 0.03,
+    "malformed": 0.02,
+    "duplicate": 0.03,
+    "out_of_order": 0.02,
+}
+
+_MALFORMED = [
+    b'{"device_id": "rpi-sensor-000", "ts": 1762817460, "temperature": 26.7',     # truncated
+    b'{"device_id": "rpi-sensor-000", "ts": 1762817460, "humidity": 9.0}',        # missing temperature
+    b'{"device_id": "rpi-sensor-000", "ts": "soon", "temperature": 26.7, "humidity": 9.0}',
+    b'not json at all',
+    b'',
+]
+
+
+def _reading(device_id: str, ts: int, temperature: float, humidity: float) -> bytes:
+    return json.dumps({"device_id": device_id, "ts": ts, "temperature": temperature,
+                       "humidity": humidity}).encode("utf-8")
+
+
+def generate(messages: int, devices: int = 50, mix: Optional[Dict[str, float]] = None, period: int = 2,
+             t0: int = 1762817460, seed: int = 7) -> Iterator[Tuple[str, bytes]]:
+    """
+    Yield `messages` (kind, payload) pairs, round-robin over `devices`.
+
+    Args:
+        mix:    kind -> weight (see DEFAULT_MIX); weights need not sum to 1.
+        period: seconds between a device's readings.
+    """
+    mix = DEFAULT_MIX if mix is None else mix
+    kinds = list(mix)
+    weights = [mix[k] for k in kinds]
+    rnd = random.Random(seed)
+    names = [f"rpi-sensor-{i:03d}" for i in range(devices)]
+    next_ts = [t0] * devices
+    temp = [rnd.uniform(18, 30) for _ in range(devices)]
+    recent: List[Deque[bytes]] = [deque(maxlen=16) for _ in range(devices)]
+
+    for i in range(messages):
+        d = i % devices
+        kind = rnd.choices(kinds, weights)[0]
+        if kind == "duplicate" and not recent[d]:
+            kind = "valid"
+        if kind == "out_of_order" and next_ts[d] - t0 < 4 * period:
+            kind = "valid"
+
+        if kind == "valid":
+            temp[d] = min(max(temp[d] + rnd.gauss(0, 0.2), 0.0), 50.0)
+            payload = _reading(names[d], next_ts[d], round(temp[d], 1), round(rnd.uniform(20, 60), 1))
+            next_ts[d] += period
+            recent[d].append(payload)
+        elif kind == "out_of_range":
+            if rnd.random() < 0.5:
+                payload = _reading(names[d], next_ts[d], rnd.choice((-60.0, 200.0)), 40.0)
+            else:
+                payload = _reading(names[d], next_ts[d], 22.0, rnd.choice((-5.0, 130.0)))
+            next_ts[d] += period
+        elif kind == "malformed":
+            payload = rnd.choice(_MALFORMED)
+        elif kind == "duplicate":
+            payload = rnd.choice(recent[d])
+        elif kind == "out_of_order":
+            back = rnd.randint(1, 3) * period       # -1 below keeps it off the period grid: late, not a duplicate ts
+            payload = _reading(names[d], next_ts[d] - back - 1, round(temp[d], 1), 40.0)
+        else:
+            raise ValueError(f"unknown payload kind {kind!r}")
+        yield kind, payload
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--messages", type=int, default=100_000)
+    ap.add_argument("--devices", type=int, default=50)
+    ap.add_argument("--seed", type=int, default=7)
+    ap.add_argument("--out", required=True, help="JSONL output (.gz ok)")
+    args = ap.parse_args()
+
+    with (gzip.open(args.out, "wb") if args.out.endswith(".gz") else open(args.out, "wb")) as f:
+        for _kind, payload in generate(args.messages, args.devices, seed=args.seed):
+            f.write(payload.replace(b"\n", b" ") + b"\n")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,248 @@
+"""
+metrics.py
+----------
+Hot-path instrumentation for the edge processor: stage timing histograms,
+counters, gauges, a Prometheus-style HTTP endpoint and sampled,
+rate-limited structured logging.
+
+    Metrics         registry. mode="low": counters on every message, stage timing
+                    and ack latency on 1 message in `sample_every` (well under 1 µs
+                    per message on average). mode="full": every message timed.
+    MetricsServer   GET /metrics (Prometheus text format) and /metrics.json.
+    SampledLogger   replaces per-message print(): log 1 in N events of a kind, at
+                    most `max_per_sec` per kind, as one JSON object per line.
+
+Stage histograms: decode, validate, smooth, serialize (see
+models_and_processor.process_bytes_staged) and publish_ack (publish -> PUBACK).
+"""
+
+import json
+import logging
+import re
+import threading
+import time
+from bisect import bisect_left
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional, Tuple
+
+STAGES = ("decode", "validate", "smooth", "serialize", "publish_ack")
+
+# Histogram bucket upper bounds in seconds: 1 µs .. 10 s, 1-2.5-5 steps
+DEFAULT_BUCKETS = tuple(m * 10.0 ** e for e in range(-6, 1) for m in (1.0, 2.5, 5.0)) + (10.0,)
+
+_ERROR_TYPE_RE = re.compile(r"\[type=(\w+)")
+
+
+def drop_reason(error: str) -> str:
+    """Short label for a drop: the Pydantic error type ("less_than_equal", "json_invalid", ...) or the prefix."""
+    m = _ERROR_TYPE_RE.search(error)
+    if m:
+        return m.group(1)
+    return error.split(":", 1)[0] or "unknown"
+
+
+class Histogram:
+    """Fixed-bucket histogram (Prometheus semantics: buckets are upper bounds, exported cumulatively)."""
+    __slots__ = ("bounds", "counts", "sum", "count")
+
+    def __init__(self, bounds: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.bounds = bounds
+        self.counts = [0] * (len(bounds) + 1)       # last slot = +Inf
+        self.sum = 0.0
+        self.count = 0
+
+    def observe(self, seconds: float) -> None:
+        self.counts[bisect_left(self.bounds, seconds)] += 1
+        self.sum += seconds
+        self.count += 1
+
+    def quantile(self, q: float) -> Optional[float]:
+        """Upper bound of the bucket holding the q-th quantile (None if empty)."""
+        if not self.count:
+            return None
+        rank = q * self.count
+        seen = 0
+        for bound, c in zip(self.bounds + (float("inf"),), self.counts):
+            seen += c
+            if seen >= rank:
+                return bound
+        return float("inf")
+
+
+class Metrics:
+    """
+    Counters, stage histograms and gauges for one edge process.
+
+    Args:
+        mode:         "low" (sampled timing) or "full" (time every message).
+        sample_every: in low mode, time 1 message in this many.
+
+    The hot-path counters are plain attributes (`metrics.rx += 1` is ~30 ns);
+    a lost increment under a rare thread switch is acceptable for monitoring.
+    Publish -> PUBACK latency (`track_publish`) is timed on the sampled publishes
+    only (every one in full mode). The in-flight count is not estimated here: it
+    is MqttClient's exact window count, registered as the `publish_in_flight`
+    gauge, so it does not depend on `sample_every`.
+    """
+
+    COUNTERS = ("rx", "clean", "duplicates", "errors")
+
+    def __init__(self, mode: str = "low", sample_every: int = 64):
+        if mode not in ("low", "full"):
+            raise ValueError("mode must be 'low' or 'full'")
+        self.mode = mode
+        self.sample_every = 1 if mode == "full" else max(1, sample_every)
+        self.histograms: Dict[str, Histogram] = {s: Histogram() for s in STAGES}
+        self.rx = self.clean = self.duplicates = self.errors = 0
+        self.drops: Dict[str, int] = {}
+        self._gauges: Dict[str, Callable[[], float]] = {}
+        self._n = 0
+        self._published = 0
+        self.started = time.time()
+
+    # ---- hot path ----------------------------------------------------------------------
+    def should_time(self) -> bool:
+        """True for the messages that get per-stage timing."""
+        self._n += 1
+        return self._n % self.sample_every == 0
+
+    def observe_ns(self, stage: str, ns: int) -> None:
+        self.histograms[stage].observe(ns * 1e-9)
+
+    def drop(self, error: str) -> None:
+        reason = drop_reason(error)
+        self.drops[reason] = self.drops.get(reason, 0) + 1
+
+    def track_publish(self, future) -> None:
+        """Sampled publishes (all in full mode) are timed until PUBACK (the in-flight count is MqttClient's)."""
+        self._published += 1
+        if self._published % self.sample_every == 0:
+            t0 = time.perf_counter()
+            future.add_done_callback(lambda _f: self.histograms["publish_ack"].observe(time.perf_counter() - t0))
+
+    # ---- read side -----------------------------------------------------------------------
+    def gauge(self, name: str, fn: Callable[[], float]) -> None:
+        """Register a gauge read at scrape time (e.g. queue depth)."""
+        self._gauges[name] = fn
+
+    @property
+    def counters(self) -> Dict[str, int]:
+        return {name: getattr(self, name) for name in self.COUNTERS}
+
+    def snapshot(self) -> Dict[str, object]:
+        gauges = {}
+        for name, fn in list(self._gauges.items()):
+            try:
+                gauges[name] = fn()
+            except Exception:
+                pass
+        stages = {}
+        for s, h in self.histograms.items():
+            stages[s] = {"count": h.count, "sum_sec": h.sum, "p50_sec": h.quantile(0.5), "p99_sec": h.quantile(0.99)}
+        return {"mode": self.mode, "uptime_sec": time.time() - self.started, "counters": dict(self.counters),
+                "drops": dict(self.drops), "gauges": gauges, "stages": stages}
+
+    def render_prometheus(self, prefix: str = "edge") -> str:
+        lines: List[str] = []
+        for name, v in list(self.counters.items()):
+            lines.append(f"# TYPE {prefix}_{name}_total counter")
+            lines.append(f"{prefix}_{name}_total {v}")
+        lines.append(f"# TYPE {prefix}_dropped_total counter")
+        for reason, v in list(self.drops.items()):
+            lines.append(f'{prefix}_dropped_total{{reason="{reason}"}} {v}')
+        snap_gauges = self.snapshot()["gauges"]
+        for name, v in snap_gauges.items():
+            lines.append(f"# TYPE {prefix}_{name} gauge")
+            lines.append(f"{prefix}_{name} {v}")
+        lines.append(f"# TYPE {prefix}_stage_seconds histogram")
+        for stage, h in self.histograms.items():
+            cum = 0
+            for bound, c in zip(h.bounds, h.counts):
+                cum += c
+                lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="{bound:g}"}} {cum}')
+            lines.append(f'{prefix}_stage_seconds_bucket{{stage="{stage}",le="+Inf"}} {h.count}')
+            lines.append(f'{prefix}_stage_seconds_sum{{stage="{stage}"}} {h.sum}')
+            lines.append(f'{prefix}_stage_seconds_count{{stage="{stage}"}} {h.count}')
+        return "\n".join(lines) + "\n"
+
+
+class MetricsServer:
+    """Serve a Metrics registry on http://<host>:<port>/metrics (text) and /metrics.json (daemon thread)."""
+
+    def __init__(self, metrics: Metrics, port: int = 9108, host: str = "127.0.0.1"):
+        registry = metrics
+
+        class _Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                if self.path == "/metrics":
+                    body, ctype = registry.render_prometheus().encode(), "text/plain; version=0.0.4"
+                elif self.path == "/metrics.json":
+                    body, ctype = json.dumps(registry.snapshot()).encode(), "application/json"
+                else:
+                    self.send_error(404)
+                    return
+                self.send_response(200)
+                self.send_header("Content-Type", ctype)
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass                                    # no access log on stderr
+
+        self._server = ThreadingHTTPServer((host, port), _Handler)
+        self.port = self._server.server_address[1]
+        self._thread = threading.Thread(target=self._server.serve_forever, name="metrics-http", daemon=True)
+
+    def start(self) -> "MetricsServer":
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._server.shutdown()
+        self._server.server_close()
+
+
+class SampledLogger:
+    """
+    Structured (one JSON object per line) logging for per-message events.
+
+    Args:
+        logger:       destination (default: logging.getLogger("edge")).
+        sample_every: log 1 event in N of each kind (1 = every event).
+        max_per_sec:  at most this many lines per second per kind (token bucket).
+
+    Usage keeps the cost of a skipped event to one call:
+        if slog.sample("clean"):
+            slog.emit("clean", payload=...)
+    Each line carries `seen` (events of that kind so far), so sampled logs
+    still show volume.
+    """
+
+    def __init__(self, logger: Optional[logging.Logger] = None, sample_every: int = 100,
+                 max_per_sec: float = 5.0, clock: Callable[[], float] = time.monotonic):
+        self.logger = logger or logging.getLogger("edge")
+        self.sample_every = max(1, sample_every)
+        self.max_per_sec = max_per_sec
+        self._clock = clock
+        self._seen: Dict[str, int] = {}
+        self._tokens: Dict[str, Tuple[float, float]] = {}   # kind -> (tokens, last refill)
+
+    def sample(self, kind: str) -> bool:
+        n = self._seen.get(kind, 0) + 1
+        self._seen[kind] = n
+        if n % self.sample_every:
+            return False
+        now = self._clock()
+        tokens, last = self._tokens.get(kind, (self.max_per_sec, now))
+        tokens = min(self.max_per_sec, tokens + (now - last) * self.max_per_sec)
+        if tokens < 1.0:
+            self._tokens[kind] = (tokens, now)
+            return False
+        self._tokens[kind] = (tokens - 1.0, now)
+        return True
+
+    def emit(self, kind: str, level: int = logging.INFO, **fields) -> None:
+        record = {"ts": round(time.time(), 3), "event": kind, "seen": self._seen.get(kind, 0)}
+        record.update(fields)
+        self.logger.log(level, json.dumps(record, default=str))
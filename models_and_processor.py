@@ -7,8 +7,18 @@ and emit a clean, uniform message ready for dashboards and data storage.
 """
 
 from pydantic import BaseModel, Field           # Pydantic is a library used to check if the data is in the right shape and type.yes
-from typing import Literal, Tuple, Union
-from collections import deque
+from pydantic_core import from_json             # the same fast JSON parser Pydantic uses inside model_validate_json
+from typing import Any, Callable, Dict, List, Literal, NamedTuple, Optional, Sequence, Tuple, Union
+from collections import OrderedDict, deque
+from json.encoder import encode_basestring_ascii
+from operator import itemgetter
+import json
+import os
+import time
+
+import numpy as np
+
+import wire
 
 # -----------------------------
 # 1) Schemas (Pydantic models)
@@ -40,21 +50,257 @@ class SensorOut(BaseModel):
     schema_version: str = "1.0"                # Lets dashboard/ETL in the cloud know which schema/version they are using
 
 # -----------------------------
-# 2) Rolling window (5 samples)
+# 2) Rolling window state store (one window per device)
 # -----------------------------
-_window = deque(maxlen=5)  # keep only the last 5 temperature readings for the moving average, 
+class _DeviceWindow:
+    """Rolling window for ONE device: the samples, their timestamps and a running sum."""
+    __slots__ = ("values", "times", "total", "first_ts", "last_seen")
+
+    def __init__(self, maxlen: Optional[int]):
+        self.values = deque(maxlen=maxlen)   # temperatures currently inside the window
+        self.times = deque(maxlen=maxlen)    # matching `ts` values (used by time-based windows)
+        self.total = 0.0                     # running sum of `values` so the average is O(1)
+        self.first_ts = None                 # first `ts` seen, tells time-based windows when they are warm
+        self.last_seen = 0.0                 # clock() of the last update, used for TTL/LRU eviction
+
+
+class WindowStore:
+    """
+    Keyed rolling-window store: one temperature window per `device_id`.
+
+    Each update is O(1): the store keeps a running sum per device and only adds
+    the new sample and subtracts the one falling out of the window.
+
+    Args:
+        maxlen:      number of samples per window (the original 5-sample average).
+                     May be None when `window_sec` is set.
+        window_sec:  optional time-based window; samples with ts <= newest_ts - window_sec are dropped.
+        ttl_sec:     evict devices that have not sent anything for this many seconds.
+        max_devices: keep at most this many devices, evicting the least recently seen (LRU).
+        clock:       time source for TTL/LRU bookkeeping (defaults to time.time).
+        reset_after_sec: restart a device's window when its reading's `ts` is more than this
+                     after the previous one. Event time, so a replay of the same readings
+                     restarts at exactly the same places, however fast it runs.
+
+    Quality is "OK" once a count window is full, or once a time window has seen
+    at least `window_sec` seconds of data; before that it is "WARMUP".
+    """
+
+    def __init__(self, maxlen: Optional[int] = 5, window_sec: Optional[float] = None,
+                 ttl_sec: Optional[float] = None, max_devices: Optional[int] = None,
+                 clock: Callable[[], float] = time.time, reset_after_sec: Optional[float] = None):
+        if maxlen is None and window_sec is None:
+            raise ValueError("WindowStore needs maxlen, window_sec, or both")
+        if maxlen is not None and maxlen < 1:
+            raise ValueError("maxlen must be >= 1")
+        self.maxlen = maxlen
+        self.window_sec = window_sec
+        self.ttl_sec = ttl_sec
+        self.max_devices = max_devices
+        self._clock = clock
+        self.reset_after_sec = reset_after_sec
+        self._devices: "OrderedDict[str, _DeviceWindow]" = OrderedDict()  # oldest-seen device first (LRU order)
+
+    def __len__(self) -> int:
+        return len(self._devices)
+
+    def __contains__(self, device_id: str) -> bool:
+        return device_id in self._devices
+
+    def update(self, device_id: str, value: float, ts: int) -> Tuple[float, bool]:
+        """
+        Push one temperature for `device_id` and return (average, warm).
+
+        `warm` is True when the window is full (count mode) or has covered
+        `window_sec` seconds (time mode) and maps to quality "OK".
+        """
+        now = self._clock()
+        w = self._devices.get(device_id)
+        if w is not None and self.reset_after_sec is not None and w.times and ts - w.times[-1] > self.reset_after_sec:
+            del self._devices[device_id]           # long gap (by ts): start over, like a new device
+            w = None
+        if w is None:
+            w = self._devices[device_id] = _DeviceWindow(self.maxlen)
+            w.first_ts = ts
+        else:
+            self._devices.move_to_end(device_id)   # most recently seen goes to the back
+        w.last_seen = now
+
+        # Work out what leaves the window, then apply the change to the running sum in one step.
+        evicted = 0.0
+        if self.window_sec is not None:
+            cutoff = ts - self.window_sec
+            while w.times and w.times[0] <= cutoff:
+                w.times.popleft()
+                evicted += w.values.popleft()
+            if not w.values:
+                w.total = evicted = 0.0           # window emptied: restart the sum so float error cannot build up
+                w.first_ts = ts                   # and warm up again after a long gap
+        if w.values and len(w.values) == w.values.maxlen:
+            evicted += w.values[0]                # deque(maxlen) drops this sample on append
+        w.values.append(value)
+        w.times.append(ts)
+        w.total += value - evicted
+
+        n = len(w.values)
+        if self.window_sec is not None:
+            warm = ts - w.first_ts >= self.window_sec or n == self.maxlen
+        else:
+            warm = n == self.maxlen
+
+        self._evict(now)
+        return w.total / n, warm
+
+    def update_many(self, device_id: str, values: np.ndarray, ts: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        """
+        Vectorized `update()` for several readings of ONE device, in arrival order.
+
+        Returns (averages, warm) arrays. Count windows are done in one NumPy pass
+        that performs exactly the same float operations as repeated `update()`
+        calls (delta = new - evicted, then a sequential cumulative sum), so the
+        results are bit-for-bit identical. Time windows fall back to `update()`.
+        """
+        if self.window_sec is not None or (self.reset_after_sec is not None and self._has_gap(device_id, ts)):
+            pairs = [self.update(device_id, v, t) for v, t in zip(values.tolist(), ts.tolist())]
+            return (np.array([a for a, _ in pairs], dtype=np.float64),
+                    np.array([w for _, w in pairs], dtype=bool))
+
+        now = self._clock()
+        w = self._devices.get(device_id)
+        if w is None:
+            w = self._devices[device_id] = _DeviceWindow(self.maxlen)
+            w.first_ts = ts[0].item()
+        else:
+            self._devices.move_to_end(device_id)
+        w.last_seen = now
+
+        k = self.maxlen
+        p = len(w.values)
+        ext = np.concatenate((np.fromiter(w.values, dtype=np.float64, count=p), values))
+        pos = np.arange(p, p + len(values))               # where each new sample lands in `ext`
+        out_idx = pos - k                                 # sample that falls out of the window (if >= 0)
+        evicted = np.where(out_idx >= 0, ext[np.maximum(out_idx, 0)], 0.0)
+        totals = np.cumsum(np.concatenate(([w.total], values - evicted)))[1:]  # cumsum is strictly sequential
+        counts = np.minimum(pos + 1, k)
+
+        w.values.extend(values[-k:].tolist())
+        w.times.extend(ts[-k:].tolist())
+        w.total = totals[-1].item()
+
+        self._evict(now)
+        return totals / counts, counts == k
+
+    def _has_gap(self, device_id: str, ts: np.ndarray) -> bool:
+        """True if a batch of one device's readings would restart its window somewhere (reset_after_sec)."""
+        w = self._devices.get(device_id)
+        if w is not None and w.times and ts[0].item() - w.times[-1] > self.reset_after_sec:
+            return True
+        return len(ts) > 1 and bool((np.diff(ts) > self.reset_after_sec).any())
+
+    def _evict(self, now: float) -> None:
+        """Drop idle devices (TTL) and the least recently seen ones beyond `max_devices`."""
+        devices = self._devices
+        if self.ttl_sec is not None:
+            cutoff = now - self.ttl_sec
+            while devices:
+                first = next(iter(devices.values()))
+                if first.last_seen >= cutoff:
+                    break
+                devices.popitem(last=False)
+        if self.max_devices is not None:
+            while len(devices) > self.max_devices:
+                devices.popitem(last=False)
+
+    def evict_idle(self) -> None:
+        """Run TTL/LRU eviction now (e.g. from a timer when traffic is quiet)."""
+        self._evict(self._clock())
+
+    # ---- snapshot / restore so a restart does not send every device back to WARMUP ----
+    def snapshot(self) -> Dict[str, Any]:
+        """Return a JSON-serialisable copy of every device window."""
+        return {
+            "maxlen": self.maxlen,
+            "window_sec": self.window_sec,
+            "devices": {
+                dev: {
+                    "values": list(w.values),
+                    "times": list(w.times),
+                    "total": w.total,
+                    "first_ts": w.first_ts,
+                    "last_seen": w.last_seen,
+                }
+                for dev, w in self._devices.items()
+            },
+        }
+
+    def restore(self, snap: Dict[str, Any]) -> None:
+        """Load windows from `snapshot()` output, replacing the current state."""
+        self._devices.clear()
+        for dev, d in snap.get("devices", {}).items():
+            w = _DeviceWindow(self.maxlen)
+            # If the window got shorter since the snapshot, keep only the newest samples.
+            w.values.extend(d["values"])
+            w.times.extend(d["times"])
+            if len(w.values) == len(d["values"]):
+                w.total = float(d["total"])
+            else:
+                w.total = sum(w.values)
+            w.first_ts = d.get("first_ts")
+            w.last_seen = float(d.get("last_seen", 0.0))
+            self._devices[dev] = w
+
+    def save(self, path: str) -> None:
+        """Write the snapshot to `path` atomically (tmp file + rename)."""
+        tmp = path + ".tmp"
+        with open(tmp, "w", encoding="utf-8") as f:
+            json.dump(self.snapshot(), f)
+        os.replace(tmp, path)
+
+    def load(self, path: str) -> bool:
+        """Restore from a file written by `save()`. Returns False if there is no file yet."""
+        try:
+            with open(path, "r", encoding="utf-8") as f:
+                self.restore(json.load(f))
+        except FileNotFoundError:
+            return False
+        return True
+
+
+WINDOW_LEN = 5                      # keep only the last 5 temperature readings for the moving average
+WINDOW_TTL_SEC = 3600               # a reading more than an hour (by ts) after the previous one starts a fresh window;
+                                    # windows idle that long (wall clock) are also dropped to free memory
+WINDOW_MAX_DEVICES = 100_000        # and never keep more devices than this (least recently seen go first)
+
+
+def new_window_store() -> WindowStore:
+    """
+    A WindowStore with the settings above (the live edge, its workers, the publisher and replay.py).
+
+    Whether a window restarts is decided on event time (reset_after_sec), so a replay gives
+    the same output as the live edge. The wall-clock TTL / LRU only bound memory: a window
+    they drop would have been restarted by its next reading anyway - unless that reading is
+    less than WINDOW_TTL_SEC (by ts) newer but arrives much later, e.g. a store-and-forward
+    backlog after an outage of more than an hour, or more than WINDOW_MAX_DEVICES devices.
+    """
+    return WindowStore(maxlen=WINDOW_LEN, ttl_sec=WINDOW_TTL_SEC, max_devices=WINDOW_MAX_DEVICES,
+                       reset_after_sec=WINDOW_TTL_SEC)
+
+
+_store = new_window_store()         # default store used by process(); one window per device_id
 
 
 # -----------------------------
 # 3) Processor function
 # -----------------------------
-def process(msg_json: str) -> Tuple[bool, Union[SensorOut, str]]:
+def process(msg_json: Union[str, bytes], store: Optional[WindowStore] = None) -> Tuple[bool, Union[SensorOut, str]]:
     """
     Validate, smooth, and reformat a raw DHT11 reading.
 
     Args:
         msg_json: RAW payload as a JSON string, e.g.
-                  '{"device_id":"rpi-sensor-001","ts":1762817460,"temperature":26.7,"humidity":9.0}'
+                  '{"device_id":"rpi-sensor-001","ts":1762817460,"temperature":26.7,"humidity":9.0}',
+                  or the same reading in the compact binary format (wire.py, bytes)
+        store:    rolling-window store to use; defaults to the module-wide `_store`.
 
     Returns:
         (True, SensorOut) on success
@@ -63,14 +309,18 @@ def process(msg_json: str) -> Tuple[bool, Union[SensorOut, str]]:
     """
     # 1) Parse & validate input against SensorIn
     try:
-        raw = SensorIn.model_validate_json(msg_json)   #Validates Input to match the required, returns raw.variablename
+        if isinstance(msg_json, bytes) and wire.is_binary(msg_json):
+            raw = SensorIn.model_validate(_wire_reading(msg_json))   # binary: decode, then the same validation
+        else:
+            raw = SensorIn.model_validate_json(msg_json)   #Validates Input to match the required, returns raw.variablename
     except Exception as e:
         # If it does not match the correct type specified at the beginning of the file throw an error .
         return False, f"schema_error:{e}"
 
-    # 2) Update rolling temperature window and compute average
-    _window.append(raw.temperature)   #Passed from the model_validate_json
-    avg = sum(_window) / len(_window) #computes the average of the last 5 readings
+    # 2) Update this device's rolling temperature window and compute average
+    if store is None:
+        store = _store
+    avg, warm = store.update(raw.device_id, raw.temperature, raw.ts)  # O(1): running sum per device
 
 
     # 3) Emit the CLEAN model (keeps ts as-is to match the publisher)
@@ -80,7 +330,319 @@ def process(msg_json: str) -> Tuple[bool, Union[SensorOut, str]]:
         temperature_c=raw.temperature,
         temperature_avg5_c=round(avg, 2),       # round for nicer dashboards in Amazon Cloud Dashboards (will be used later on in the project)
         humidity_pct=raw.humidity,
-        quality="OK" if len(_window) == _window.maxlen else "WARMUP",
+        quality="OK" if warm else "WARMUP",
     )
 
     return True, out
+
+
+def _wire_reading(payload: bytes) -> Dict[str, Any]:
+    """The one RAW reading of a binary payload as a dict (ValueError for anything else)."""
+    try:
+        readings = wire.decode(payload)
+    except wire.DECODE_ERRORS as e:
+        raise ValueError(f"invalid binary payload: {e}") from None
+    if len(readings) != 1 or "temperature" not in readings[0]:
+        raise ValueError("expected one binary RAW reading")
+    return readings[0]
+
+
+def _wire_fields(payload: bytes) -> Tuple[Any, ...]:
+    """(device_id, ts, temperature, humidity) of a binary RAW payload; device_id None if it is not one."""
+    try:
+        return wire.decode_raw_fields(payload)
+    except wire.DECODE_ERRORS:
+        return None, None, None, None
+
+
+def _fallback_input(payload: bytes) -> Union[str, bytes]:
+    """
+    What the Pydantic fallback gets: the JSON text (same error messages as process(str)), or
+    the bytes as-is for binary and non-UTF-8 payloads (rejected as invalid JSON, like process_batch does).
+    """
+    if wire.is_binary(payload):
+        return payload
+    try:
+        return payload.decode("utf-8")
+    except UnicodeDecodeError:
+        return payload
+
+
+# -----------------------------
+# 4) Batch processor (columnar, no model per row)
+# -----------------------------
+class BatchResult(NamedTuple):
+    """
+    Columnar output of `process_batch`. Row i lines up with payload i.
+
+    `ok[i]` is the per-row error mask: when False, `errors[i]` holds the same
+    "schema_error:..." string `process()` would return and the other columns
+    for that row are placeholders (None / NaN / 0).
+    """
+    ok: np.ndarray                      # bool
+    device_id: List[Optional[str]]
+    ts: np.ndarray                      # int64
+    temperature_c: np.ndarray           # float64
+    temperature_avg5_c: np.ndarray      # float64, already rounded to 2 decimals
+    humidity_pct: np.ndarray            # float64
+    quality: List[Optional[str]]
+    errors: List[Optional[str]]
+
+    def rows(self):
+        """Yield one plain dict per valid row, shaped exactly like `SensorOut.model_dump()`."""
+        ts = self.ts.tolist(); t = self.temperature_c.tolist()
+        avg = self.temperature_avg5_c.tolist(); h = self.humidity_pct.tolist()
+        for i in np.flatnonzero(self.ok).tolist():
+            yield {
+                "device_id": self.device_id[i],
+                "ts": ts[i],
+                "temperature_c": t[i],
+                "temperature_avg5_c": avg[i],
+                "humidity_pct": h[i],
+                "quality": self.quality[i],
+                "schema_version": _SCHEMA_VERSION,
+            }
+
+
+_SCHEMA_VERSION = SensorOut.model_fields["schema_version"].default
+_I64_MIN, _I64_MAX = -(2 ** 63), 2 ** 63 - 1
+_FIELDS = itemgetter("device_id", "ts", "temperature", "humidity")
+
+
+def _plain_reading(device_id: Any, ts: Any, temperature: Any, humidity: Any) -> bool:
+    """
+    True when parsed JSON values already have the exact types SensorIn would produce,
+    so no Pydantic coercion is needed (bool is excluded: it is an int subclass).
+    Range checks are left to the caller.
+    """
+    return (type(device_id) is str and type(ts) is int and _I64_MIN <= ts <= _I64_MAX
+            and (type(temperature) is float or (type(temperature) is int and -1000 < temperature < 1000))
+            and (type(humidity) is float or (type(humidity) is int and -1000 < humidity < 1000)))
+
+
+def _round2(values: np.ndarray) -> List[float]:
+    """
+    Python's round(x, 2) for a whole column.
+
+    np.round(x, 2) agrees with round() except when x*100 sits right on a .5
+    boundary, so only those few values are re-done with the built-in round().
+    """
+    scaled = values * 100.0
+    frac = scaled - np.floor(scaled)
+    out = (np.rint(scaled) / 100.0).tolist()
+    for i in np.flatnonzero(np.abs(frac - 0.5) < 1e-6).tolist():
+        out[i] = round(values[i].item(), 2)
+    return out
+
+
+def process_batch(payloads: Sequence[Union[bytes, str]], store: Optional[WindowStore] = None) -> BatchResult:
+    """
+    Validate and smooth a whole batch of RAW payloads at once (replay / burst traffic).
+
+    Gives the same result as calling `process()` on each payload in order, but
+    without building a SensorIn/SensorOut model per row:
+      1) each payload is parsed with Pydantic's own JSON parser (from_json),
+      2) types are checked per row, value ranges column-wise with NumPy
+         (same -40..125 °C and 0..100 % bounds as SensorIn),
+      3) averages are computed per device in one vectorized pass (WindowStore.update_many).
+
+    Binary RAW payloads (wire.py) are accepted like JSON ones.
+    Rows that do not take the fast path (bad JSON, odd types such as "ts": "123",
+    out-of-range values) are handed to SensorIn.model_validate_json, so they are
+    accepted or rejected - with the same error text - exactly like `process()`.
+    The one difference: `ts` must fit the int64 column, bigger values are rejected.
+    """
+    if store is None:
+        store = _store
+    n = len(payloads)
+    fields = _FIELDS
+    idx: List[int] = []
+    dev: List[Any] = [None] * n
+    tss: List[int] = []
+    tmp: List[float] = []
+    hum: List[float] = []
+    # One tight loop: parse + pick the four fields + exact type check.
+    for i, p in enumerate(payloads):
+        try:
+            a, b, c, d = fields(from_json(p))
+        except (ValueError, KeyError, TypeError):
+            if not (isinstance(p, bytes) and wire.is_binary(p)):
+                continue                                   # bad JSON / missing field / not an object -> slow path
+            a, b, c, d = _wire_fields(p)                   # compact binary RAW
+            if a is None:
+                continue
+        if _plain_reading(a, b, c, d):
+            idx.append(i); dev[i] = a; tss.append(b); tmp.append(c); hum.append(d)
+
+    fast = np.zeros(n, dtype=bool)
+    fast[idx] = True
+    temps = np.full(n, np.nan)
+    hums = np.full(n, np.nan)
+    ts_col = np.zeros(n, dtype=np.int64)
+    temps[idx] = tmp
+    hums[idx] = hum
+    ts_col[idx] = tss
+    # Column-wise range check (NaN fails every comparison, just like Field(ge=..., le=...))
+    fast &= (temps >= -40) & (temps <= 125) & (hums >= 0) & (hums <= 100)
+
+    ok = fast.copy()
+    errors: List[Optional[str]] = [None] * n
+    for i in np.flatnonzero(~fast).tolist():
+        p = payloads[i]
+        binary = isinstance(p, bytes) and wire.is_binary(p)
+        if isinstance(p, bytes) and not binary:
+            try:
+                p = p.decode("utf-8")                      # same str input as process(payload.decode("utf-8"))
+            except UnicodeDecodeError:
+                pass
+        try:
+            raw = SensorIn.model_validate(_wire_reading(p)) if binary else SensorIn.model_validate_json(p)
+        except Exception as e:
+            errors[i] = f"schema_error:{e}"
+            dev[i] = None
+            continue
+        if not _I64_MIN <= raw.ts <= _I64_MAX:
+            errors[i] = "schema_error:ts does not fit in a 64-bit integer"
+            dev[i] = None
+            continue
+        ok[i] = True
+        dev[i], ts_col[i], temps[i], hums[i] = raw.device_id, raw.ts, raw.temperature, raw.humidity
+
+    # Smooth per device. Devices are handled in order of their LAST row so the
+    # store's LRU order ends up the same as after row-by-row processing.
+    avgs = np.full(n, np.nan)
+    warm = np.zeros(n, dtype=bool)
+    rows = np.flatnonzero(ok)
+    groups: Dict[str, List[int]] = {}
+    for i in rows.tolist():
+        g = groups.pop(dev[i], None)                       # pop + reinsert keeps dict order = last occurrence
+        if g is None:
+            g = []
+        g.append(i)
+        groups[dev[i]] = g
+    limit = store.max_devices
+    if limit is not None and len(store) + len(groups) > limit:
+        # LRU eviction could hit mid-batch: replay row by row to stay identical to process().
+        for i in rows.tolist():
+            avgs[i], warm[i] = store.update(dev[i], temps[i].item(), ts_col[i].item())
+    else:
+        for device_id, g in groups.items():
+            gi = np.array(g)
+            avgs[gi], warm[gi] = store.update_many(device_id, temps[gi], ts_col[gi])
+
+    avg_out = np.full(n, np.nan)
+    if rows.size:
+        avg_out[rows] = _round2(avgs[rows])                 # same digits as round(avg, 2) in process()
+    quality: List[Optional[str]] = [None] * n
+    for i in rows.tolist():
+        quality[i] = "OK" if warm[i] else "WARMUP"
+
+    return BatchResult(ok, dev, ts_col, temps, avg_out, hums, quality, errors)
+
+
+# -----------------------------
+# 5) Fast path: RAW bytes -> CLEAN JSON bytes (no models, no dict, no json.dumps)
+# -----------------------------
+# CLEAN JSON is fixed-shape, so everything after the device prefix is one bytes template.
+# The layout matches json.dumps(SensorOut.model_dump()) byte for byte (same key order,
+# same ", " / ": " separators, floats written with repr() like the json module does).
+_CLEAN_TAIL = (b'%d, "temperature_c": %a, "temperature_avg5_c": %a, "humidity_pct": %a, '
+               b'"quality": "%s", "schema_version": ' + json.dumps(_SCHEMA_VERSION).encode() + b"}")
+_QUALITY = {True: b"OK", False: b"WARMUP"}
+_WIRE_MAGIC = wire.MAGIC_BYTE
+_prefix_cache: Dict[str, bytes] = {}     # device_id -> b'{"device_id": "...", "ts": '
+_PREFIX_CACHE_MAX = 10_000               # a fleet-sized bound; the cache is simply reset when it is hit
+
+
+def _clean_prefix(device_id: str) -> bytes:
+    prefix = _prefix_cache.get(device_id)
+    if prefix is None:
+        if len(_prefix_cache) >= _PREFIX_CACHE_MAX:
+            _prefix_cache.clear()
+        prefix = _prefix_cache[device_id] = (
+            b'{"device_id": ' + encode_basestring_ascii(device_id).encode("ascii") + b', "ts": ')
+    return prefix
+
+
+def process_bytes(payload: bytes, store: Optional[WindowStore] = None) -> Tuple[bool, Union[bytes, str]]:
+    """
+    Same as `process()`, but straight from the MQTT payload bytes to CLEAN JSON bytes.
+
+    Returns:
+        (True, b'{"device_id": ...}') ready for conn.publish, identical to
+        json.dumps(SensorOut.model_dump()) for the same reading
+        (False, "schema_error:...") exactly as `process()` reports it
+
+    Well-formed readings never touch Pydantic models: the payload is parsed with
+    from_json, type/range-checked inline and written with a single bytes template.
+    Anything unusual (bad JSON, values needing coercion, out of range) falls back
+    to `process()` so validation and error messages stay the same.
+    A compact binary RAW payload (wire.py) is accepted too and gives the same CLEAN JSON.
+    """
+    if store is None:
+        store = _store
+    if payload[:1] == _WIRE_MAGIC:                      # compact binary RAW (wire.py)
+        device_id, ts, temperature, humidity = _wire_fields(payload)
+    else:
+        try:
+            device_id, ts, temperature, humidity = _FIELDS(from_json(payload))
+        except (ValueError, KeyError, TypeError):
+            device_id = None
+    if (device_id is not None and _plain_reading(device_id, ts, temperature, humidity)
+            and -40 <= temperature <= 125 and 0 <= humidity <= 100):
+        temperature = float(temperature)
+        humidity = float(humidity)
+        avg, warm = store.update(device_id, temperature, ts)
+        return True, _clean_prefix(device_id) + _CLEAN_TAIL % (
+            ts, temperature, round(avg, 2), humidity, _QUALITY[warm])
+
+    # Fallback: the regular Pydantic path
+    ok, res = process(_fallback_input(payload), store)
+    if not ok:
+        return False, res
+    return True, json.dumps(res.model_dump()).encode("utf-8")
+
+
+def process_bytes_staged(payload: bytes, store: Optional[WindowStore],
+                         observe: Callable[[str, int], None]) -> Tuple[bool, Union[bytes, str]]:
+    """
+    `process_bytes()` with per-stage timing, for instrumented (sampled) messages.
+
+    Calls observe(stage, nanoseconds) for "decode", "validate", "smooth" and
+    "serialize". Results are identical to `process_bytes()`. On the Pydantic
+    fallback, decode and validation happen together and are reported as "validate".
+    """
+    if store is None:
+        store = _store
+    clock = time.perf_counter_ns
+    t0 = clock()
+    if payload[:1] == _WIRE_MAGIC:                      # compact binary RAW (wire.py)
+        device_id, ts, temperature, humidity = _wire_fields(payload)
+    else:
+        try:
+            device_id, ts, temperature, humidity = _FIELDS(from_json(payload))
+        except (ValueError, KeyError, TypeError):
+            device_id = None
+    t1 = clock()
+    observe("decode", t1 - t0)
+    if (device_id is not None and _plain_reading(device_id, ts, temperature, humidity)
+            and -40 <= temperature <= 125 and 0 <= humidity <= 100):
+        temperature = float(temperature)
+        humidity = float(humidity)
+        t2 = clock()
+        observe("validate", t2 - t1)
+        avg, warm = store.update(device_id, temperature, ts)
+        t3 = clock()
+        observe("smooth", t3 - t2)
+        out = _clean_prefix(device_id) + _CLEAN_TAIL % (ts, temperature, round(avg, 2), humidity, _QUALITY[warm])
+        observe("serialize", clock() - t3)
+        return True, out
+
+    ok, res = process(_fallback_input(payload), store)           # validate + smooth (Pydantic path)
+    t2 = clock()
+    observe("validate", t2 - t1)
+    if not ok:
+        return False, res
+    out = json.dumps(res.model_dump()).encode("utf-8")
+    observe("serialize", clock() - t2)
+    return True, out
@@ -0,0 +1,320 @@
+"""
+mqtt_client.py
+--------------
+The one MQTT connection of a script: mTLS setup, reconnects and flow-controlled
+QoS1 publishing. Shared by the publisher, the edge processor and the live plot.
+
+    mtls_client(...)    builds the awscrt connection (persistent session:
+                        clean_session=False) wrapped in an MqttClient.
+    MqttClient          works with any awscrt-style connection, including
+                        transport.InMemoryConnection as a local broker stand-in.
+
+Flow control. Every QoS1 publish holds a slot in an in-flight window until its
+PUBACK (the publish future) arrives. When the window is full, publishes wait in
+a bounded FIFO and go out as acks free slots; past `max_queued` the oldest
+waiting publish is dropped (its future fails with PublishDropped, so
+StoreAndForward replays it from disk). `publish()` never blocks: it is called
+from the SDK's event-loop thread, which is also the thread that delivers the
+PUBACKs.
+
+Adaptive backpressure. With `target_ack_sec` set, the window follows the
+PUBACK round trip (AIMD, like TCP congestion control): +1 per window of fast
+acks, halved - at most once per round trip - when an ack is slower than the
+target or a publish fails. Producers that can afford to wait call
+`wait_for_capacity()` (publisher loop, pipeline workers) or read `pressure()`.
+
+Reconnects. `connect()` retries with exponential backoff and full jitter, so
+a fleet does not reconnect in lockstep after a broker outage; the SDK's own
+reconnect floor is jittered per client as well. On resume without a session
+(the broker forgot it), the remembered subscriptions are re-sent.
+"""
+
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import Future
+from typing import Callable, Deque, Dict, Iterator, Optional, Tuple
+
+from awscrt import io, mqtt
+from awsiot import mqtt_connection_builder
+
+from transport import LatencyRecorder
+
+
+class PublishDropped(Exception):
+    """A publish waiting for a free in-flight slot was dropped because the queue was full."""
+
+
+def backoff_delays(base: float = 1.0, cap: float = 60.0, rnd: Optional[random.Random] = None) -> Iterator[float]:
+    """Full-jitter exponential backoff: uniform(0, min(cap, base * 2**attempt)) for attempt = 0, 1, 2, ..."""
+    rnd = rnd or random.Random()
+    attempt = 0
+    while True:
+        yield rnd.uniform(0, min(cap, base * 2 ** attempt))
+        attempt += 1
+
+
+class MqttClient:
+    """
+    Flow-controlled publishing, reconnects and subscriptions over one MQTT connection.
+
+    Args:
+        conn:            awscrt mqtt.Connection (or transport.InMemoryConnection); may be set later.
+        qos:             QoS for publish() / subscribe() unless given per call.
+        max_in_flight:   upper bound of the in-flight (unacknowledged) window.
+        max_queued:      publishes that may wait for a slot; beyond that the oldest is dropped.
+        target_ack_sec:  PUBACK round trip to aim for; None = fixed window of `max_in_flight`.
+        min_in_flight:   the adaptive window never shrinks below this.
+        on_online:       called with True/False when the connection comes back / is lost
+                         (e.g. StoreAndForward.set_online).
+        backoff_base_sec / backoff_max_sec: connect() retry backoff.
+
+    Also a transport (publish(topic, payload) -> Future), so it drops into
+    ReadingPipeline and StoreAndForward.
+    """
+
+    def __init__(self, conn=None, qos=mqtt.QoS.AT_LEAST_ONCE, max_in_flight: int = 100,
+                 max_queued: int = 10_000, target_ack_sec: Optional[float] = None, min_in_flight: int = 4,
+                 on_online: Optional[Callable[[bool], None]] = None, backoff_base_sec: float = 1.0,
+                 backoff_max_sec: float = 60.0, clock: Callable[[], float] = time.perf_counter):
+        if max_in_flight < 1:
+            raise ValueError("max_in_flight must be >= 1")
+        self.conn = conn
+        self.qos = qos
+        self.max_in_flight = max_in_flight
+        self.max_queued = max_queued
+        self.target_ack_sec = target_ack_sec
+        self.min_in_flight = max(1, min(min_in_flight, max_in_flight))
+        self.on_online = on_online
+        self.backoff_base_sec = backoff_base_sec
+        self.backoff_max_sec = backoff_max_sec
+        self._clock = clock
+        self.window = float(max_in_flight)
+        self.in_flight = 0
+        self.online = False
+        self.latency = LatencyRecorder()               # publish -> PUBACK round trips (seconds)
+        self.sent = self.acked = self.failed = self.dropped = 0
+        self.reconnects = 0
+        self._queue: Deque[Tuple[str, bytes, object, Future]] = deque()
+        self._subscriptions: Dict[str, Tuple[object, Callable]] = {}
+        self._cond = threading.Condition()
+        self._pumping = False
+        self._waiters = 0                              # threads in wait_for_capacity()/drain(): skip notify_all otherwise
+        self._last_cut = float("-inf")
+
+    # ---- connection ----------------------------------------------------------------
+    def connect(self, max_attempts: Optional[int] = None, timeout: float = 30.0,
+                sleep: Callable[[float], None] = time.sleep) -> bool:
+        """Connect, retrying with jittered backoff. Returns session_present. Raises after `max_attempts` failures."""
+        delays = backoff_delays(self.backoff_base_sec, self.backoff_max_sec)
+        attempt = 0
+        while True:
+            attempt += 1
+            try:
+                result = self.conn.connect().result(timeout)
+                break
+            except Exception as e:
+                if max_attempts is not None and attempt >= max_attempts:
+                    raise
+                delay = next(delays)
+                print(f"connect failed ({e!r}), retry {attempt} in {delay:.1f}s")
+                sleep(delay)
+        self._set_online(True)
+        return bool((result or {}).get("session_present", False))
+
+    def disconnect(self, drain_timeout: float = 10.0) -> None:
+        """Wait (bounded) for queued and in-flight publishes, then disconnect."""
+        self.drain(drain_timeout)
+        self._set_online(False)
+        self.conn.disconnect().result()
+
+    def on_interrupted(self, connection=None, error=None, **kwargs) -> None:
+        """SDK on_connection_interrupted callback: hold new publishes in the queue until resumed."""
+        print("connection interrupted:", error)
+        self._set_online(False)
+
+    def on_resumed(self, connection=None, return_code=None, session_present=False, **kwargs) -> None:
+        """SDK on_connection_resumed callback: re-subscribe if the broker lost the session, resume sending."""
+        self.reconnects += 1
+        if not session_present:
+            for topic, (qos, callback) in list(self._subscriptions.items()):
+                self.conn.subscribe(topic=topic, qos=qos, callback=callback)
+        self._set_online(True)
+
+    def _set_online(self, online: bool) -> None:
+        with self._cond:
+            changed = self.online != online
+            self.online = online
+            self._cond.notify_all()
+        if online:
+            self._pump()
+        if changed and self.on_online is not None:
+            self.on_online(online)
+
+    def subscribe(self, topic: str, callback: Callable, qos=None) -> Future:
+        """Subscribe (remembered, so it is restored after a session loss). Returns the SUBACK future."""
+        qos = self.qos if qos is None else qos
+        self._subscriptions[topic] = (qos, callback)
+        future, _packet_id = self.conn.subscribe(topic=topic, qos=qos, callback=callback)
+        return future
+
+    # ---- publishing ------------------------------------------------------------------
+    def publish(self, topic: str, payload: bytes, qos=None) -> Future:
+        """
+        Publish now if the window has room, otherwise queue it. Never blocks.
+        The future completes on PUBACK (or fails: connection error, PublishDropped).
+        """
+        qos = self.qos if qos is None else qos
+        with self._cond:
+            if self.online and not self._queue and self.in_flight < self.window:
+                self.in_flight += 1
+                direct = True
+            else:
+                proxy: Future = Future()
+                self._queue.append((topic, payload, qos, proxy))
+                dropped = self._queue.popleft() if len(self._queue) > self.max_queued else None
+                if dropped is not None:
+                    self.dropped += 1
+                direct = False
+        if direct:
+            return self._send(topic, payload, qos, None)
+        if dropped is not None:
+            dropped[3].set_exception(PublishDropped(f"in-flight queue full ({self.max_queued})"))
+        return proxy
+
+    def _send(self, topic: str, payload: bytes, qos, proxy: Optional[Future]) -> Future:
+        t0 = self._clock()
+        self.sent += 1
+        try:
+            future, _packet_id = self.conn.publish(topic=topic, payload=payload, qos=qos)
+        except Exception as e:
+            future = Future()
+            future.set_exception(e)
+        future.add_done_callback(lambda f: self._acked(f, t0, proxy))
+        return future
+
+    def _acked(self, future: Future, t0: float, proxy: Optional[Future]) -> None:
+        now = self._clock()
+        rtt = now - t0
+        error = future.exception()
+        with self._cond:
+            self.in_flight -= 1
+            if error is None:
+                self.acked += 1
+            else:
+                self.failed += 1
+            target = self.target_ack_sec
+            if target is not None:
+                if error is not None or rtt > target:
+                    if now - self._last_cut >= rtt:            # one cut per round trip, not one per late ack
+                        self.window = max(float(self.min_in_flight), self.window / 2)
+                        self._last_cut = now
+                elif self.window < self.max_in_flight:
+                    self.window = min(float(self.max_in_flight), self.window + 1 / self.window)
+            if self._waiters:
+                self._cond.notify_all()
+        if error is None:
+            self.latency.add(rtt)
+        if proxy is not None:
+            if error is None:
+                proxy.set_result(future.result())
+            else:
+                proxy.set_exception(error)
+        if self._queue:
+            self._pump()
+
+    def _pump(self) -> None:
+        """Send queued publishes while there is room. One pumping thread at a time; no recursion on instant acks."""
+        with self._cond:
+            if self._pumping:
+                return
+            self._pumping = True
+        try:
+            while True:
+                with self._cond:
+                    if not (self.online and self._queue and self.in_flight < self.window):
+                        self._pumping = False
+                        return
+                    topic, payload, qos, proxy = self._queue.popleft()
+                    self.in_flight += 1
+                    if self._waiters:
+                        self._cond.notify_all()
+                self._send(topic, payload, qos, proxy)
+        except BaseException:
+            with self._cond:
+                self._pumping = False
+            raise
+
+    # ---- backpressure ----------------------------------------------------------------
+    @property
+    def queued(self) -> int:
+        return len(self._queue)
+
+    def pressure(self) -> float:
+        """0.0 = idle .. 1.0 = window full, > 1.0 = publishes are queueing (1 + queued / max_queued)."""
+        if self._queue:
+            return 1.0 + len(self._queue) / self.max_queued
+        return self.in_flight / self.window
+
+    def wait_for_capacity(self, timeout: Optional[float] = None) -> bool:
+        """
+        Block until a publish would go out immediately (online, nothing queued, window not full).
+        For producer threads only - never call it from an SDK callback (acks arrive on that thread).
+        """
+        with self._cond:
+            self._waiters += 1
+            try:
+                return self._cond.wait_for(
+                    lambda: self.online and not self._queue and self.in_flight < self.window, timeout)
+            finally:
+                self._waiters -= 1
+
+    def drain(self, timeout: Optional[float] = None) -> bool:
+        """Wait until nothing is queued or in flight."""
+        with self._cond:
+            self._waiters += 1
+            try:
+                return self._cond.wait_for(lambda: not self._queue and self.in_flight == 0, timeout)
+            finally:
+                self._waiters -= 1
+
+    def snapshot(self) -> Dict[str, object]:
+        p50, p99 = self.latency.percentiles(50, 99)
+        return {"online": self.online, "window": round(self.window, 1), "in_flight": self.in_flight,
+                "queued": len(self._queue), "sent": self.sent, "acked": self.acked, "failed": self.failed,
+                "dropped": self.dropped, "reconnects": self.reconnects, "puback_p50_sec": p50, "puback_p99_sec": p99}
+
+
+def mtls_client(endpoint: str, cert_path: str, key_path: str, ca_path: str, client_id: str,
+                clean_session: bool = False, keep_alive_secs: int = 30, reconnect_min_sec: int = 1,
+                reconnect_max_sec: int = 64, **client_kwargs) -> MqttClient:
+    """
+    MqttClient on an mTLS connection to AWS IoT Core (built, not connected).
+
+    clean_session=False keeps subscriptions and unacknowledged QoS1 messages
+    across reconnects. The SDK reconnects on its own after an interruption with
+    exponential backoff; its floor is jittered here (reconnect_min_sec .. 2x) so
+    clients that dropped together do not retry together.
+    `client_kwargs` go to MqttClient (max_in_flight, target_ack_sec, on_online, ...).
+    """
+    client = MqttClient(**client_kwargs)
+    elg = io.EventLoopGroup(1)                         # One background thread to handle all MQTT/TLS networking
+    hr = io.DefaultHostResolver(elg)                   # DNS resolver to turn the AWS endpoint hostname into an IP
+    cb = io.ClientBootstrap(elg, hr)                   # Bootstrap = uses our event thread + DNS for MQTT/TLS
+    reconnect_min = random.randint(reconnect_min_sec, 2 * reconnect_min_sec)
+    client.conn = mqtt_connection_builder.mtls_from_path(
+        endpoint=endpoint,                             # AWS IoT device data endpoint
+        cert_filepath=cert_path,                       # Device certificate (.crt)
+        pri_key_filepath=key_path,                     # Matching private key (.key) — keep secret all the time!
+        ca_filepath=ca_path,                           # AmazonRootCA1.pem
+        client_bootstrap=cb,
+        client_id=client_id,                           # Unique client ID
+        clean_session=clean_session,                   # False: resume the session (subscriptions, unacked QoS1)
+        keep_alive_secs=keep_alive_secs,               # Ping interval to keep connection alive
+        reconnect_min_timeout_secs=reconnect_min,
+        reconnect_max_timeout_secs=max(reconnect_max_sec, reconnect_min),
+        on_connection_interrupted=client.on_interrupted,
+        on_connection_resumed=client.on_resumed,
+    )
+    return client
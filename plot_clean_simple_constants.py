@@ -1,13 +1,19 @@
 # plot_clean_simple_constants.py
 # Minimal AWS IoT subscriber that live-plots temperature_c and humidity_pct.
 # Uses fixed constants for endpoint, cert paths, topic, and window.
+#
+# Plotting goes through live_plot.LivePlot: per-device NumPy ring buffers
+# (the MQTT callback is the only writer), min/max decimation to the pixel
+# width, and blitting - so a frame costs about the same whether the window
+# holds 100 points or a million.
 
 import json, time
-from collections import deque
-from awscrt import io, mqtt
-from awsiot import mqtt_connection_builder
-import matplotlib.pyplot as plt
-from matplotlib.animation import FuncAnimation
+import numpy as np
+from mqtt_client import mtls_client
+import matplotlib
+from batch_publisher import unpack_readings
+import wire
+from live_plot import LivePlot
 
 # =============================================================================
 # 1) CONFIGURATION (REPLACE THESE VALUES)
@@ -26,98 +32,84 @@ PATH_TO_KEY  = "<PATH_TO_PRIVATE_KEY.key>" # e.g. "/home/pi/certs/privateKey.key
 PATH_TO_ROOT = "<PATH_TO_ROOT_CA.pem>"     # e.g. "/home/pi/certs/AmazonRootCA1.pem" — Amazon Root CA
 TOPIC        = "<RAW_TOPIC>"               # e.g. "sensors/raw" — ensure you have the clean topic not the raw one for better sensor visulization of the data.
 WINDOW_SEC   = 180                        # show last ~N seconds on the plot, have it here as 3 mintues as a default.
+
+# ---- Plot engine --------------------------------------------------------------
+RING_CAPACITY  = 65_536     # samples kept per device (must cover WINDOW_SEC at your message rate)
+FRAME_MS       = 500        # redraw interval
+HEADLESS_PNG   = None       # e.g. "live.png": no window (Agg backend), the frame is written to this file every FRAME_MS
 # ============================================================================
 
-# ---- Build secure MQTT connection (mTLS) ------------------------------------
-elg = io.EventLoopGroup(1)                         # One background thread to handle all MQTT/TLS networking
-hr  = io.DefaultHostResolver(elg)                 # DNS resolver to turn the AWS endpoint hostname into an IP
-cb  = io.ClientBootstrap(elg, hr)                  # networking bootstrap
-conn = mqtt_connection_builder.mtls_from_path(     # construct MQTT client w/ certs
-    endpoint=ENDPOINT,
-    cert_filepath=PATH_TO_CERT,
-    pri_key_filepath=PATH_TO_KEY,
-    ca_filepath=PATH_TO_ROOT,
-    client_bootstrap=cb,
-    client_id=CLIENT_ID,
-    clean_session=True,        # Start a fresh MQTT session each connect
-    keep_alive_secs=30,        # MQTT keepalive ping interval 
-)
+if HEADLESS_PNG:
+    matplotlib.use("Agg")   # must happen before pyplot is imported
+import matplotlib.pyplot as plt
 
-print("Connecting to AWS IoT…")
-conn.connect().result()                             # block until connected (TLS + MQTT)
-print("Connected.")
+# ---- Matplotlib live plot ----------------------------------------------------
+fig, ax = plt.subplots()       #Intalizing new figures
+plot = LivePlot(fig, ax, window_sec=WINDOW_SEC, capacity=RING_CAPACITY, title=f"AWS IoT: {TOPIC}")
 
-# ---- Rolling buffers (ring buffers) ------------------------------------------
-tbuf = deque()  # timestamps (storing time of the temp and humidity reading was recieved)
-T    = deque()  # temperature (°C)
-H    = deque()  # humidity (%)
 
-def _trim(now: float) -> None:
-    """
-    Drop points older than WINDOW_SEC from the left side of each deque.
-
-    now: current absolute time (same units as values in tbuf, i.e., time.time()).
-    cutoff = now - WINDOW_SEC means we **keep only** points with t >= cutoff.
-    """
-    cutoff = now - WINDOW_SEC       
-    while tbuf and tbuf[0] < cutoff:
-        tbuf.popleft()
-        T.popleft()
-        H.popleft()
+def build_connection():
+    """Build secure MQTT connection (mTLS, persistent session, jittered reconnects) - see mqtt_client.py."""
+    return mtls_client(ENDPOINT, PATH_TO_CERT, PATH_TO_KEY, PATH_TO_ROOT, CLIENT_ID)
 
 
 def on_msg(topic, payload, dup, qos, retain, **kwargs):
     """
-    MQTT callback: decode JSON payload, extract temp/humidity, append to buffers.
+    MQTT callback: decode JSON payload, extract temp/humidity, append to the device's ring buffer.
+    - Works with single readings and with batched payloads ({"readings": [...]}),
+      in JSON or in the compact binary format (wire.py, first byte wire.MAGIC).
     - payload: bytes → decode('utf-8') because MQTT bodies are binary by spec.
     - dup/qos/retain: metadata (QoS1 may redeliver; retain means broker-cached msg).
+    - This is the ONLY writer of the ring buffers; the plot thread just reads them.
     """
     try:
-        d = json.loads(payload.decode("utf-8"))  # decodes the payload MQTT Message using UTF-8 to a String then transform it to a dict
-        temp = d.get("temperature_c", d.get("temp_c", d.get("temperature"))) # Accept multiple key names so this works with CLEAN or RAW payloads:
-        hum  = d.get("humidity_pct", d.get("humidity")) # Accept multiple key names so this works with CLEAN or RAW payloads:
-        if temp is None or hum is None:
-            return  # ignore messages missing the fields we plot, connection is stopeed
-        now = time.time()
-        tbuf.append(now); T.append(float(temp)); H.append(float(hum)) 
-        _trim(now)   # remove any OLD points so we only keep the last WINDOW_SEC seconds
+        if wire.is_binary(payload):
+            readings = wire.decode(payload)        # binary reading or batch -> the same dicts as the JSON would give
+        else:
+            doc = json.loads(payload.decode("utf-8"))  # decodes the payload MQTT Message using UTF-8 to a String then transform it to a dict
+            readings = unpack_readings(doc)        # a batched payload carries several readings, a normal one just itself
+        now = time.time()                          # x position = time the reading was received
+        for d in readings:
+            temp = d.get("temperature_c", d.get("temp_c", d.get("temperature"))) # Accept multiple key names so this works with CLEAN or RAW payloads:
+            hum  = d.get("humidity_pct", d.get("humidity")) # Accept multiple key names so this works with CLEAN or RAW payloads:
+            if temp is None or hum is None:
+                continue  # ignore readings missing the fields we plot
+            plot.add(str(d.get("device_id", "")), now, float(temp), float(hum))
+        # no trimming needed: the rings overwrite their oldest slots, the plot only shows t >= now - WINDOW_SEC
     except Exception as e:
         print("bad payload:", e)  # never crash the callback
 
 
-print(f"Subscribing to {TOPIC}")
-conn.subscribe(       
-    topic=TOPIC,  
-    qqos=mqtt.QoS.AT_LEAST_ONCE,    #delievery level for the incoming message (I have set QoS equal to 1 )
-    callback=on_msg   
-)[0].result()        #blocks until SUBACK arrives, confirms that the you have subscribed on the topic
-print("Subscribed.")
-
-# ---- Matplotlib live plot ----------------------------------------------------
-fig, ax = plt.subplots()       #Intalizing new figures
-(line_t,) = ax.plot([], [], label="temperature (°C)")  # empty line axis for temp Data
-(line_h,) = ax.plot([], [], label="humidity (%)") #empty line axis for Humidity Data
-ax.legend(loc="upper left")
-ax.set_title(f"AWS IoT: {TOPIC}")
-ax.set_xlabel(f"Time (last ~{WINDOW_SEC}s)")
+def main():
+    client = build_connection()
+    print("Connecting to AWS IoT…")
+    client.connect()                                    # block until connected (TLS + MQTT), retrying with backoff
+    print("Connected.")
 
-def update(_):
-    """Animation step: convert absolute timestamps to relative seconds and redraw."""
-    if not tbuf:
-        return line_t, line_h
-    t0 = tbuf[0]                           # the oldest (leftmost) timestamp we kept
-    x  = [ti - t0 for ti in tbuf]          # seconds since first visible point
-    line_t.set_data(x, list(T))       # put x vs temperature points into the temp line    
-    line_h.set_data(x, list(H))       # put x vs humidity points into the humidity line
-    ax.relim(); ax.autoscale_view()        # rescan data limits and rescale axes to fit
-    return line_t, line_h                  #Updated data
+    print(f"Subscribing to {TOPIC}")
+    client.subscribe(TOPIC, on_msg).result()            # QoS1; blocks until SUBACK, re-subscribed if the session is lost
+    print("Subscribed.")
 
-ani = FuncAnimation(fig, update, interval=500, cache_frame_data=False)  # Calls Update Function to update it constantly
-plt.tight_layout()
-try:
-    plt.show()                              # blocks until the window is closed
-finally:
+    plt.tight_layout()
     try:
-        conn.disconnect().result()          # cleanly close MQTT conn on exit
-    except:
+        if HEADLESS_PNG:
+            while True:                             # Ctrl+C to stop
+                plot.update()
+                plt.imsave(HEADLESS_PNG, np.asarray(fig.canvas.buffer_rgba()))   # the blitted frame as-is, no re-render
+                time.sleep(FRAME_MS / 1000)
+        else:
+            timer = fig.canvas.new_timer(interval=FRAME_MS)   # redraws go through blitting, not FuncAnimation + full draw
+            timer.add_callback(plot.update)
+            timer.start()
+            plt.show()                              # blocks until the window is closed
+    except KeyboardInterrupt:
         pass
+    finally:
+        try:
+            client.disconnect()                 # cleanly close MQTT conn on exit
+        except:
+            pass
+
+
+if __name__ == "__main__":
+    main()
@@ -17,18 +17,15 @@ REPLACE the ALL-CAPS placeholders below before running.
 # 0) Libraries
 # =============================================================================
 
-from awscrt.io import ClientBootstrap
-
-
-from awscrt.io import ClientBootstrap
-
-
 import time
 import json
-import board
-import adafruit_dht
-from awscrt import io, mqtt
-from awsiot import mqtt_connection_builder
+import wire
+from batch_publisher import BatchingPublisher, pack_json_batch, pack_wire_batch
+from compression import ReadingCompressor, SignalSpec
+from models_and_processor import new_window_store, process_bytes
+from mqtt_client import mtls_client
+from transport import LatencyRecorder
+from spool import SegmentSpool, StoreAndForward
 
 # =============================================================================
 # 1) CONFIGURATION (REPLACE THESE VALUES)
@@ -50,65 +47,266 @@ TOPIC        = "<RAW_TOPIC>"               # e.g. "sensors/raw" — where this s
 # Network path: use 443 for HTTPS
 USE_PORT_443_ALPN = True   #To ensure data is encrypted and protected through TLS Certificate.
 
+# Optional batching: send several readings per MQTT message (fewer billed IoT Core messages)
+BATCH_MAX_COUNT  = 0       # 0 = off (one publish per reading); e.g. 30 readings = one message per minute
+BATCH_MAX_BYTES  = 120_000 # stay under the 128 KB AWS IoT Core message limit
+BATCH_LINGER_SEC = 60      # never hold a reading longer than this
+
+# Optional report-by-exception compression: only send readings needed to rebuild the trend
+COMPRESSION          = False
+TEMP_DEADBAND_C      = None   # e.g. 0.5 — send when temperature moved more than this since the last send
+TEMP_SWING_TOL_C     = 0.3    # swinging-door tolerance for temperature (None = off)
+HUM_DEADBAND_PCT     = None   # e.g. 2.0
+HUM_SWING_TOL_PCT    = 1.0    # swinging-door tolerance for humidity (None = off)
+HEARTBEAT_MAX_SEC    = 300    # always send at least one reading every N seconds
+
+# Fused edge mode: clean the reading right here (models_and_processor.process) and publish
+# straight to the CLEAN topic, instead of Pi → sensors/raw → edge_processor_clean → sensors/clean.
+FUSED_MODE        = False
+CLEAN_TOPIC       = "<CLEAN_TOPIC>"   # e.g. "sensors/clean"
+FUSED_PUBLISH_RAW = False             # also publish the RAW reading (only if something still needs sensors/raw)
+
+# Store-and-forward: every payload is written to an on-disk log first and only dropped from it
+# once AWS IoT acknowledges it (PUBACK), so readings survive uplink outages and restarts.
+SPOOL_DIR          = None             # e.g. "/home/pi/spool"; None = off
+SPOOL_MAX_MB       = 256              # disk budget; the oldest data is dropped beyond this
+REPLAY_RATE_PER_SEC = 50              # backlog replay speed after reconnect (live data is not throttled)
+
+# Payload encoding: "json" (default) or "binary" - the compact format from wire.py, roughly 3-4x
+# smaller per reading and ~10x+ per zlib'd batch. Only for consumers that accept it (edge_processor_clean,
+# the live plot); Firehose/Athena need JSON, so keep CLEAN_WIRE_FORMAT = "json" when CLEAN goes to S3.
+WIRE_FORMAT       = "json"            # RAW readings (and RAW batches)
+CLEAN_WIRE_FORMAT = "json"            # CLEAN readings in fused mode
+
+# Publish flow control (mqtt_client.MqttClient): bounded QoS1 in-flight window with PUBACK latency tracking.
+# When the window stays full, the read loop slows down instead of queueing without bound.
+PUBLISH_MAX_IN_FLIGHT  = 20           # unacknowledged publishes at most
+PUBLISH_TARGET_ACK_SEC = 2.0          # shrink the window when PUBACKs take longer (None = fixed window)
+PUBLISH_BACKPRESSURE_WAIT_SEC = 30    # the read loop waits at most this long for a free slot
+
 # =============================================================================
 
-# DHT11 setup (GPIO4 = board.D4)
-dht = adafruit_dht.DHT11(board.D4)  # Initialize DHT11 sensor on GPIO4 (Pin 7)
 READ_PERIOD_SEC = 2                # Wait 2 seconds between each DHT11 reading
+VERBOSE         = False            # print every published reading (debugging; costs time on every message)
 
-# MQTT setup
-elg = io.EventLoopGroup(1) # One background thread to handle all MQTT/TLS networking
-hr = io.DefaultHostResolver(elg)  # DNS resolver to turn the AWS endpoint hostname into an IP
-cb  = io.ClientBootstrap(elg, hr) # Bootstrap = uses our event threat + DNS for MQTT/TLS
 
-conn_kwargs = dict[str, str | ClientBootstrap | bool | int]  (
-    endpoint=ENDPOINT,                 
-    cert_filepath=PATH_TO_CERT,        
-    pri_key_filepath=PATH_TO_KEY,      
-    ca_filepath=PATH_TO_ROOT,         
-    client_bootstrap=cb,               
-    client_id=CLIENT_ID,               
-    clean_session=True,                # Start a fresh MQTT session each connect
-    keep_alive_secs=30,                # MQTT keepalive ping interval 
-)
+# =============================================================================
+# 2) MQTT connection
+# =============================================================================
+def build_connection(on_online=None):
+    """
+    Build (but do not connect) the mTLS MQTT client from the constants above (see mqtt_client.py).
+    `on_online(bool)` is called when the connection is lost / comes back (e.g. StoreAndForward.set_online).
+    """
+    return mtls_client(ENDPOINT, PATH_TO_CERT, PATH_TO_KEY, PATH_TO_ROOT, CLIENT_ID,
+                       max_in_flight=PUBLISH_MAX_IN_FLIGHT, target_ack_sec=PUBLISH_TARGET_ACK_SEC,
+                       on_online=on_online)
 
 
+# =============================================================================
+# 3) Reading pipeline: compression → (fused cleaning) → batching → transport
+# =============================================================================
+class ReadingPipeline:
+    """
+    Everything that happens to a reading between the sensor and the transport.
 
-conn = mqtt_connection_builder.mtls_from_path(**conn_kwargs) # Builds a connection with TLS Certificates provided
+    Args:
+        transport:    anything with publish(topic, payload) -> Future (mqtt_client.MqttClient, transport.InMemoryBus, ...)
+        raw_topic:    where RAW readings go.
+        clean_topic:  where CLEAN readings go in fused mode.
+        fused:        run models_and_processor in-process and publish CLEAN directly.
+        publish_raw:  in fused mode, also publish the RAW reading.
+        compressor:   optional ReadingCompressor (report-by-exception).
+        batch_max_count / batch_max_bytes / batch_linger_sec: optional BatchingPublisher per topic.
+        wire_format / clean_wire_format: "json" or "binary" (wire.py) for RAW / CLEAN payloads;
+                      a reading the binary format cannot carry exactly is sent as JSON.
+        verbose:      print every published reading.
 
-print("Connecting to AWS IoT…")
-conn.connect().result()
-print(f"Connected. Publishing DHT11 data to topic: {TOPIC}")
+    `latency` records sensor read → publish acknowledged (PUBACK) for the
+    reading's final topic (CLEAN in fused mode, RAW otherwise).
+    """
+
+    def __init__(self, transport, raw_topic, clean_topic=None, fused=False, publish_raw=True,
+                 compressor=None, batch_max_count=0, batch_max_bytes=120_000, batch_linger_sec=1.0,
+                 wire_format="json", clean_wire_format="json", verbose=False):
+        if fused and not clean_topic:
+            raise ValueError("fused mode needs a clean_topic")
+        for fmt in (wire_format, clean_wire_format):
+            if fmt not in ("json", "binary"):
+                raise ValueError("wire formats are 'json' or 'binary'")
+        self.binary_raw = wire_format == "binary"
+        self.binary_clean = clean_wire_format == "binary"
+        self.transport = transport
+        self.raw_topic = raw_topic
+        self.clean_topic = clean_topic
+        self.fused = fused
+        self.publish_raw = publish_raw or not fused
+        self.verbose = verbose
+        self.compressor = compressor
+        self.store = new_window_store()                # rolling window for fused cleaning
+        self.latency = LatencyRecorder()
+        self._pending_clean = {}                       # CLEAN bytes of the reading the compressor may still send
+        self._batchers = {}
+        if batch_max_count > 0:
+            for topic, binary in ((raw_topic, self.binary_raw), (clean_topic if fused else None, self.binary_clean)):
+                if topic:
+                    self._batchers[topic] = BatchingPublisher(
+                        lambda p, topic=topic: transport.publish(topic, p),
+                        max_count=batch_max_count, max_bytes=batch_max_bytes, linger_sec=batch_linger_sec,
+                        pack=pack_wire_batch if binary else pack_json_batch).start()
+
+    def _encode_raw(self, msg):
+        """RAW payload bytes in the configured format (JSON when binary cannot carry the reading exactly)."""
+        if self.binary_raw:
+            payload = wire.encode_raw(msg)
+            if payload is not None:
+                return payload
+        return json.dumps(msg).encode("utf-8")
+
+    def _encode_clean(self, clean):
+        """CLEAN JSON bytes from process_bytes, converted to binary when configured."""
+        if self.binary_clean:
+            return wire.encode_clean(json.loads(clean)) or clean
+        return clean
+
+    def _send(self, topic, payload, t_read=None):
+        batcher = self._batchers.get(topic)
+        if batcher is not None:
+            batcher.add(payload)                       # Queued; sent with the next batch
+            return
+        future = self.transport.publish(topic, payload) # Publishes to MQTT Topic
+        if t_read is not None and future is not None:
+            future.add_done_callback(lambda _f: self.latency.since(t_read))
+
+    def handle(self, msg, t_read=None):
+        """Publish one sensor reading dict; `t_read` is time.perf_counter() right after the sensor read."""
+        if t_read is None:
+            t_read = time.perf_counter()
+        raw = self._encode_raw(msg)
+        key = (msg["device_id"], msg["ts"])
+        pending = self._pending_clean
+        if self.fused:
+            # Clean EVERY reading, so the rolling window sees all of them even when compression skips some
+            ok, res = process_bytes(raw, self.store)
+            if ok:
+                pending[key] = self._encode_clean(res)
+            else:
+                print("DROP:", res)
+
+        out = self.compressor.add(msg) if self.compressor is not None else [msg]
+        for m in out:
+            is_current = m is msg
+            if self.publish_raw:
+                self._send(self.raw_topic, raw if is_current else self._encode_raw(m),
+                           t_read if is_current and not self.fused else None)
+            if self.fused:
+                clean = pending.get((m["device_id"], m["ts"]))
+                if clean is not None:
+                    self._send(self.clean_topic, clean, t_read if is_current else None)
+            if self.verbose:
+                print("pub:", m)
+        # Only the current reading can still be held back by the compressor
+        self._pending_clean = {key: pending[key]} if key in pending else {}
+
+    def close(self):
+        """Send held-back and batched readings."""
+        if self.compressor is not None:
+            for m in self.compressor.flush():   # the last held-back reading
+                key = (m["device_id"], m["ts"])
+                if self.publish_raw:
+                    self._send(self.raw_topic, self._encode_raw(m))
+                if self.fused and key in self._pending_clean:
+                    self._send(self.clean_topic, self._pending_clean[key])
+            print(f"compression ratio: {self.compressor.ratio:.1f}x")
+        for batcher in self._batchers.values():
+            batcher.stop()   # send the last partial batch
+        print("read → ack latency:", self.latency.summary())
+
+
+def make_pipeline(transport):
+    """ReadingPipeline configured from the constants at the top of this file."""
+    compressor = None
+    if COMPRESSION:
+        compressor = ReadingCompressor(
+            {"temperature": SignalSpec(deadband=TEMP_DEADBAND_C, swing_tolerance=TEMP_SWING_TOL_C),
+             "humidity":    SignalSpec(deadband=HUM_DEADBAND_PCT, swing_tolerance=HUM_SWING_TOL_PCT)},
+            max_interval_sec=HEARTBEAT_MAX_SEC,
+        )
+    return ReadingPipeline(transport, TOPIC, clean_topic=CLEAN_TOPIC, fused=FUSED_MODE,
+                           publish_raw=FUSED_PUBLISH_RAW, compressor=compressor,
+                           batch_max_count=BATCH_MAX_COUNT, batch_max_bytes=BATCH_MAX_BYTES,
+                           batch_linger_sec=BATCH_LINGER_SEC,
+                           wire_format=WIRE_FORMAT, clean_wire_format=CLEAN_WIRE_FORMAT, verbose=VERBOSE)
+
+
+# =============================================================================
+# 4) Main loop for data collection
+# =============================================================================
+def main():
+    import board          # Raspberry Pi only; imported here so the pipeline above can run anywhere
+    import adafruit_dht
+
+    # DHT11 setup (GPIO4 = board.D4)
+    dht = adafruit_dht.DHT11(board.D4)  # Initialize DHT11 sensor on GPIO4 (Pin 7)
+
+    saf = None
+    if SPOOL_DIR:
+        saf = StoreAndForward(SegmentSpool(SPOOL_DIR, max_bytes=SPOOL_MAX_MB * 1024 * 1024), None,
+                              replay_rate=REPLAY_RATE_PER_SEC)
+        saf.set_online(False)                  # until the first connect succeeds, readings only go to disk
+        client = build_connection(on_online=saf.set_online)   # lost / back -> spool only / replay
+        saf.transport = client
+        saf.start()
+        print(f"Store-and-forward on: {saf.spool.backlog()} readings waiting in {SPOOL_DIR}")
+    else:
+        client = build_connection()
+    print("Connecting to AWS IoT…")
+    client.connect()                           # retries with jittered backoff; resumes the persistent session
+    pipeline = make_pipeline(saf if saf is not None else client)
+    print(f"Connected. Publishing DHT11 data to topic: {CLEAN_TOPIC if FUSED_MODE else TOPIC}"
+          + (" (fused mode)" if FUSED_MODE else ""))
 
-# Main loop for data collection
-try:
-    while True:
-        try:
-            temp_c = dht.temperature #Temp Data
-            hum = dht.humidity       #Humidity Data
-            if temp_c is None or hum is None:
-                time.sleep(READ_PERIOD_SEC)
-                continue
-
-            msg = {
-                "device_id": CLIENT_ID,
-                "ts": int(time.time()),    
-                "temperature": float(temp_c),
-                "humidity": float(hum)
-            }
-            conn.publish(topic=TOPIC, payload=json.dumps(msg), qos=mqtt.QoS.AT_LEAST_ONCE) #Publishes to MQTT Topic
-            print("pub:", msg)
-
-        except RuntimeError as e:
-            print("sensor transient:", e)
-        except Exception as e:
-            print("unexpected error:", e)
-
-        time.sleep(READ_PERIOD_SEC)
-
-except KeyboardInterrupt:
-    print("\nDisconnecting…")
     try:
-        conn.disconnect().result()
-    finally:
-        print("Disconnected. Bye!")
+        while True:
+            try:
+                temp_c = dht.temperature #Temp Data
+                hum = dht.humidity       #Humidity Data
+                t_read = time.perf_counter()
+                if temp_c is None or hum is None:
+                    time.sleep(READ_PERIOD_SEC)
+                    continue
+
+                msg = {
+                    "device_id": CLIENT_ID,
+                    "ts": int(time.time()),    
+                    "temperature": float(temp_c),
+                    "humidity": float(hum)
+                }
+                pipeline.handle(msg, t_read)
+
+            except RuntimeError as e:
+                print("sensor transient:", e)
+            except Exception as e:
+                print("unexpected error:", e)
+
+            # Backpressure: the wait for a free in-flight slot counts towards the read period, so
+            # readings only slow down when the broker keeps the window full for longer than that.
+            started = time.monotonic()
+            if client.online and not client.wait_for_capacity(timeout=PUBLISH_BACKPRESSURE_WAIT_SEC):
+                print("backpressure:", client.snapshot())
+            time.sleep(max(0.0, READ_PERIOD_SEC - (time.monotonic() - started)))
+
+    except KeyboardInterrupt:
+        print("\nDisconnecting…")
+        try:
+            pipeline.close()
+            if saf is not None:
+                saf.stop()          # checkpoint the ack cursor; anything unacknowledged is replayed next start
+            client.disconnect()     # waits (bounded) for unacknowledged publishes
+            print("publish:", client.snapshot())
+        finally:
+            print("Disconnected. Bye!")
+
+
+if __name__ == "__main__":
+    main()
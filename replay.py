@@ -0,0 +1,271 @@
+"""
+replay.py
+---------
+Offline replay / backfill: run recorded RAW JSONL through the same
+`process_bytes()` as the live edge processor.
+
+Use it to backfill after a schema change (`schema_version`) or to reprocess
+a bad day. Every input line is one RAW payload exactly as it arrived on
+sensors/raw (a single reading or a batch envelope); files may be gzipped.
+
+    reader (generator) ──► rounds of --round-size lines ──► shard by device_id ──► worker k (own WindowStore)
+                                                                                          │
+    clean JSONL / Parquet + rejects report ◄── reassembled in input order ◄───────────────┘
+
+- Same results as live: each device always goes to the same worker, in
+  input order, so its rolling window sees exactly the sequence the live
+  processor saw (starting from an empty window, like a fresh edge process).
+  Windows are built with the live settings (new_window_store): a window
+  restarts after a gap of WINDOW_TTL_SEC by `ts`, in both. Live's
+  wall-clock TTL / LRU eviction (memory only) cannot be replayed; it only
+  makes a difference for a late backlog after an outage of over an hour or
+  more than WINDOW_MAX_DEVICES devices (see new_window_store).
+- Output is in input order, whatever the number of workers.
+- Constant memory: at most --max-inflight rounds are in flight; nothing
+  else is buffered, whatever the file size.
+- Rejected readings go to a JSONL report (file, line, error, payload).
+
+Run:
+    python replay.py raw-2025-11-10.jsonl.gz --out clean.jsonl --rejects rejects.jsonl --workers 4
+    python replay.py day1.jsonl day2.jsonl --format parquet --out ./parquet_out
+"""
+
+import argparse
+import gzip
+import json
+import multiprocessing as mp
+import os
+import queue
+import sys
+import time
+from collections import deque
+from typing import BinaryIO, Deque, Dict, Iterator, List, Optional, Tuple
+
+from batch_publisher import split_batch
+from edge_pipeline import device_key, shard_for
+from models_and_processor import WindowStore, new_window_store, process_bytes
+
+Line = Tuple[str, int, bytes]                 # (file name, line number, RAW payload)
+
+
+# =============================================================================
+# 1) Reading
+# =============================================================================
+def open_input(path: str) -> BinaryIO:
+    if path == "-":
+        return sys.stdin.buffer
+    return gzip.open(path, "rb") if path.endswith(".gz") else open(path, "rb")
+
+
+def iter_lines(paths: List[str]) -> Iterator[Line]:
+    """Non-empty lines of every input file, in order, one at a time."""
+    for path in paths:
+        f = open_input(path)
+        try:
+            for n, line in enumerate(f, 1):
+                line = line.strip()
+                if line:
+                    yield path, n, line
+        finally:
+            if f is not sys.stdin.buffer:
+                f.close()
+
+
+def iter_rounds(lines: Iterator[Line], size: int) -> Iterator[List[Line]]:
+    chunk: List[Line] = []
+    for item in lines:
+        chunk.append(item)
+        if len(chunk) >= size:
+            yield chunk
+            chunk = []
+    if chunk:
+        yield chunk
+
+
+# =============================================================================
+# 2) Processing (same code path as the live edge processor)
+# =============================================================================
+def process_line(payload: bytes, store: WindowStore) -> List[Tuple[bool, object]]:
+    """(ok, clean_bytes | error) for every reading in one RAW payload."""
+    try:
+        return [process_bytes(raw, store) for raw in split_batch(payload)]
+    except Exception as e:                        # e.g. a damaged batch envelope that split_batch cannot parse
+        return [(False, f"process_error:{e!r}")]
+
+
+def _worker_main(shard: int, in_q, out_q) -> None:
+    store = new_window_store()
+    try:
+        while True:
+            job = in_q.get()
+            if job is None:
+                break
+            round_id, payloads = job
+            out_q.put((round_id, shard, [process_line(p, store) for p in payloads]))
+    except KeyboardInterrupt:
+        pass
+
+
+class _ShardWorkers:
+    """One process per shard; a shard's jobs always go to the same process, in order."""
+
+    def __init__(self, workers: int):
+        ctx = mp.get_context("spawn")
+        self.out_q = ctx.Queue()
+        self.in_qs = [ctx.Queue() for _ in range(workers)]
+        self.procs = [ctx.Process(target=_worker_main, args=(k, self.in_qs[k], self.out_q), daemon=True)
+                      for k in range(workers)]
+        for p in self.procs:
+            p.start()
+
+    def get(self):
+        while True:
+            try:
+                return self.out_q.get(timeout=1.0)
+            except queue.Empty:
+                dead = [k for k, p in enumerate(self.procs) if not p.is_alive()]
+                if dead:
+                    raise RuntimeError(f"replay worker(s) {dead} died")
+
+    def close(self) -> None:
+        for q in self.in_qs:
+            q.put(None)
+        for p in self.procs:
+            p.join(timeout=10)
+            if p.is_alive():
+                p.terminate()
+
+
+def replay(lines: Iterator[Line], workers: int = 1, round_size: int = 20_000,
+           max_inflight: Optional[int] = None) -> Iterator[Tuple[Line, List[Tuple[bool, object]]]]:
+    """
+    Yield (line, results) for every input line, in input order.
+
+    workers <= 1 processes in this process. Otherwise each round is split by
+    device shard (per reading, so a batch holding several devices is split),
+    the parts go to their shard's worker, and the round is yielded once every
+    part is back.
+    """
+    if workers <= 1:
+        store = new_window_store()
+        for line in lines:
+            yield line, process_line(line[2], store)
+        return
+
+    if max_inflight is None:
+        max_inflight = 2 * workers
+    pool = _ShardWorkers(workers)
+    # round_id -> (lines, per line [(shard, index in part)] per reading, {shard: results}, shards expected)
+    pending: Dict[int, tuple] = {}
+    order: Deque[int] = deque()
+
+    def finish_oldest():
+        rid = order.popleft()
+        chunk, where, got, expected = pending[rid]
+        while len(got) < expected:
+            r_id, shard, res = pool.get()
+            pending[r_id][2][shard] = res
+        del pending[rid]
+        for line, spots in zip(chunk, where):
+            yield line, [r for shard, i in spots for r in got[shard][i]]
+
+    try:
+        for rid, chunk in enumerate(iter_rounds(lines, round_size)):
+            parts: Dict[int, List[bytes]] = {}
+            where = []
+            for line in chunk:
+                try:
+                    readings = split_batch(line[2])   # a batch may hold several devices: shard each reading
+                except Exception:
+                    readings = [line[2]]            # damaged envelope: its worker reports the error
+                spots = []
+                for raw in readings:
+                    shard = shard_for(device_key(raw), workers)
+                    part = parts.setdefault(shard, [])
+                    spots.append((shard, len(part)))
+                    part.append(raw)
+                where.append(spots)
+            for shard, part in parts.items():
+                pool.in_qs[shard].put((rid, part))
+            pending[rid] = (chunk, where, {}, len(parts))
+            order.append(rid)
+            if len(order) >= max_inflight:
+                yield from finish_oldest()
+        while order:
+            yield from finish_oldest()
+    finally:
+        pool.close()
+
+
+# =============================================================================
+# 3) Writing
+# =============================================================================
+class JsonlSink:
+    """Clean readings as JSONL (gzipped if the path ends with .gz), the same bytes the edge publishes."""
+
+    def __init__(self, path: str):
+        self._f = gzip.open(path, "wb") if path.endswith(".gz") else open(path, "wb")
+
+    def add(self, clean: bytes) -> None:
+        self._f.write(clean)
+        self._f.write(b"\n")
+
+    def close(self) -> None:
+        self._f.close()
+
+
+class ParquetSink:
+    """Clean readings as hive-partitioned Parquet (compact_parquet.py layout; rows it cannot partition are skipped)."""
+
+    def __init__(self, out_dir: str):
+        from compact_parquet import ParquetCompactor      # pyarrow only needed for --format parquet
+        from pydantic_core import from_json
+        self._c = ParquetCompactor(out_dir)
+        self._from_json = from_json
+
+    def add(self, clean: bytes) -> None:
+        self._c.add(self._from_json(clean))
+
+    def close(self) -> None:
+        self._c.close()
+        if self._c.skipped:
+            print(f"parquet: skipped {self._c.skipped} rows that do not fit the schema (e.g. ts out of range)")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("inputs", nargs="+", help="RAW JSONL files (.gz ok, - for stdin), replayed in the given order")
+    ap.add_argument("--out", required=True, help="clean JSONL file (.gz ok), or a directory for --format parquet")
+    ap.add_argument("--format", choices=("jsonl", "parquet"), default="jsonl")
+    ap.add_argument("--rejects", default=None, help="JSONL report of rejected readings")
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    ap.add_argument("--round-size", type=int, default=20_000, help="lines per round sent to the workers")
+    args = ap.parse_args()
+
+    sink = ParquetSink(args.out) if args.format == "parquet" else JsonlSink(args.out)
+    rejects = open(args.rejects, "w", encoding="utf-8") if args.rejects else None
+    lines = ok_count = bad_count = 0
+    start = time.perf_counter()
+    try:
+        for (path, n, payload), results in replay(iter_lines(args.inputs), args.workers, args.round_size):
+            lines += 1
+            for ok, res in results:
+                if ok:
+                    sink.add(res)
+                    ok_count += 1
+                else:
+                    bad_count += 1
+                    if rejects is not None:
+                        rejects.write(json.dumps({"file": path, "line": n, "error": res,
+                                                  "payload": payload.decode("utf-8", "replace")}) + "\n")
+    finally:
+        sink.close()
+        if rejects is not None:
+            rejects.close()
+    elapsed = time.perf_counter() - start
+    print(f"lines={lines} clean={ok_count} rejected={bad_count} in {elapsed:.1f}s "
+          f"({lines / max(elapsed, 1e-9) * 60:,.0f} lines/min, workers={args.workers})")
+
+
+if __name__ == "__main__":
+    main()
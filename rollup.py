@@ -0,0 +1,212 @@
+"""
+rollup.py
+---------
+Per-device tumbling-window rollups of the CLEAN stream.
+
+Dashboards and Athena queries mostly want min/max/mean/count per minute or
+per hour. Computing those at the edge means long-range queries read one
+row per device per window instead of one row every 2 seconds.
+
+`RollupAggregator` keeps, per device and window size, a running
+count/min/max/sum for each window that is still open - a handful of floats,
+no samples. Windows are aligned to the epoch (`start = ts - ts % window`).
+
+Event time and lateness:
+  - each device has a watermark = newest `ts` seen - `allowed_lateness_sec`
+  - a window closes (its summary is published) once the watermark passes its end;
+    only event time does this, so spool replays and linger-batched RAW that
+    arrive hours after the fact still land in their own windows
+  - `tick()` flushes devices that went quiet: once a device has sent nothing
+    for `idle_timeout_sec` (processing time), its watermark advances with the
+    wall clock from its newest `ts`, so its last window still gets published
+  - a reading for a window that has already closed is dropped and counted in
+    `late`; anything out of order but within the lateness is folded in normally
+  - a reading stamped more than `max_future_sec` ahead of the wall clock (a
+    sensor with a bad RTC) is dropped and counted in `future`: folded in, it
+    would move the watermark ahead and every real reading after it would be late
+So a device has at most ceil(allowed_lateness / window) + 1 open windows per
+window size: O(1) memory per device.
+
+Summary message (compact JSON, one per device per closed window):
+
+    {"device_id":"rpi-sensor-001","window_start":1762817460,"window_sec":60,"count":30,
+     "temperature_c_min":26.1,"temperature_c_max":26.9,"temperature_c_mean":26.47,
+     "humidity_pct_min":9.0,"humidity_pct_max":11.0,"humidity_pct_mean":9.83,"schema_version":"1.0"}
+"""
+
+import json
+import threading
+import time
+from typing import Callable, Dict, List, Optional, Sequence
+
+from pydantic_core import from_json
+
+ROLLUP_SCHEMA_VERSION = "1.0"
+
+
+class _Agg:
+    """Running aggregate of ONE window."""
+    __slots__ = ("count", "t_min", "t_max", "t_sum", "h_min", "h_max", "h_sum")
+
+    def __init__(self, temperature: float, humidity: float):
+        self.count = 1
+        self.t_min = self.t_max = self.t_sum = temperature
+        self.h_min = self.h_max = self.h_sum = humidity
+
+    def add(self, temperature: float, humidity: float) -> None:
+        self.count += 1
+        self.t_sum += temperature
+        self.h_sum += humidity
+        if temperature < self.t_min:
+            self.t_min = temperature
+        elif temperature > self.t_max:
+            self.t_max = temperature
+        if humidity < self.h_min:
+            self.h_min = humidity
+        elif humidity > self.h_max:
+            self.h_max = humidity
+
+
+class _DeviceRollup:
+    __slots__ = ("open", "closed_until", "max_ts", "last_seen")
+
+    def __init__(self, windows: Sequence[int]):
+        self.open: Dict[int, Dict[int, _Agg]] = {w: {} for w in windows}   # window_sec -> start -> aggregate
+        self.closed_until: Dict[int, int] = {w: 0 for w in windows}        # end of the newest closed window
+        self.max_ts = 0
+        self.last_seen = 0.0                                               # clock() of the last reading
+
+
+class RollupAggregator:
+    """
+    Tumbling-window min/max/mean/count per device.
+
+    Args:
+        publish:              called with each summary payload (bytes) when a window closes,
+                              e.g. lambda p: conn.publish(topic=ROLLUP_TOPIC, payload=p, qos=...)
+        windows_sec:          window sizes to keep, e.g. (60, 3600) for minute and hour rollups.
+        allowed_lateness_sec: how far behind a device's newest `ts` a reading may arrive and still count.
+        idle_timeout_sec:     after this long without a reading (processing time), `tick()` lets the
+                              device's watermark follow the wall clock so its open windows close.
+        idle_ttl_sec:         forget devices with no open windows and no reading for this long.
+        max_future_sec:       drop readings whose ts is further than this ahead of `clock()`
+                              (None = accept any ts).
+        clock:                processing-time clock for idleness and `max_future_sec` (defaults to time.time).
+
+    Thread-safe: pipeline workers may call `add()` concurrently; `publish` is
+    called outside the lock.
+    """
+
+    def __init__(self, publish: Callable[[bytes], object], windows_sec: Sequence[int] = (60, 3600),
+                 allowed_lateness_sec: int = 30, idle_timeout_sec: float = 120, idle_ttl_sec: float = 3 * 3600,
+                 max_future_sec: Optional[float] = 300, clock: Callable[[], float] = time.time):
+        if not windows_sec or any(w <= 0 for w in windows_sec):
+            raise ValueError("windows_sec must be a non-empty list of positive window sizes")
+        self.publish = publish
+        self.windows_sec = tuple(int(w) for w in windows_sec)
+        self.allowed_lateness_sec = allowed_lateness_sec
+        self.idle_timeout_sec = idle_timeout_sec
+        self.idle_ttl_sec = idle_ttl_sec
+        self.max_future_sec = max_future_sec
+        self._clock = clock
+        self._devices: Dict[str, _DeviceRollup] = {}
+        self._lock = threading.Lock()
+        self.added = 0
+        self.late = 0          # (reading, window size) pairs dropped because that window had already closed
+        self.future = 0        # readings dropped because their ts was too far ahead of the wall clock
+        self.published = 0
+
+    # ---- input -------------------------------------------------------------------------
+    def add(self, device_id: str, ts: int, temperature: float, humidity: float) -> None:
+        """Fold one reading in; publishes the summaries of any windows this closes."""
+        now = self._clock()
+        with self._lock:
+            if self.max_future_sec is not None and ts > now + self.max_future_sec:
+                self.future += 1
+                return                            # never let it move the watermark
+            self.added += 1
+            d = self._devices.get(device_id)
+            if d is None:
+                d = self._devices[device_id] = _DeviceRollup(self.windows_sec)
+            if ts > d.max_ts:
+                d.max_ts = ts
+            d.last_seen = now
+            for w in self.windows_sec:
+                start = ts - ts % w
+                if start < d.closed_until[w]:
+                    self.late += 1
+                    continue
+                opened = d.open[w]
+                agg = opened.get(start)
+                if agg is None:
+                    opened[start] = _Agg(temperature, humidity)
+                else:
+                    agg.add(temperature, humidity)
+            out = self._close(device_id, d, d.max_ts - self.allowed_lateness_sec)
+        self._emit(out)
+
+    def add_clean(self, payload: bytes) -> None:
+        """`add()` from a CLEAN payload as produced by process_bytes()."""
+        doc = from_json(payload)
+        self.add(doc["device_id"], doc["ts"], doc["temperature_c"], doc["humidity_pct"])
+
+    # ---- closing windows ---------------------------------------------------------------
+    def _close(self, device_id: str, d: _DeviceRollup, watermark: float) -> List[bytes]:
+        out: List[bytes] = []
+        for w, opened in d.open.items():
+            if not opened:
+                continue
+            for start in sorted(s for s in opened if s + w <= watermark):
+                out.append(self._summary(device_id, start, w, opened.pop(start)))
+                if start + w > d.closed_until[w]:
+                    d.closed_until[w] = start + w
+        return out
+
+    def tick(self, now: Optional[float] = None) -> None:
+        """Flush devices idle for `idle_timeout_sec` and forget long-idle ones (call periodically, e.g. once a second)."""
+        if now is None:
+            now = self._clock()
+        out: List[bytes] = []
+        with self._lock:
+            for device_id, d in list(self._devices.items()):
+                idle = now - d.last_seen
+                if idle < self.idle_timeout_sec:
+                    continue                       # still sending: event time alone closes its windows
+                out.extend(self._close(device_id, d, d.max_ts + idle - self.allowed_lateness_sec))
+                if idle >= self.idle_ttl_sec and not any(d.open.values()):
+                    del self._devices[device_id]
+        self._emit(out)
+
+    def flush(self) -> None:
+        """Publish every open window now (partial windows included) - call on shutdown."""
+        out: List[bytes] = []
+        with self._lock:
+            for device_id, d in self._devices.items():
+                out.extend(self._close(device_id, d, float("inf")))
+        self._emit(out)
+
+    def _emit(self, payloads: List[bytes]) -> None:
+        for p in payloads:
+            self.publish(p)
+        if payloads:
+            with self._lock:
+                self.published += len(payloads)
+
+    @staticmethod
+    def _summary(device_id: str, start: int, window_sec: int, a: _Agg) -> bytes:
+        return json.dumps({
+            "device_id": device_id,
+            "window_start": start,
+            "window_sec": window_sec,
+            "count": a.count,
+            "temperature_c_min": a.t_min,
+            "temperature_c_max": a.t_max,
+            "temperature_c_mean": round(a.t_sum / a.count, 2),
+            "humidity_pct_min": a.h_min,
+            "humidity_pct_max": a.h_max,
+            "humidity_pct_mean": round(a.h_sum / a.count, 2),
+            "schema_version": ROLLUP_SCHEMA_VERSION,
+        }, separators=(",", ":")).encode("utf-8")
+
+    def __len__(self) -> int:
+        return len(self._devices)
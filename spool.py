@@ -0,0 +1,416 @@
+"""
+spool.py
+--------
+Store-and-forward for outgoing MQTT payloads.
+
+`SegmentSpool` is a persistent, append-only log made of fixed-size,
+memory-mapped segment files:
+
+    <dir>/00000000000000000000.seg, ...   records (name = first sequence number)
+    <dir>/cursor                          checkpoint: every seq below this is acknowledged
+
+    record = | u32 length | u32 crc32 | u64 seq | u16 topic_len | topic | payload |
+
+Every payload is appended before it is published and acknowledged (by seq)
+when its QoS1 PUBACK future completes. An append lands in the page cache at
+once, so it survives a crash of the process; the mapped pages are msync'ed
+at every segment rotation and cursor checkpoint, and otherwise at most
+`sync_every_sec` later (StoreAndForward's replay thread calls sync()), so a
+power loss costs at most that much of the newest data. Fully acknowledged segments are
+deleted; if the log grows past `max_bytes` the oldest segment is dropped
+(and counted) so the disk can never fill up.
+
+`StoreAndForward` wraps any transport (see transport.py) with that log:
+live payloads are still published immediately when the link is up, and a
+background thread replays whatever was not acknowledged (link down,
+publish error, process restart) in rate-limited batches, interleaved with
+the live traffic. Replay streams records from the mmapped segments, so
+the backlog is never loaded into RAM as a whole.
+"""
+
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+from concurrent.futures import Future
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+
+_HEADER = struct.Struct("<IIQH")          # length, crc32, seq, topic_len
+_SEG_SUFFIX = ".seg"
+
+
+class _Segment:
+    """One segment file: [first_seq, next_seq) stored in `path`, mapped while open."""
+    __slots__ = ("path", "first_seq", "next_seq", "end", "synced", "size", "_file", "mm")
+
+    def __init__(self, path: str, first_seq: int, size: int):
+        self.path = path
+        self.first_seq = first_seq
+        self.next_seq = first_seq       # seq the next record in this segment would get
+        self.end = 0                    # byte offset where the next record would be written
+        self.synced = 0                 # bytes [0, synced) are known to be on disk
+        self.size = size
+        self._file = None
+        self.mm: Optional[mmap.mmap] = None
+
+    def open(self, create: bool = False) -> mmap.mmap:
+        if self.mm is None:
+            if create:
+                with open(self.path, "wb") as f:
+                    f.truncate(self.size)                   # preallocate (sparse) so the mapping never grows
+            self._file = open(self.path, "r+b")
+            self.size = os.fstat(self._file.fileno()).st_size
+            self.mm = mmap.mmap(self._file.fileno(), self.size)
+        return self.mm
+
+    def sync(self) -> None:
+        """msync the bytes written since the last sync (offset rounded down to a page, as mmap.flush requires)."""
+        if self.mm is not None and self.synced < self.end:
+            start = self.synced - self.synced % mmap.ALLOCATIONGRANULARITY
+            self.mm.flush(start, self.end - start)
+            self.synced = self.end
+
+    def close(self) -> None:
+        if self.mm is not None:
+            self.mm.flush()
+            self.synced = self.end
+            self.mm.close()
+            self._file.close()
+            self.mm = self._file = None
+
+    def records(self, start: int = 0) -> Iterator[Tuple[int, int, str, bytes]]:
+        """Yield (offset, seq, topic, payload) from byte `start` until the end marker or a torn record."""
+        mm = self.open()
+        pos = start
+        while pos + _HEADER.size <= self.size:
+            length, crc, seq, tlen = _HEADER.unpack_from(mm, pos)
+            if length == 0 or pos + _HEADER.size + length > self.size:
+                return
+            body = mm[pos + _HEADER.size: pos + _HEADER.size + length]
+            if zlib.crc32(body) != crc:
+                return                                       # torn write at the tail (crash mid-append)
+            yield pos, seq, body[:tlen].decode("utf-8"), body[tlen:]
+            pos += _HEADER.size + length
+
+
+class SegmentSpool:
+    """
+    Append-only, memory-mapped, size-bounded payload log with an ack cursor.
+
+    Args:
+        directory:     where segment files and the cursor checkpoint live.
+        segment_bytes: size of each segment file.
+        max_bytes:     disk budget; the oldest segment is dropped when it is exceeded.
+        checkpoint_every: write the cursor file after this many cursor moves (and on close()).
+        sync_every_sec: msync appended records at least this often (0 = after every append).
+    """
+
+    def __init__(self, directory: str, segment_bytes: int = 4 * 1024 * 1024,
+                 max_bytes: int = 256 * 1024 * 1024, checkpoint_every: int = 100,
+                 sync_every_sec: float = 1.0):
+        os.makedirs(directory, exist_ok=True)
+        self.directory = directory
+        self.segment_bytes = segment_bytes
+        self.max_bytes = max_bytes
+        self.checkpoint_every = checkpoint_every
+        self.sync_every_sec = sync_every_sec
+        self._last_sync = time.monotonic()
+        self._lock = threading.RLock()
+        self._segments: List[_Segment] = []
+        self._acked_above: Set[int] = set()            # acked out of order, above the cursor
+        self._moves = 0
+        self._hint: Tuple[int, Optional[_Segment], int] = (-1, None, 0)   # (seq, segment, offset) where the last read stopped
+        self.dropped = 0                                # records lost to the disk budget
+        self.cursor = self._load_cursor()               # every seq < cursor is acknowledged
+        self._recover()
+
+    # ---- startup ---------------------------------------------------------------
+    def _cursor_path(self) -> str:
+        return os.path.join(self.directory, "cursor")
+
+    def _load_cursor(self) -> int:
+        try:
+            with open(self._cursor_path(), "r", encoding="ascii") as f:
+                return int(f.read().strip() or 0)
+        except FileNotFoundError:
+            return 0
+
+    def _recover(self) -> None:
+        """Rebuild the segment index by scanning records (streamed through mmap, not loaded)."""
+        names = sorted(n for n in os.listdir(self.directory) if n.endswith(_SEG_SUFFIX))
+        for name in names:
+            seg = _Segment(os.path.join(self.directory, name), int(name[:-len(_SEG_SUFFIX)]), 0)
+            seg.open()
+            for pos, seq, topic, payload in seg.records():
+                seg.next_seq = seq + 1
+                seg.end = pos + _HEADER.size + len(topic.encode("utf-8")) + len(payload)
+            if seg.end + _HEADER.size <= seg.size:
+                seg.mm[seg.end:seg.end + _HEADER.size] = bytes(_HEADER.size)   # wipe a torn tail record
+            seg.close()
+            self._segments.append(seg)
+        if self._segments:
+            self.cursor = max(self.cursor, self._segments[0].first_seq)
+        self._delete_acked_segments()
+
+    @property
+    def next_seq(self) -> int:
+        return self._segments[-1].next_seq if self._segments else self.cursor
+
+    def backlog(self) -> int:
+        """Records not acknowledged yet."""
+        with self._lock:
+            return self.next_seq - self.cursor - len(self._acked_above)
+
+    def disk_bytes(self) -> int:
+        return sum(seg.size for seg in self._segments)
+
+    # ---- write side ---------------------------------------------------------------
+    def append(self, topic: str, payload: bytes) -> int:
+        """Persist one payload; returns its sequence number."""
+        t = topic.encode("utf-8")
+        body = t + payload
+        need = _HEADER.size + len(body)
+        with self._lock:
+            seg = self._segments[-1] if self._segments else None
+            if seg is None or seg.end + need + _HEADER.size > seg.size:   # keep room for the end marker
+                if seg is not None:
+                    seg.close()
+                seq0 = self.next_seq
+                seg = _Segment(os.path.join(self.directory, f"{seq0:020d}{_SEG_SUFFIX}"), seq0,
+                               max(self.segment_bytes, need + _HEADER.size))
+                seg.open(create=True)
+                self._segments.append(seg)
+                self._enforce_budget()
+            mm = seg.open()
+            seq = seg.next_seq
+            _HEADER.pack_into(mm, seg.end, len(body), zlib.crc32(body), seq, len(t))
+            mm[seg.end + _HEADER.size: seg.end + need] = body
+            seg.end += need
+            seg.next_seq = seq + 1
+            if time.monotonic() - self._last_sync >= self.sync_every_sec:
+                self.sync()
+            return seq
+
+    def sync(self) -> None:
+        """msync what was appended to the current segment since the last sync (earlier ones are synced at rotation)."""
+        with self._lock:
+            if self._segments:
+                self._segments[-1].sync()
+            self._last_sync = time.monotonic()
+
+    def _enforce_budget(self) -> None:
+        while len(self._segments) > 1 and self.disk_bytes() > self.max_bytes:
+            seg = self._segments.pop(0)
+            lost = seg.next_seq - max(seg.first_seq, self.cursor)
+            self.dropped += max(lost, 0) - sum(1 for s in self._acked_above if s < seg.next_seq)
+            self._acked_above = {s for s in self._acked_above if s >= seg.next_seq}
+            self.cursor = max(self.cursor, seg.next_seq)
+            seg.close()
+            os.remove(seg.path)
+            self._checkpoint()
+
+    # ---- ack side -----------------------------------------------------------------
+    def ack(self, seq: int) -> None:
+        """Mark `seq` as delivered; moves the cursor over every contiguous acked record."""
+        with self._lock:
+            if seq < self.cursor:
+                return
+            self._acked_above.add(seq)
+            moved = False
+            while self.cursor in self._acked_above:
+                self._acked_above.discard(self.cursor)
+                self.cursor += 1
+                moved = True
+            if moved:
+                self._moves += 1
+                if self._moves >= self.checkpoint_every:
+                    self._checkpoint()
+                    self._delete_acked_segments()
+
+    def is_acked(self, seq: int) -> bool:
+        return seq < self.cursor or seq in self._acked_above
+
+    def _checkpoint(self) -> None:
+        self._moves = 0
+        if self._segments:
+            self._segments[-1].sync()                   # records on disk before the cursor that covers them
+        tmp = self._cursor_path() + ".tmp"
+        with open(tmp, "w", encoding="ascii") as f:
+            f.write(str(self.cursor))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp, self._cursor_path())
+
+    def _delete_acked_segments(self) -> None:
+        # Never delete the segment being written (the last one).
+        while len(self._segments) > 1 and self._segments[0].next_seq <= self.cursor:
+            seg = self._segments.pop(0)
+            seg.close()
+            os.remove(seg.path)
+
+    # ---- read side ----------------------------------------------------------------
+    def read(self, from_seq: int, max_records: int) -> List[Tuple[int, str, bytes]]:
+        """Up to `max_records` un-acked (seq, topic, payload) with seq >= from_seq, oldest first."""
+        out: List[Tuple[int, str, bytes]] = []
+        with self._lock:
+            from_seq = max(from_seq, self.cursor)
+            hint_seq, hint_seg, hint_pos = self._hint
+            for seg in list(self._segments):
+                if seg.next_seq <= from_seq:
+                    continue
+                start = hint_pos if (seg is hint_seg and hint_seq <= from_seq) else 0   # resume, don't rescan
+                for pos, seq, topic, payload in seg.records(start):
+                    if seq < from_seq or self.is_acked(seq):
+                        continue
+                    if len(out) >= max_records:
+                        self._hint = (seq, seg, pos)
+                        return out
+                    out.append((seq, topic, payload))
+        return out
+
+    def flush(self) -> None:
+        """Force mapped pages to disk and write the cursor checkpoint."""
+        with self._lock:
+            for seg in self._segments:
+                if seg.mm is not None:
+                    seg.mm.flush()
+            self._checkpoint()
+
+    def close(self) -> None:
+        with self._lock:
+            self._checkpoint()
+            for seg in self._segments:
+                seg.close()
+
+
+class StoreAndForward:
+    """
+    Transport wrapper: spool every payload, publish live when possible, replay the rest.
+
+    Args:
+        spool:        a SegmentSpool.
+        transport:    the real transport (e.g. mqtt_client.MqttClient).
+        replay_rate:  max replayed messages per second (live traffic is not limited).
+        replay_batch: records read from disk per replay step.
+        max_inflight: max replayed publishes waiting for PUBACK at once.
+
+    Call `set_online(False/True)` from the connection's interrupted/resumed
+    callbacks. While offline, payloads only go to disk.
+    """
+
+    def __init__(self, spool: SegmentSpool, transport, replay_rate: float = 50.0,
+                 replay_batch: int = 100, max_inflight: int = 100):
+        self.spool = spool
+        self.transport = transport
+        self.replay_rate = replay_rate
+        self.replay_batch = replay_batch
+        self.max_inflight = max_inflight
+        self.online = True
+        self._inflight: Dict[int, float] = {}           # seq -> publish time
+        self._replay_from = spool.cursor
+        self._failed_min: Optional[int] = None          # oldest seq that failed since the last replay step
+        self._lock = threading.Lock()
+        self._wake = threading.Event()
+        self._running = False
+        self._thread: Optional[threading.Thread] = None
+        self.replayed = 0
+
+    def set_online(self, online: bool) -> None:
+        self.online = online
+        if online:
+            with self._lock:
+                self._replay_from = self.spool.cursor   # go back over everything that failed meanwhile
+            self._wake.set()
+
+    # ---- transport interface --------------------------------------------------------
+    def publish(self, topic: str, payload: bytes) -> Optional[Future]:
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        with self._lock:                                 # in flight before the replayer can read the record
+            seq = self.spool.append(topic, payload)
+            if not self.online:
+                return None
+            self._inflight[seq] = time.monotonic()
+        return self._publish(seq, topic, payload)
+
+    def _claim(self, seq: int) -> bool:
+        """Mark a replayed record in flight, unless live traffic or an ack got to it first."""
+        with self._lock:
+            if seq in self._inflight or self.spool.is_acked(seq):
+                return False
+            self._inflight[seq] = time.monotonic()
+            return True
+
+    def _publish(self, seq: int, topic: str, payload: bytes) -> Optional[Future]:
+        """Publish a record the caller has put in `_inflight`."""
+        try:
+            future = self.transport.publish(topic, payload)
+        except Exception as e:
+            print("publish failed, spooled for replay:", repr(e))
+            self._done(seq, ok=False)
+            return None
+        if future is None:
+            self._done(seq, ok=True)
+            return None
+        future.add_done_callback(lambda f: self._done(seq, ok=f.exception() is None))
+        return future
+
+    def _done(self, seq: int, ok: bool) -> None:
+        with self._lock:
+            if ok:
+                self.spool.ack(seq)                      # acked before it leaves _inflight: _claim() never sees a gap
+            self._inflight.pop(seq, None)
+            if not ok:                                   # the replayer will pick it up again
+                self._failed_min = seq if self._failed_min is None else min(self._failed_min, seq)
+        if not ok:
+            self._wake.set()
+
+    # ---- replay ------------------------------------------------------------------------
+    def start(self) -> "StoreAndForward":
+        self._running = True
+        self._thread = threading.Thread(target=self._replay_loop, name="spool-replay", daemon=True)
+        self._thread.start()
+        return self
+
+    def stop(self) -> None:
+        self._running = False
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+        self.spool.close()
+
+    def _replay_loop(self) -> None:
+        interval = 1.0 / self.replay_rate if self.replay_rate > 0 else 0.0
+        while self._running:
+            self.spool.sync()                            # bounds what a power loss can take (sync_every_sec)
+            if not self.online or len(self._inflight) >= self.max_inflight:
+                self._wake.wait(0.5)
+                self._wake.clear()
+                continue
+            with self._lock:
+                if self._failed_min is not None:
+                    self._replay_from = min(self._replay_from, self._failed_min)
+                    self._failed_min = None
+                start = self._replay_from
+                busy = set(self._inflight)
+            batch = [r for r in self.spool.read(start, self.replay_batch) if r[0] not in busy]
+            if not batch:
+                with self._lock:
+                    self._replay_from = max(self._replay_from, self.spool.next_seq)
+                self._wake.wait(1.0)                     # nothing to replay; wait for a failure or reconnect
+                self._wake.clear()
+                continue
+            for seq, topic, payload in batch:
+                if not (self._running and self.online) or len(self._inflight) >= self.max_inflight:
+                    break
+                if not self._claim(seq):
+                    continue
+                self._publish(seq, topic, payload)
+                self.replayed += 1
+                with self._lock:
+                    self._replay_from = max(self._replay_from, seq + 1)
+                if interval:
+                    time.sleep(interval)                 # rate limit only the replay, not live data
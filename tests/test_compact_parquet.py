@@ -0,0 +1,59 @@
+import gzip
+import json
+
+import pytest
+
+pq = pytest.importorskip("pyarrow.parquet")
+
+from compact_parquet import compact  # noqa: E402
+
+T0 = 1762812000
+
+
+def _reading(i):
+    return {"device_id": "dev", "ts": T0 + i, "temperature_c": 21.0, "temperature_avg5_c": 21.0,
+            "humidity_pct": 40.0, "quality": "OK", "schema_version": "1.0"}
+
+
+def _rows(out_dir):
+    return sum(pq.read_table(str(p)).num_rows for p in out_dir.rglob("*.parquet"))
+
+
+def test_malformed_lines_are_skipped_not_fatal(tmp_path):
+    src, out = tmp_path / "src", tmp_path / "out"
+    src.mkdir()
+    good = [json.dumps(_reading(i)) for i in range(4)]
+    lines = [good[0], good[1][:-7],                              # truncated record
+             good[2] + good[3],                                   # two objects back to back
+             b"\xff\xfe not utf-8".decode("latin-1"), "[1, 2", json.dumps(_reading(4))]
+    (src / "a.json").write_text("\n".join(lines[:3]) + "\n")
+    (src / "b.json").write_bytes(b"\n".join(l.encode("latin-1") if "not utf-8" in l else l.encode() for l in lines[3:]))
+
+    c = compact(str(src), str(out))
+
+    assert c.bad_lines == 3
+    assert c.rows_out == 4 and _rows(out) == 4
+
+
+def test_truncated_gzip_keeps_rows_before_the_damage(tmp_path):
+    src, out = tmp_path / "src", tmp_path / "out"
+    src.mkdir()
+    blob = gzip.compress("".join(json.dumps(_reading(i)) + "\n" for i in range(1000)).encode())
+    (src / "a.json.gz").write_bytes(blob[:len(blob) // 2])
+
+    c = compact(str(src), str(out))
+
+    assert c.bad_lines == 1
+    assert 0 < c.rows_out < 1000 and _rows(out) == c.rows_out
+
+
+def test_out_of_range_ts_is_skipped_not_fatal(tmp_path):
+    src, out = tmp_path / "src", tmp_path / "out"
+    src.mkdir()
+    odd = [dict(_reading(0), ts=10 ** 17), dict(_reading(0), ts=2 ** 63), dict(_reading(0), ts=-1)]
+    (src / "a.json").write_text("\n".join(json.dumps(r) for r in [_reading(0), *odd, _reading(1)]) + "\n")
+
+    c = compact(str(src), str(out))
+
+    assert c.skipped == 3
+    assert c.rows_out == 2 and _rows(out) == 2
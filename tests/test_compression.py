@@ -0,0 +1,61 @@
+import math
+import random
+
+import numpy as np
+import pytest
+
+from compression import ReadingCompressor, SignalSpec, interpolate
+
+
+def _readings(n, temperature, humidity=lambda i: 40.0, step=2):
+    return [{"device_id": "dev", "ts": step * i, "temperature": temperature(i), "humidity": humidity(i)}
+            for i in range(n)]
+
+
+def _compress(c, readings):
+    return [p for r in readings for p in c.add(r)] + c.flush()
+
+
+def test_flat_signal_sends_only_the_heartbeat():
+    c = ReadingCompressor({"temperature": SignalSpec(deadband=0.5, swing_tolerance=0.3)}, max_interval_sec=60)
+    sent = [p["ts"] for r in _readings(100, lambda i: 21.0) for p in c.add(r)]
+    assert sent == list(range(0, 200, 60))                     # first reading, then every 60 s
+    assert c.ratio == pytest.approx(100 / 4)
+
+
+def test_flush_emits_the_held_reading():
+    c = ReadingCompressor({"temperature": SignalSpec(swing_tolerance=0.3)}, max_interval_sec=10**9)
+    readings = _readings(10, lambda i: 21.0)
+    assert [p for r in readings for p in c.add(r)] == readings[:1]
+    assert c.flush() == readings[-1:]                           # the trend's end point is not lost
+    assert c.flush() == []
+
+
+def test_deadband_rebuild_stays_within_deadband():
+    random.seed(1)
+    readings = _readings(2000, lambda i: 20 + 3 * math.sin(i / 50) + random.uniform(-0.2, 0.2))
+    c = ReadingCompressor({"temperature": SignalSpec(deadband=0.5)}, max_interval_sec=300)
+    points = _compress(c, readings)
+    rebuilt = interpolate(points, [r["ts"] for r in readings], "temperature", method="previous")
+    assert np.max(np.abs(rebuilt - [r["temperature"] for r in readings])) <= 0.5
+    assert len(points) < len(readings) / 5
+
+
+@pytest.mark.parametrize("seed", range(5))
+def test_swinging_door_rebuild_stays_within_tolerance(seed):
+    random.seed(seed)
+    readings = _readings(2000, lambda i: 20 + 3 * math.sin(i / 50) + random.uniform(-0.1, 0.1),
+                         humidity=lambda i: 40 + 10 * math.cos(i / 70) + random.uniform(-0.5, 0.5))
+    c = ReadingCompressor({"temperature": SignalSpec(deadband=2.0, swing_tolerance=0.3),
+                           "humidity": SignalSpec(deadband=5.0, swing_tolerance=1.0)}, max_interval_sec=300)
+    points = _compress(c, readings)
+    ts = [r["ts"] for r in readings]
+    for field, tolerance in (("temperature", 0.3), ("humidity", 1.0)):
+        rebuilt = interpolate(points, ts, field)
+        assert np.max(np.abs(rebuilt - [r[field] for r in readings])) <= tolerance
+    assert len(points) < len(readings) / 10
+
+
+def test_unknown_interpolation_method():
+    with pytest.raises(ValueError):
+        interpolate([{"ts": 0, "temperature": 1.0}], [0], "temperature", method="cubic")
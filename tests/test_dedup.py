@@ -0,0 +1,124 @@
+import json
+
+import pytest
+
+import wire
+from dedup import DedupIndex, reading_key
+from models_and_processor import WindowStore, process_bytes
+
+T0 = 1762812000
+
+
+def _raw(ts, temperature=21.5):
+    return json.dumps({"device_id": "dev", "ts": ts, "temperature": temperature, "humidity": 40.0}).encode()
+
+
+def _deliver(index, store, payload):
+    """What the edge does per RAW message: check, process, remember only on success."""
+    if index.is_duplicate(payload):
+        return "duplicate"
+    ok, res = process_bytes(payload, store)
+    if ok:
+        index.remember_payload(res)
+    return ok
+
+
+def test_malformed_first_delivery_does_not_hide_the_valid_redelivery():
+    index, store = DedupIndex(), WindowStore()
+    assert _deliver(index, store, _raw(T0, temperature=999)) is False     # rejected: out of range
+    assert _deliver(index, store, _raw(T0)) is True                        # same key, valid: processed
+    assert _deliver(index, store, _raw(T0)) == "duplicate"                 # the QoS1 replay of it is not
+    assert index.suppressed == 1
+
+
+def test_clean_result_key_matches_raw_key():
+    store = WindowStore()
+    for raw in (_raw(T0), wire.encode_raw(json.loads(_raw(T0)))):
+        ok, res = process_bytes(raw, store)
+        assert ok and reading_key(res) == reading_key(raw) == (b"dev", T0)
+
+
+def test_late_readings_within_the_window_are_still_checked():
+    index = DedupIndex(window_sec=3600)
+    for i in range(1000):                          # far more than any fixed-size ring would hold
+        index.remember(b"dev", T0 + i)
+    assert index.seen(b"dev", T0)                  # 1000 readings late, 999 s behind: still a duplicate
+    assert not index.seen(b"dev", T0 - 1)          # never seen: a late but new reading passes
+
+
+def test_readings_beyond_the_window_pass_instead_of_being_dropped():
+    index = DedupIndex(window_sec=60)
+    index.remember(b"dev", T0 - 600)
+    index.remember(b"dev", T0)
+    assert not index.seen(b"dev", T0 - 600)        # pruned: cannot tell, so never drop (spool backlog)
+    assert not index.seen(b"dev", T0 - 700)
+    assert index.too_late == 2
+    assert index.seen(b"dev", T0)
+
+
+def test_memory_is_bounded_per_device_and_by_ttl():
+    now = [0.0]
+    index = DedupIndex(window_sec=10**9, per_device=100, ttl_sec=60, clock=lambda: now[0])
+    for i in range(1000):
+        index.remember(b"a", T0 + i)
+    d = index._devices[b"a"]
+    assert len(d.members) == len(d.order) == 100
+    assert index.seen(b"a", T0 + 999) and not index.seen(b"a", T0)
+    now[0] = 120
+    index.remember(b"b", T0)
+    assert len(index) == 1                         # "a" idle past ttl_sec
+
+
+@pytest.mark.parametrize("device_id", ["café-1", "温度-7"])
+def test_non_ascii_device_gives_one_key_in_every_encoding(device_id):
+    reading = {"device_id": device_id, "ts": T0, "temperature": 21.5, "humidity": 40.0}
+    raws = [json.dumps(reading).encode(),                          # \u escapes
+            json.dumps(reading, ensure_ascii=False).encode(),      # plain UTF-8
+            wire.encode_raw(reading)]
+    store = WindowStore()
+    keys = {reading_key(r) for r in raws}
+    keys.add(reading_key(process_bytes(raws[0], store)[1]))      # the CLEAN result the pool path remembers
+    assert keys == {(device_id.encode("utf-8"), T0)}
+    for raw in raws:
+        index = DedupIndex()
+        assert _deliver(index, WindowStore(), raw) is True
+        assert _deliver(index, WindowStore(), raw) == "duplicate"
+
+
+def test_per_device_must_be_positive():
+    with pytest.raises(ValueError):
+        DedupIndex(per_device=0)
+
+
+@pytest.fixture
+def edge():
+    """edge_processor_clean wired to an in-memory broker, processing inside the callback."""
+    edge_processor_clean = pytest.importorskip("edge_processor_clean")
+    from mqtt_client import MqttClient
+    from transport import InMemoryConnection
+    import models_and_processor
+
+    E = edge_processor_clean
+    conn = InMemoryConnection()
+    saved = E.client, E.pipeline, E.batcher, E.rollup, E.dedup, E.metrics
+    E.client = MqttClient(conn)
+    E.client.connect()
+    E.pipeline = E.batcher = E.rollup = E.metrics = None
+    E.dedup = DedupIndex()
+    models_and_processor._store.restore({})
+    yield E, conn.bus
+    E.client, E.pipeline, E.batcher, E.rollup, E.dedup, E.metrics = saved
+    models_and_processor._store.restore({})
+
+
+def test_batch_redelivery_is_checked_per_reading(edge):
+    from batch_publisher import pack_json_batch
+
+    E, bus = edge
+    batch = pack_json_batch([_raw(T0, temperature=999), _raw(T0 + 1), _raw(T0 + 2)])   # first one rejected
+    E.on_msg(E.RAW_TOPIC, batch, False, 1, False)
+    assert len(bus.messages) == 2
+    E.on_msg(E.RAW_TOPIC, batch, True, 1, False)            # QoS1 redelivery of the whole batch
+    assert len(bus.messages) == 2 and E.dedup.suppressed == 2
+    E.on_msg(E.RAW_TOPIC, _raw(T0), False, 1, False)        # the rejected reading, now valid
+    assert len(bus.messages) == 3
@@ -0,0 +1,93 @@
+import json
+import os
+import signal
+import sys
+import threading
+import time
+
+import pytest
+
+from edge_multiproc import ProcessShardPool
+
+pytestmark = pytest.mark.skipif(sys.platform == "win32", reason="uses SIGSTOP/SIGKILL")
+
+T0 = 1762812000
+
+
+def _raw(device_id, ts, temperature=20.0):
+    return json.dumps({"device_id": device_id, "ts": ts, "temperature": temperature, "humidity": 40.0}).encode()
+
+
+class _Results:
+    def __init__(self):
+        self.items, self._lock = [], threading.Lock()
+
+    def __call__(self, ok, res):
+        with self._lock:
+            self.items.append((ok, res))
+
+    def wait_for(self, n, timeout=30.0):
+        deadline = time.monotonic() + timeout
+        while len(self.items) < n and time.monotonic() < deadline:
+            time.sleep(0.01)
+        return len(self.items) >= n
+
+
+def test_round_trip_through_two_workers():
+    results = _Results()
+    pool = ProcessShardPool(results, workers=2, batch_size=8).start()
+    devices = ["dev-%d" % i for i in range(6)]
+    try:
+        for i in range(20):
+            for dev in devices:
+                pool.submit("t", _raw(dev, T0 + i))
+    finally:
+        pool.stop()
+    assert len(results.items) == 120 and all(ok for ok, _ in results.items)
+    docs = [json.loads(res) for _, res in results.items]
+    for dev in devices:
+        assert [d["ts"] for d in docs if d["device_id"] == dev] == [T0 + i for i in range(20)]
+    assert pool.dropped == pool.lost_batches == pool.restarts == 0
+
+
+def test_full_worker_queue_drops_and_counts():
+    results = _Results()
+    pool = ProcessShardPool(results, workers=1, batch_size=1, queue_size=2).start()
+    pid = pool._procs[0].pid
+    os.kill(pid, signal.SIGSTOP)
+    try:
+        for i in range(50):
+            pool.submit("t", _raw("d", T0 + i))
+        assert pool.dropped > 0
+    finally:
+        os.kill(pid, signal.SIGCONT)
+        pool.stop()
+    assert pool.dropped + len(results.items) == 50                   # every message is either handled or counted
+
+
+def test_killed_worker_restarts_from_its_snapshot(tmp_path):
+    results = _Results()
+    pool = ProcessShardPool(results, workers=1, state_dir=str(tmp_path), batch_size=1,
+                            snapshot_every_sec=0).start()            # snapshot after every batch
+    try:
+        for i in range(4):
+            pool.submit("t", _raw("d", T0 + i, temperature=20.0))
+        assert results.wait_for(4)
+        assert (tmp_path / "shard-0.json").exists()
+
+        old = pool._procs[0]
+        os.kill(old.pid, signal.SIGSTOP)
+        for i in range(4, 7):                                         # queued for a worker about to die
+            pool.submit("t", _raw("d", T0 + i))
+        os.kill(old.pid, signal.SIGKILL)
+        deadline = time.monotonic() + 30
+        while pool._procs[0] is old and time.monotonic() < deadline:
+            time.sleep(0.01)
+        assert pool.restarts == 1 and pool.lost_batches == 3
+
+        pool.submit("t", _raw("d", T0 + 7, temperature=30.0))
+        assert results.wait_for(5)
+    finally:
+        pool.stop()
+    ok, res = results.items[-1]
+    assert ok and json.loads(res)["temperature_avg5_c"] == 22.0      # (4 x 20 + 30) / 5: window reloaded
@@ -0,0 +1,67 @@
+import json
+import threading
+
+import wire
+from batch_publisher import pack_json_batch
+from edge_pipeline import ShardedPipeline, device_key, shard_for
+
+T0 = 1762812000
+
+
+def _raw(device_id, ts):
+    return json.dumps({"device_id": device_id, "ts": ts, "temperature": 21.5, "humidity": 40.0}).encode()
+
+
+def _queued(pipe, shard):
+    return [item[1] for item in list(pipe.queues[shard].queue)]
+
+
+def test_drop_newest_keeps_the_queue_and_counts():
+    pipe = ShardedPipeline(lambda *a: None, workers=1, queue_size=2, overflow="drop_newest")   # not started
+    assert pipe.submit("t", _raw("d", T0)) and pipe.submit("t", _raw("d", T0 + 1))
+    assert pipe.submit("t", _raw("d", T0 + 2)) is False
+    assert pipe.dropped == 1
+    assert _queued(pipe, 0) == [_raw("d", T0), _raw("d", T0 + 1)]
+
+
+def test_drop_oldest_makes_room_and_counts():
+    pipe = ShardedPipeline(lambda *a: None, workers=1, queue_size=2, overflow="drop_oldest")
+    for i in range(2):
+        assert pipe.submit("t", _raw("d", T0 + i))
+    assert pipe.submit("t", _raw("d", T0 + 2)) is False
+    assert pipe.submit("t", _raw("d", T0 + 3)) is False
+    assert pipe.dropped == 2
+    assert _queued(pipe, 0) == [_raw("d", T0 + 2), _raw("d", T0 + 3)]
+
+
+def test_per_device_order_is_preserved_across_workers():
+    seen, lock = {}, threading.Lock()
+
+    def handler(topic, payload, store):
+        d = json.loads(payload)
+        with lock:
+            seen.setdefault(d["device_id"], []).append((threading.current_thread().name, d["ts"]))
+
+    pipe = ShardedPipeline(handler, workers=4, queue_size=10_000).start()
+    devices = ["dev-%d" % i for i in range(20)]
+    for i in range(200):
+        for dev in devices:
+            pipe.submit("t", _raw(dev, T0 + i))
+    pipe.stop()
+    assert sorted(seen) == sorted(devices)
+    for dev, got in seen.items():
+        assert [ts for _, ts in got] == [T0 + i for i in range(200)]
+        assert len({name for name, _ in got}) == 1                   # one worker owns the device
+
+
+def test_multi_device_batch_is_split_onto_each_devices_shard():
+    devices = ["dev-%d" % i for i in range(8)]
+    assert len({shard_for(d.encode(), 4) for d in devices}) > 1     # the batch really spans shards
+    readings = [_raw(dev, T0) for dev in devices]
+    binary = [wire.encode_raw(json.loads(r)) for r in readings]
+    for batch, items in ((pack_json_batch(readings), readings), (wire.pack_batch(binary), binary)):
+        pipe = ShardedPipeline(lambda *a: None, workers=4, queue_size=100)
+        assert pipe.submit("t", batch)
+        for raw in items:
+            assert raw in _queued(pipe, shard_for(device_key(raw), 4))
+        assert pipe.depth() == len(items)
@@ -0,0 +1,54 @@
+import sys
+import threading
+
+import numpy as np
+
+from live_plot import RingBuffer
+
+
+def test_snapshot_is_chronological_and_bounded():
+    ring = RingBuffer(8)
+    for i in range(5):
+        ring.append(float(i), float(i), float(i))
+    assert ring.snapshot(2.0)[0].tolist() == [2.0, 3.0, 4.0]
+    for i in range(5, 20):
+        ring.append(float(i), float(i), float(i))
+    t, temp, hum = ring.snapshot(0.0)
+    # the oldest slot is the one the writer would fill next, so it is never handed out
+    assert t.tolist() == [float(i) for i in range(13, 20)]
+
+
+def test_snapshot_drops_the_slot_being_written():
+    """The writer fills a slot before it bumps count: a reader in between must not return that slot."""
+    ring = RingBuffer(8)
+    for i in range(20):
+        ring.append(float(i), float(i), float(i))
+    slot = ring.count % ring.capacity                # append(20.0, ...) paused after its first store
+    ring.t[slot] = 20.0
+    t, temp, hum = ring.snapshot(0.0)
+    assert t.tolist() == temp.tolist() == [float(i) for i in range(13, 20)]
+
+
+def test_snapshot_never_returns_a_torn_sample_under_concurrent_writes():
+    ring = RingBuffer(16)
+    stop = threading.Event()
+
+    def writer():
+        i = 0
+        while not stop.is_set():
+            ring.append(float(i), float(i), float(i))
+            i += 1
+
+    old = sys.getswitchinterval()
+    sys.setswitchinterval(1e-6)                      # switch threads as often as possible
+    th = threading.Thread(target=writer, daemon=True)
+    th.start()
+    try:
+        for _ in range(20_000):
+            t, temp, hum = ring.snapshot(0.0)
+            assert np.array_equal(t, temp) and np.array_equal(t, hum)
+            assert np.all(np.diff(t) == 1.0)
+    finally:
+        stop.set()
+        th.join()
+        sys.setswitchinterval(old)
@@ -0,0 +1,101 @@
+import os
+import signal
+import sys
+import threading
+import time
+
+import pytest
+
+from mqtt_client import MqttClient, PublishDropped
+from transport import InMemoryConnection
+
+
+def _client(**kwargs):
+    conn = InMemoryConnection(auto_ack=False)
+    client = MqttClient(conn, **kwargs)
+    client.connect()
+    return client, conn
+
+
+def test_window_bounds_in_flight_and_queue_drains_on_ack():
+    client, conn = _client(max_in_flight=3)
+    futures = [client.publish("t", b"%d" % i) for i in range(5)]
+    assert client.in_flight == 3 and client.queued == 2
+    assert conn.bus.published == 3                  # the rest wait for a slot
+    conn.ack(1)
+    assert client.in_flight == 3 and client.queued == 1
+    while conn.ack():
+        pass
+    assert client.in_flight == 0 and client.queued == 0
+    assert all(f.done() and f.exception() is None for f in futures)
+    assert [p for _, p in conn.bus.messages] == [b"0", b"1", b"2", b"3", b"4"]
+
+
+def test_queue_overflow_drops_oldest():
+    client, conn = _client(max_in_flight=1, max_queued=2)
+    futures = [client.publish("t", b"x") for _ in range(5)]
+    assert client.dropped == 2 and client.queued == 2
+    for f in futures[1:3]:
+        with pytest.raises(PublishDropped):
+            f.result(0)
+    while conn.ack():
+        pass
+    assert all(f.exception() is None for f in (futures[0], *futures[3:]))
+
+
+def test_wait_for_capacity_blocks_until_acked():
+    client, conn = _client(max_in_flight=1)
+    client.publish("t", b"x")
+    assert client.pressure() == 1.0
+    assert not client.wait_for_capacity(0.01)
+    threading.Timer(0.05, conn.ack).start()
+    assert client.wait_for_capacity(5)
+
+
+def test_offline_publishes_queue_until_resumed():
+    client, conn = _client(max_in_flight=10)
+    client.on_interrupted(error="lost")
+    f = client.publish("t", b"x")
+    assert client.queued == 1 and conn.bus.published == 0
+    client.on_resumed(session_present=True)
+    conn.ack()
+    assert f.result(0) is not None and client.queued == 0
+
+
+def test_slow_acks_shrink_the_window():
+    now = [0.0]
+    client, conn = _client(max_in_flight=16, min_in_flight=2, target_ack_sec=0.5, clock=lambda: now[0])
+    for _ in range(16):
+        client.publish("t", b"x")
+    now[0] = 2.0                                    # every PUBACK comes back 4x too late
+    conn.ack()
+    assert client.window == 8.0                     # one cut per round trip, not one per ack
+
+
+def test_connect_retries_with_backoff():
+    conn = InMemoryConnection(connect_failures=2)
+    client = MqttClient(conn, backoff_base_sec=0.01)
+    slept = []
+    client.connect(sleep=slept.append)
+    assert len(slept) == 2 and client.online
+    with pytest.raises(ConnectionError):
+        MqttClient(InMemoryConnection(connect_failures=5)).connect(max_attempts=2, sleep=lambda s: None)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="uses SIGSTOP")
+def test_pool_submit_never_blocks_on_a_stuck_worker():
+    """The MQTT thread submits; if it blocked on a full worker queue, no PUBACK could arrive."""
+    from edge_multiproc import ProcessShardPool
+
+    pool = ProcessShardPool(lambda ok, res: None, workers=1, batch_size=1, queue_size=2).start()
+    pid = pool._procs[0].pid
+    os.kill(pid, signal.SIGSTOP)
+    try:
+        t0 = time.monotonic()
+        for i in range(50):
+            pool.submit("t", b'{"device_id": "d", "ts": %d, "temperature": 20, "humidity": 40}' % i)
+        assert time.monotonic() - t0 < 1.0
+        assert pool.dropped > 0
+    finally:
+        os.kill(pid, signal.SIGCONT)
+        pool.stop()
@@ -0,0 +1,91 @@
+import json
+
+import pytest
+
+from loadgen import generate
+from models_and_processor import WindowStore, process, process_batch, process_bytes
+
+ODD_PAYLOADS = [
+    b'\xff\xfe',                                                                       # not UTF-8
+    b'{"device_id": "d\xff", "ts": 1, "temperature": 20.0, "humidity": 40.0}',          # not UTF-8 inside a string
+    b'{"device_id": "big", "ts": 9223372036854775808, "temperature": 20.0, "humidity": 40.0}',  # ts > int64 (own device:
+                                                                                      # process_batch rejects it)
+    b'{"device_id": "d", "ts": "12", "temperature": "20.5", "humidity": 40}',           # needs coercion
+    b'{"device_id": "d", "ts": true, "temperature": 20.0, "humidity": 40.0}',
+    b'{"device_id": "d", "ts": 1, "temperature": 126.0, "humidity": 40.0}',
+    b'',
+    b'[]',
+]
+
+
+def _load():
+    return [p for _kind, p in generate(3000, devices=20, seed=3)] + ODD_PAYLOADS
+
+
+def _reference(payloads):
+    """process() on each payload, as it is called from the JSON text."""
+    store = WindowStore()
+    out = []
+    for p in payloads:
+        try:
+            text = p.decode("utf-8")
+        except UnicodeDecodeError:
+            text = p
+        ok, res = process(text, store)
+        out.append((ok, json.dumps(res.model_dump()).encode("utf-8") if ok else res))
+    return out
+
+
+def test_process_bytes_matches_process():
+    payloads = _load()
+    store = WindowStore()
+    assert [process_bytes(p, store) for p in payloads] == _reference(payloads)
+
+
+def test_process_bytes_rejects_non_utf8_instead_of_raising():
+    ok, err = process_bytes(b'\xff\xfe', WindowStore())
+    assert not ok and err.startswith("schema_error:") and "json_invalid" in err
+
+
+def test_process_batch_matches_process():
+    payloads = _load()
+    expected = _reference(payloads)
+    res = process_batch(payloads, WindowStore())
+    rows = iter(res.rows())
+    for i, (ok, want) in enumerate(expected):
+        if b"9223372036854775808" in payloads[i]:
+            # documented difference: ts must fit the int64 column
+            assert not res.ok[i] and "64-bit" in res.errors[i]
+            continue
+        assert bool(res.ok[i]) == ok, payloads[i]
+        if ok:
+            assert next(rows) == json.loads(want)
+        else:
+            assert res.errors[i] == want
+
+
+@pytest.mark.parametrize("payload", ODD_PAYLOADS)
+def test_odd_payloads_never_raise(payload):
+    process_bytes(payload, WindowStore())
+    process_batch([payload], WindowStore())
+
+
+def test_long_running_stores_are_bounded():
+    from edge_pipeline import ShardedPipeline
+    from models_and_processor import WINDOW_MAX_DEVICES, WINDOW_TTL_SEC, _store, new_window_store
+
+    pipeline = ShardedPipeline(lambda *a: None, workers=2)
+    for store in (_store, new_window_store(), *pipeline.stores):
+        assert store.ttl_sec == WINDOW_TTL_SEC and store.max_devices == WINDOW_MAX_DEVICES
+
+
+def test_window_store_evicts_idle_and_least_recent_devices():
+    now = [0.0]
+    store = WindowStore(maxlen=5, ttl_sec=100, max_devices=2, clock=lambda: now[0])
+    store.update("a", 20.0, 1)
+    store.update("b", 20.0, 1)
+    store.update("c", 20.0, 1)                      # over max_devices: "a" goes
+    assert "a" not in store and len(store) == 2
+    now[0] = 150
+    store.update("c", 21.0, 2)                      # "b" has been idle past the TTL
+    assert "b" not in store and len(store) == 1
@@ -0,0 +1,36 @@
+import pytest
+
+pub = pytest.importorskip("publisher_dht11_to_aws_iot")
+
+from models_and_processor import WindowStore, process_bytes
+from transport import InMemoryBus
+
+T0 = 1762812000
+
+
+def _readings():
+    return [{"device_id": "dev-%d" % (i % 3), "ts": T0 + 2 * i, "temperature": 20 + (i % 7) / 2,
+             "humidity": 40.0 + i % 5} for i in range(60)]
+
+
+def test_fused_publishes_what_the_staged_edge_would():
+    fused_bus = InMemoryBus()
+    fused = pub.ReadingPipeline(fused_bus, "raw", clean_topic="clean", fused=True, publish_raw=False)
+    staged_bus = InMemoryBus()
+    staged = pub.ReadingPipeline(staged_bus, "raw")
+    for r in _readings():
+        fused.handle(dict(r))
+        staged.handle(dict(r))
+
+    edge = WindowStore()
+    staged_clean = [res for ok, res in (process_bytes(p, edge) for p in staged_bus.on("raw")) if ok]
+    assert fused_bus.on("raw") == []
+    assert fused_bus.on("clean") == staged_clean
+    assert len(staged_clean) == 60
+
+
+def test_published_readings_are_printed_only_when_verbose(capsys):
+    for verbose in (False, True):
+        pipe = pub.ReadingPipeline(InMemoryBus(), "raw", verbose=verbose)
+        pipe.handle(_readings()[0])
+        assert ("pub:" in capsys.readouterr().out) is verbose
@@ -0,0 +1,79 @@
+import json
+
+from rollup import RollupAggregator
+
+T0 = 1762812000                     # an hour boundary
+
+
+class _Clock:
+    def __init__(self, now):
+        self.now = now
+
+    def __call__(self):
+        return self.now
+
+
+def _collect():
+    out = []
+    return out, lambda p: out.append(json.loads(p))
+
+
+def test_backlog_replay_keeps_every_reading_in_its_window():
+    """2 h of spooled readings replayed a day later, with tick() running meanwhile: nothing is late."""
+    out, publish = _collect()
+    clock = _Clock(T0 + 86_400)
+    agg = RollupAggregator(publish, windows_sec=(60, 3600), allowed_lateness_sec=30, clock=clock)
+    for i in range(3600):                          # one reading every 2 s for 2 hours
+        agg.add("dev", T0 + 2 * i, 20.0 + (i % 10) / 10, 40.0)
+        if i % 100 == 0:
+            clock.now += 0.1
+            agg.tick()
+    agg.flush()
+
+    assert agg.late == 0
+    hourly = sorted((s["window_start"], s["count"]) for s in out if s["window_sec"] == 3600)
+    assert hourly == [(T0, 1800), (T0 + 3600, 1800)]
+    minutes = [s for s in out if s["window_sec"] == 60]
+    assert len(minutes) == 120 and all(s["count"] == 30 for s in minutes)
+
+
+def test_window_closes_by_event_time_watermark():
+    out, publish = _collect()
+    agg = RollupAggregator(publish, windows_sec=(60,), allowed_lateness_sec=10, clock=_Clock(T0))
+    agg.add("dev", T0 + 5, 21.0, 40.0)
+    agg.add("dev", T0 + 65, 22.0, 40.0)            # watermark T0+55: first window still open
+    assert out == []
+    agg.add("dev", T0 + 50, 23.0, 41.0)            # out of order but within lateness: folded in
+    agg.add("dev", T0 + 71, 22.0, 40.0)            # watermark T0+61 closes [T0, T0+60)
+    assert [(s["window_start"], s["count"], s["temperature_c_max"]) for s in out] == [(T0, 2, 23.0)]
+    agg.add("dev", T0 + 30, 20.0, 40.0)            # that window is closed now
+    assert agg.late == 1
+
+
+def test_idle_device_is_flushed_by_processing_time():
+    out, publish = _collect()
+    clock = _Clock(T0 + 1000.0)
+    agg = RollupAggregator(publish, windows_sec=(60,), allowed_lateness_sec=10, idle_timeout_sec=120,
+                           idle_ttl_sec=600, clock=clock)
+    agg.add("dev", T0 + 5, 21.0, 40.0)
+    clock.now += 100
+    agg.tick()
+    assert out == []                                # not idle long enough yet
+    clock.now += 30
+    agg.tick()
+    assert [(s["window_start"], s["count"]) for s in out] == [(T0, 1)]
+    clock.now += 600
+    agg.tick()
+    assert len(agg) == 0                            # forgotten after idle_ttl_sec
+
+
+def test_far_future_reading_does_not_make_real_readings_late():
+    out, publish = _collect()
+    agg = RollupAggregator(publish, windows_sec=(60,), allowed_lateness_sec=10, max_future_sec=300,
+                           clock=_Clock(T0 + 10))
+    agg.add("dev", T0 + 5, 21.0, 40.0)
+    agg.add("dev", 4_000_000_000, 99.0, 40.0)       # bad RTC: year 2096
+    agg.add("dev", T0 + 8, 22.0, 40.0)
+    assert agg.future == 1 and agg.late == 0 and out == []
+    agg.add("dev", T0 + 250, 22.0, 40.0)            # up to max_future_sec ahead is fine
+    assert [(s["window_start"], s["count"]) for s in out] == [(T0, 2)]
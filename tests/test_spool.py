@@ -0,0 +1,125 @@
+import os
+import signal
+import subprocess
+import sys
+import threading
+import time
+
+import pytest
+
+from mqtt_client import MqttClient
+from spool import SegmentSpool, StoreAndForward
+from transport import InMemoryConnection
+
+REPO = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+# Appends forever; every record is acked 10 appends later and the cursor is checkpointed on every move.
+_WRITER = """
+import sys
+from spool import SegmentSpool
+s = SegmentSpool(sys.argv[1], segment_bytes=64 * 1024, checkpoint_every=1, sync_every_sec=0.05)
+seq = 0
+while True:
+    assert s.append("t", b"payload-%d-" % seq + b"x" * (seq % 200)) == seq
+    if seq >= 10:
+        s.ack(seq - 10)
+    if seq == 2000:
+        print("ready", flush=True)
+    seq += 1
+"""
+
+
+def _payload(seq):
+    return b"payload-%d-" % seq + b"x" * (seq % 200)
+
+
+@pytest.mark.skipif(sys.platform == "win32", reason="uses SIGKILL")
+def test_recovers_after_kill_mid_write(tmp_path):
+    proc = subprocess.Popen([sys.executable, "-c", _WRITER, str(tmp_path)], cwd=REPO, stdout=subprocess.PIPE)
+    try:
+        assert proc.stdout.readline().strip() == b"ready"
+        time.sleep(0.05)
+    finally:
+        proc.send_signal(signal.SIGKILL)
+        proc.wait()
+
+    s = SegmentSpool(str(tmp_path), segment_bytes=64 * 1024)
+    assert s.next_seq > 2000
+    # The checkpoint may lag the last ack by one move, never run ahead of what was appended
+    assert 10 <= s.next_seq - s.cursor <= 12
+    records = s.read(0, 1_000_000)
+    assert [seq for seq, _, _ in records] == list(range(s.cursor, s.next_seq))
+    assert all(topic == "t" and payload == _payload(seq) for seq, topic, payload in records)
+
+    seq = s.append("t", b"after")                       # appends continue after the torn tail
+    assert seq == records[-1][0] + 1
+    s.close()
+    assert SegmentSpool(str(tmp_path)).read(seq, 1) == [(seq, "t", b"after")]
+
+
+def test_torn_tail_record_is_dropped(tmp_path):
+    s = SegmentSpool(str(tmp_path), segment_bytes=4096)
+    for i in range(3):
+        s.append("t", b"r%d" % i)
+    seg = s._segments[-1]
+    end = seg.end
+    s.append("t", b"torn")
+    seg.mm[end + 4] ^= 0xFF                              # damage the crc of the last record
+    s.close()
+
+    s = SegmentSpool(str(tmp_path), segment_bytes=4096)
+    assert [p for _, _, p in s.read(0, 10)] == [b"r0", b"r1", b"r2"]
+    assert s.append("t", b"next") == 3
+
+
+def test_cursor_survives_restart(tmp_path):
+    s = SegmentSpool(str(tmp_path), segment_bytes=4096, checkpoint_every=1)
+    for i in range(50):
+        s.append("t", b"%d" % i)
+    for seq in (0, 1, 2, 4):                            # 3 is still in flight
+        s.ack(seq)
+    s.close()
+    s = SegmentSpool(str(tmp_path), segment_bytes=4096)
+    assert s.cursor == 3 and s.backlog() == 47
+
+
+def test_live_publish_is_never_replayed_while_in_flight(tmp_path):
+    conn = InMemoryConnection(auto_ack=False)
+    client = MqttClient(conn, max_in_flight=10_000)
+    client.connect()
+    saf = StoreAndForward(SegmentSpool(str(tmp_path)), client, replay_rate=0, replay_batch=1000).start()
+    try:
+        for i in range(2000):
+            saf.publish("t", b"%d" % i)
+        time.sleep(0.2)                                  # give the replayer every chance to race
+        conn.ack()
+        deadline = time.monotonic() + 5
+        while saf.spool.backlog() and time.monotonic() < deadline:
+            conn.ack()
+            time.sleep(0.01)
+    finally:
+        saf.stop()
+    payloads = [p for _, p in conn.bus.messages]
+    assert len(payloads) == len(set(payloads)) == 2000
+
+
+def test_replayer_cannot_claim_a_record_between_puback_and_ack(tmp_path):
+    """_done() must ack before the seq leaves _inflight, or the replayer publishes it a second time."""
+    claims = []
+
+    class RacingSpool(SegmentSpool):
+        def ack(self, seq):
+            # The replayer runs while the PUBACK is being handled
+            t = threading.Thread(target=lambda: claims.append(saf._claim(seq)))
+            t.start()
+            t.join(0.1)
+            super().ack(seq)
+            self.racer = t
+
+    spool = RacingSpool(str(tmp_path))
+    saf = StoreAndForward(spool, None)
+    seq = spool.append("t", b"x")
+    saf._inflight[seq] = time.monotonic()
+    saf._done(seq, ok=True)
+    spool.racer.join()
+    assert claims == [False]
@@ -0,0 +1,77 @@
+import json
+import zlib
+
+import pytest
+
+import wire
+from batch_publisher import BatchingPublisher, pack_wire_batch, split_batch
+
+RAW = {"device_id": "dev-1", "ts": 1762812000, "temperature": 21.5, "humidity": 40.25}
+CLEAN = {"device_id": "dev-1", "ts": 1762812000, "temperature_c": 21.5, "temperature_avg5_c": 21.37,
+         "humidity_pct": 40.25, "quality": "OK", "schema_version": "1.0"}
+
+
+def _raw(i):
+    return dict(RAW, ts=RAW["ts"] + i, temperature=round(20 + (i % 50) / 10, 1))
+
+
+def test_single_readings_round_trip():
+    assert wire.decode(wire.encode_raw(RAW)) == [RAW]
+    assert wire.decode(wire.encode_clean(CLEAN)) == [CLEAN]
+    assert json.loads(wire.to_json(wire.encode_raw(RAW))) == RAW
+
+
+@pytest.mark.parametrize("change", [{"temperature": 21.555}, {"ts": -1}, {"ts": 2 ** 32},
+                                    {"humidity": 700.0}, {"device_id": "x" * 256}, {"ts": True}])
+def test_unrepresentable_reading_is_left_to_json(change):
+    assert wire.encode_raw(dict(RAW, **change)) is None
+
+
+def test_batch_round_trip_and_split():
+    items = [wire.encode_raw(_raw(i)) for i in range(500)]
+    packed = wire.pack_batch(items)
+    assert packed[1] & wire.FLAG_ZLIB
+    assert wire.decode(packed) == [_raw(i) for i in range(500)]
+    assert wire.split(packed) == items
+    assert split_batch(packed) == items
+
+
+def test_batch_count_is_bounded():
+    items = [wire.encode_raw(RAW)] * (wire.MAX_BATCH_COUNT + 1)
+    with pytest.raises(ValueError):
+        wire.pack_batch(items)
+    assert len(wire.decode(wire.pack_batch(items[:wire.MAX_BATCH_COUNT]))) == wire.MAX_BATCH_COUNT
+
+
+def test_decompression_is_bounded():
+    bomb = wire._header(wire.KIND_RAW_BATCH, compressed=True) + zlib.compress(b"\0" * (wire.MAX_BODY_BYTES + 1))
+    with pytest.raises(ValueError, match="inflates"):
+        wire.decode(bomb)
+    assert wire.reading_key(bomb) is None
+    assert split_batch(bomb) == [bomb]              # left for the processor to reject
+
+
+def test_truncated_zlib_stream_is_rejected():
+    packed = wire.pack_batch([wire.encode_raw(_raw(i)) for i in range(500)])
+    with pytest.raises(wire.DECODE_ERRORS):
+        wire.decode(packed[:len(packed) // 2])
+
+
+def test_json_fallback_batches_stay_under_max_bytes():
+    """Mixed binary/JSON readings fall back to the (much bigger) JSON envelope; it must still fit."""
+    out = []
+    max_bytes = 4096
+    pub = BatchingPublisher(out.append, max_count=10_000, max_bytes=max_bytes, pack=pack_wire_batch)
+    readings = []
+    for i in range(2000):
+        r = _raw(i)
+        readings.append(r)
+        if i % 100 == 0:                             # an odd reading the binary format cannot carry
+            r = dict(r, temperature=21.555)
+            readings[-1] = r
+        pub.add(wire.encode_raw(r) or json.dumps(r).encode())
+    pub.flush()
+
+    assert out and max(map(len, out)) <= max_bytes
+    got = [wire.decode(p)[0] if wire.is_binary(p) else json.loads(p) for b in out for p in split_batch(b)]
+    assert got == readings
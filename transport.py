@@ -0,0 +1,151 @@
+"""
+transport.py
+------------
+In-memory publish transports, so the same edge pipeline can run in tests
+and benchmarks without AWS IoT Core (which is mqtt_client.MqttClient).
+
+A transport only needs:
+
+    publish(topic: str, payload: bytes) -> concurrent.futures.Future | None
+
+The future (if any) completes when the message is acknowledged
+(PUBACK for QoS1), which is what end-to-end latency is measured against.
+"""
+
+import threading
+import time
+from collections import defaultdict, deque
+from concurrent.futures import Future
+from typing import Callable, Deque, Dict, List, Optional, Tuple
+
+import numpy as np
+
+
+class InMemoryBus:
+    """
+    Stand-in for the broker: keeps every message and calls subscribers synchronously.
+
+    Subscribers use the same callback signature as awscrt:
+        callback(topic, payload, dup, qos, retain)
+    Publishes return an already-completed future (an instant PUBACK).
+    With record=False only `published` is counted (for long benchmarks).
+    """
+
+    def __init__(self, record: bool = True):
+        self.messages: List[Tuple[str, bytes]] = []
+        self.record = record
+        self.published = 0
+        self._subs: Dict[str, List[Callable]] = defaultdict(list)
+        self._lock = threading.Lock()
+
+    def subscribe(self, topic: str, callback: Callable) -> None:
+        self._subs[topic].append(callback)
+
+    def publish(self, topic: str, payload: bytes) -> Future:
+        if isinstance(payload, str):
+            payload = payload.encode("utf-8")
+        with self._lock:
+            self.published += 1
+            packet_id = self.published
+            if self.record:
+                self.messages.append((topic, payload))
+        for cb in self._subs.get(topic, ()):
+            cb(topic, payload, False, 1, False)
+        done: Future = Future()
+        done.set_result({"packet_id": packet_id})
+        return done
+
+    def on(self, topic: str) -> List[bytes]:
+        """All payloads published to `topic` so far."""
+        return [p for t, p in self.messages if t == topic]
+
+
+class InMemoryConnection:
+    """
+    Drop-in for an awscrt MqttConnection backed by an InMemoryBus, so scripts
+    that call conn.publish(topic=..., payload=..., qos=...) / conn.subscribe(...)
+    can run without a broker (benchmarks, local tests).
+
+    To stand in for a slow or flaky broker:
+        auto_ack=False      publish futures stay pending until ack(n) is called
+                            (messages are still delivered to subscribers at once)
+        connect_failures=N  the first N connect() calls fail
+    """
+
+    def __init__(self, bus: Optional[InMemoryBus] = None, auto_ack: bool = True, connect_failures: int = 0):
+        self.bus = bus if bus is not None else InMemoryBus()
+        self.auto_ack = auto_ack
+        self.connect_failures = connect_failures
+        self.unacked: Deque[Tuple[Future, int]] = deque()
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _done(result=None) -> Future:
+        f: Future = Future()
+        f.set_result(result)
+        return f
+
+    def connect(self) -> Future:
+        if self.connect_failures > 0:
+            self.connect_failures -= 1
+            f: Future = Future()
+            f.set_exception(ConnectionError("broker unavailable"))
+            return f
+        return self._done({"session_present": False})
+
+    def disconnect(self) -> Future:
+        return self._done()
+
+    def subscribe(self, topic: str, qos, callback: Callable):
+        self.bus.subscribe(topic, callback)
+        return self._done({"topic": topic, "qos": qos}), 0
+
+    def publish(self, topic: str, payload, qos, retain: bool = False):
+        future = self.bus.publish(topic, payload)
+        packet_id = future.result()["packet_id"]
+        if self.auto_ack:
+            return future, packet_id
+        pending: Future = Future()
+        with self._lock:
+            self.unacked.append((pending, packet_id))
+        return pending, packet_id
+
+    def ack(self, n: Optional[int] = None) -> int:
+        """Acknowledge the oldest `n` pending publishes (all if None). Returns how many were acked."""
+        done = 0
+        while n is None or done < n:
+            with self._lock:
+                if not self.unacked:
+                    break
+                pending, packet_id = self.unacked.popleft()
+            pending.set_result({"packet_id": packet_id})
+            done += 1
+        return done
+
+
+class LatencyRecorder:
+    """Keeps the last `size` latency samples (seconds) and reports percentiles."""
+
+    def __init__(self, size: int = 10_000):
+        self._samples: Deque[float] = deque(maxlen=size)
+        self.count = 0
+
+    def add(self, seconds: float) -> None:
+        self._samples.append(seconds)
+        self.count += 1
+
+    def since(self, start: float) -> None:
+        """Record perf_counter() - start."""
+        self.add(time.perf_counter() - start)
+
+    def percentiles(self, *qs: float) -> List[Optional[float]]:
+        if not self._samples:
+            return [None for _ in qs]
+        arr = np.fromiter(self._samples, dtype=np.float64)
+        return np.percentile(arr, qs).tolist()
+
+    def summary(self) -> str:
+        p50, p99 = self.percentiles(50, 99)
+        if p50 is None:
+            return "n=0"
+        return f"n={self.count} p50={p50 * 1e3:.2f} ms p99={p99 * 1e3:.2f} ms"
@@ -0,0 +1,300 @@
+"""
+wire.py
+-------
+Compact binary wire format for RAW and CLEAN readings (optional; JSON stays the default).
+
+On cellular-backhauled sites the JSON key names dominate every message.
+A binary payload is recognised by its first byte, so JSON and binary can
+share a topic and every consumer accepts both:
+
+    byte 0   MAGIC (0xB5) - can never start a JSON document
+    byte 1   bit 7   body is zlib-compressed (batches only)
+             bits 4-6 wire version (1; CLEAN schema_version "1.0")
+             bits 0-3 kind: 1 RAW, 2 CLEAN, 3 RAW batch, 4 CLEAN batch
+
+    RAW record     u8 len + device_id (UTF-8) | u32 ts | i16 temperature*100 | u16 humidity*100
+    CLEAN record   u8 len + device_id (UTF-8) | u32 ts | i16 temperature_c*100 | i16 temperature_avg5_c*100
+                   | u16 humidity_pct*100 | u8 quality (0 WARMUP, 1 OK)
+    batch body     u16 count | records...              (then zlib, if that is smaller)
+
+Values are carried as scaled integers (0.01 resolution). The encoders return
+None for anything they cannot carry exactly (more decimals, out of range,
+odd types), and the caller sends that reading as JSON instead. Decoding
+therefore always gives back the same values that were encoded.
+"""
+
+import json
+import struct
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+
+MAGIC = 0xB5
+MAGIC_BYTE = bytes([MAGIC])
+WIRE_VERSION = 1
+FLAG_ZLIB = 0x80
+
+KIND_RAW = 1
+KIND_CLEAN = 2
+KIND_RAW_BATCH = 3
+KIND_CLEAN_BATCH = 4
+_BATCH_OF = {KIND_RAW: KIND_RAW_BATCH, KIND_CLEAN: KIND_CLEAN_BATCH}
+_SINGLE_OF = {KIND_RAW_BATCH: KIND_RAW, KIND_CLEAN_BATCH: KIND_CLEAN}
+
+_RAW = struct.Struct(">IhH")
+_CLEAN = struct.Struct(">IhhHB")
+_COUNT = struct.Struct(">H")
+_TS = struct.Struct(">I")
+_QUALITY = ("WARMUP", "OK")
+
+MAX_BATCH_COUNT = 0xFFFF                 # the u16 count
+MAX_BODY_BYTES = 4 * 1024 * 1024         # a 128 KB message of readings inflates to far less
+
+# What decoding a damaged / foreign binary payload can raise
+DECODE_ERRORS = (ValueError, IndexError, struct.error, zlib.error)
+
+
+def _header(kind: int, compressed: bool = False) -> bytes:
+    return bytes([MAGIC, (FLAG_ZLIB if compressed else 0) | (WIRE_VERSION << 4) | kind])
+
+
+_HDR_RAW = _header(KIND_RAW)
+_HDR_CLEAN = _header(KIND_CLEAN)
+
+
+def is_binary(payload: bytes) -> bool:
+    return payload[:1] == MAGIC_BYTE
+
+
+def is_batch(payload: bytes) -> bool:
+    """Cheap check (header only) for a binary batch."""
+    return len(payload) > 1 and payload[0] == MAGIC and (payload[1] & 0x0F) in _SINGLE_OF
+
+
+def _kind(payload: bytes) -> Tuple[int, bool]:
+    if len(payload) < 2 or payload[0] != MAGIC:
+        raise ValueError("not a binary wire payload")
+    flags = payload[1]
+    version = (flags >> 4) & 0x7
+    if version != WIRE_VERSION:
+        raise ValueError(f"unsupported wire version {version}")
+    return flags & 0x0F, bool(flags & FLAG_ZLIB)
+
+
+# =============================================================================
+# Encoding
+# =============================================================================
+def _scaled(value: Any, lo: int, hi: int) -> Optional[int]:
+    """value*100 as an int if that round-trips exactly and fits [lo, hi], else None."""
+    if type(value) not in (float, int):
+        return None
+    i = round(value * 100)
+    if i / 100 != value or not lo <= i <= hi:
+        return None
+    return i
+
+
+def _device(device_id: Any) -> Optional[bytes]:
+    if not isinstance(device_id, str):
+        return None
+    b = device_id.encode("utf-8")
+    return bytes([len(b)]) + b if len(b) <= 255 else None
+
+
+def _ts(ts: Any) -> Optional[int]:
+    return ts if type(ts) is int and 0 <= ts <= 0xFFFFFFFF else None
+
+
+def encode_raw(reading: Dict[str, Any]) -> Optional[bytes]:
+    """Binary RAW payload for {"device_id", "ts", "temperature", "humidity"}, or None (send JSON)."""
+    dev = _device(reading.get("device_id"))
+    ts = _ts(reading.get("ts"))
+    t = _scaled(reading.get("temperature"), -32768, 32767)
+    h = _scaled(reading.get("humidity"), 0, 65535)
+    if dev is None or ts is None or t is None or h is None or len(reading) != 4:
+        return None
+    return _HDR_RAW + dev + _RAW.pack(ts, t, h)
+
+
+def encode_clean(doc: Dict[str, Any]) -> Optional[bytes]:
+    """Binary CLEAN payload for a SensorOut dict, or None (send JSON)."""
+    if doc.get("schema_version") != "1.0" or doc.get("quality") not in _QUALITY:
+        return None
+    dev = _device(doc.get("device_id"))
+    ts = _ts(doc.get("ts"))
+    t = _scaled(doc.get("temperature_c"), -32768, 32767)
+    a = _scaled(doc.get("temperature_avg5_c"), -32768, 32767)
+    h = _scaled(doc.get("humidity_pct"), 0, 65535)
+    if dev is None or ts is None or t is None or a is None or h is None:
+        return None
+    return _HDR_CLEAN + dev + _CLEAN.pack(ts, t, a, h, _QUALITY.index(doc["quality"]))
+
+
+def pack_batch(items: List[bytes], compress: bool = True) -> Optional[bytes]:
+    """
+    One binary batch from single binary readings of one kind (zlib'd when that
+    is smaller), or None if `items` mixes kinds or holds JSON.
+    Raises ValueError for more than MAX_BATCH_COUNT items.
+    """
+    if len(items) > MAX_BATCH_COUNT:
+        raise ValueError(f"a wire batch holds at most {MAX_BATCH_COUNT} readings, got {len(items)}")
+    flags = {it[1] if len(it) > 2 and it[0] == MAGIC else None for it in items}
+    if len(flags) != 1 or None in flags:
+        return None
+    kind, _ = _kind(items[0])
+    if kind not in _BATCH_OF:
+        return None
+    body = _COUNT.pack(len(items)) + b"".join(it[2:] for it in items)
+    if compress:
+        packed = zlib.compress(body, 6)
+        if len(packed) < len(body):
+            return _header(_BATCH_OF[kind], compressed=True) + packed
+    return _header(_BATCH_OF[kind]) + body
+
+
+# =============================================================================
+# Decoding
+# =============================================================================
+def _records(body: bytes, kind: int) -> Iterator[Tuple[int, int]]:
+    """(start, end) of every record in a batch body."""
+    size = _RAW.size if kind == KIND_RAW else _CLEAN.size
+    (count,) = _COUNT.unpack_from(body, 0)
+    pos = _COUNT.size
+    for _ in range(count):
+        end = pos + 1 + body[pos] + size
+        if end > len(body):
+            raise ValueError("truncated wire batch")
+        yield pos, end
+        pos = end
+
+
+def _body(payload: bytes) -> Tuple[int, bytes]:
+    kind, compressed = _kind(payload)
+    body = payload[2:]
+    if compressed:
+        # Bounded: a small hostile payload must not inflate to gigabytes
+        d = zlib.decompressobj()
+        body = d.decompress(body, MAX_BODY_BYTES)
+        if d.unconsumed_tail:
+            raise ValueError(f"wire batch inflates past {MAX_BODY_BYTES} bytes")
+        if not d.eof:
+            raise ValueError("truncated zlib stream in wire batch")
+    return kind, body
+
+
+def decode_raw_fields(payload: bytes) -> Tuple[str, int, float, float]:
+    """(device_id, ts, temperature, humidity) of a single binary RAW payload (the process_bytes fast path)."""
+    n = len(payload) - 3 - _RAW.size
+    if payload[1] != _HDR_RAW[1] or payload[2] != n:
+        raise ValueError("not a single binary RAW reading")
+    ts, t, h = _RAW.unpack_from(payload, 3 + n)
+    return payload[3:3 + n].decode("utf-8"), ts, t / 100, h / 100
+
+
+def _decode_record(body: bytes, start: int, kind: int) -> Dict[str, Any]:
+    n = body[start]
+    device_id = body[start + 1:start + 1 + n].decode("utf-8")
+    if kind == KIND_RAW:
+        ts, t, h = _RAW.unpack_from(body, start + 1 + n)
+        return {"device_id": device_id, "ts": ts, "temperature": t / 100, "humidity": h / 100}
+    ts, t, a, h, q = _CLEAN.unpack_from(body, start + 1 + n)
+    return {"device_id": device_id, "ts": ts, "temperature_c": t / 100, "temperature_avg5_c": a / 100,
+            "humidity_pct": h / 100, "quality": _QUALITY[q], "schema_version": "1.0"}
+
+
+def decode(payload: bytes) -> List[Dict[str, Any]]:
+    """Every reading in a binary payload as the equivalent JSON dict (RAW or CLEAN field names)."""
+    kind, body = _body(payload)
+    if kind in _BATCH_OF:
+        size = _RAW.size if kind == KIND_RAW else _CLEAN.size
+        if not body or len(body) != 1 + body[0] + size:
+            raise ValueError("bad wire payload length")
+        return [_decode_record(body, 0, kind)]
+    if kind not in _SINGLE_OF:
+        raise ValueError(f"unknown wire kind {kind}")
+    kind = _SINGLE_OF[kind]
+    out, end = [], _COUNT.size
+    for start, end in _records(body, kind):
+        out.append(_decode_record(body, start, kind))
+    if end != len(body):
+        raise ValueError("trailing bytes in wire batch")
+    return out
+
+
+def to_json(payload: bytes) -> bytes:
+    """A single binary reading as the JSON bytes the JSON publisher / process_bytes would have sent."""
+    (doc,) = decode(payload)
+    return json.dumps(doc).encode("utf-8")
+
+
+def split(payload: bytes) -> List[bytes]:
+    """A binary batch as single-reading binary payloads (a single reading is returned as-is)."""
+    kind, body = _body(payload)
+    if kind not in _SINGLE_OF:
+        return [payload]
+    single = _SINGLE_OF[kind]
+    hdr = _header(single)
+    return [hdr + body[s:e] for s, e in _records(body, single)]
+
+
+def reading_key(payload: bytes) -> Optional[Tuple[bytes, int]]:
+    """(device_id bytes, ts) of the first reading, as dedup.reading_key gives for JSON; None if unreadable."""
+    try:
+        kind, body = _body(payload)
+        if kind in _SINGLE_OF:
+            if not _COUNT.unpack_from(body, 0)[0]:
+                return None
+            body = body[_COUNT.size:]
+        elif kind not in _BATCH_OF:
+            return None
+        n = body[0]
+        return body[1:1 + n], _TS.unpack_from(body, 1 + n)[0]
+    except DECODE_ERRORS:
+        return None
+
+
+# =============================================================================
+# Size / speed check:  python wire.py [--messages N] [--devices N]
+# =============================================================================
+def _bench() -> None:
+    import argparse
+    import timeit
+
+    from batch_publisher import pack_json_batch, pack_wire_batch
+    from loadgen import generate
+    from models_and_processor import SensorIn, WindowStore, process_bytes
+
+    ap = argparse.ArgumentParser(description="JSON vs compact binary: payload size and decode time")
+    ap.add_argument("--messages", type=int, default=20_000)
+    ap.add_argument("--devices", type=int, default=50)
+    ap.add_argument("--batch", type=int, default=100)
+    args = ap.parse_args()
+
+    raw_json = [p for kind, p in generate(args.messages, args.devices) if kind == "valid"]
+    raw_bin = [encode_raw(json.loads(p)) for p in raw_json]
+    store = WindowStore()
+    clean_json = [process_bytes(p, store)[1] for p in raw_json]
+    clean_bin = [encode_clean(json.loads(p)) for p in clean_json]
+    k = args.batch
+
+    def row(name, js, bs):
+        j, b = sum(map(len, js)), sum(map(len, bs))
+        print(f"{name:<22} json={j / len(js):8.1f} B   binary={b / len(bs):7.1f} B   {j / b:5.1f}x smaller")
+
+    row("RAW reading", raw_json, raw_bin)
+    row("CLEAN reading", clean_json, clean_bin)
+    row(f"RAW batch of {k}", [pack_json_batch(raw_json[i:i + k]) for i in range(0, len(raw_json), k)],
+        [pack_wire_batch(raw_bin[i:i + k]) for i in range(0, len(raw_bin), k)])
+    row(f"CLEAN batch of {k}", [pack_json_batch(clean_json[i:i + k]) for i in range(0, len(clean_json), k)],
+        [pack_wire_batch(clean_bin[i:i + k]) for i in range(0, len(clean_bin), k)])
+
+    n = min(len(raw_json), 10_000)
+
+    def per_msg(fn, payloads):
+        return min(timeit.repeat(lambda: [fn(p) for p in payloads[:n]], number=1, repeat=5)) / n * 1e6
+
+    print(f"decode RAW: SensorIn.model_validate_json {per_msg(SensorIn.model_validate_json, raw_json):.2f} µs   "
+          f"decode_raw_fields {per_msg(decode_raw_fields, raw_bin):.2f} µs   decode {per_msg(decode, raw_bin):.2f} µs")
+
+
+if __name__ == "__main__":
+    _bench()